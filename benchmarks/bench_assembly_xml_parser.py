@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Benchmark parsing of a large synthetic ENA assembly search response
+
+Compares the incremental pull parser used by AssemblyScanner with the
+previous approach (regex over an accumulated string, then ElementTree and a
+second regex per assembly), reporting records/sec for each.
+
+usage: python benchmarks/bench_assembly_xml_parser.py [n_assemblies]
+"""
+
+import re
+import sys
+import time
+from xml.etree import ElementTree
+from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_xml_parser \
+    import iter_assembly_records
+
+ASSEMBLY_TEMPLATE = """<ASSEMBLY accession="GCA_{n:09d}.1" alias="asm{n}">
+  <IDENTIFIERS><PRIMARY_ID>GCA_{n:09d}.1</PRIMARY_ID></IDENTIFIERS>
+  <TITLE>Synthetic assembly {n}</TITLE>
+  <DESCRIPTION>Synthetic assembly used for benchmarking the scanner</DESCRIPTION>
+  <ASSEMBLY_LINKS>
+    <ASSEMBLY_LINK>
+      <URL_LINK>
+        <LABEL>WGS_SET_FASTA</LABEL>
+        <URL>ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/AB{n:06d}.fasta.gz</URL>
+      </URL_LINK>
+    </ASSEMBLY_LINK>
+    <ASSEMBLY_LINK>
+      <URL_LINK>
+        <LABEL>WGS_SET_FLATFILE</LABEL>
+        <URL>ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/AB{n:06d}.dat.gz</URL>
+      </URL_LINK>
+    </ASSEMBLY_LINK>
+  </ASSEMBLY_LINKS>
+</ASSEMBLY>
+"""
+
+def synthetic_response(n_assemblies):
+    body = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<ROOT>\n" \
+        + "".join([ASSEMBLY_TEMPLATE.format(n=n) for n in range(n_assemblies)]) \
+        + "</ROOT>\n"
+    return body.encode()
+
+def chunked(body, chunk_size):
+    for i in range(0, len(body), chunk_size):
+        yield body[i:i + chunk_size]
+
+def legacy_records(chunks):
+    aggregate_chunk_string = ""
+    for chunk in chunks:
+        aggregate_chunk_string += chunk.decode()
+        assembly_pattern = re.compile("<ASSEMBLY.+?</ASSEMBLY>", re.DOTALL)
+        final_end_position = 0
+        for match in assembly_pattern.finditer(aggregate_chunk_string):
+            final_end_position = match.end()
+            assembly_xml = match.group(0)
+            root = ElementTree.fromstring(assembly_xml)
+            accession = re.compile(
+                'accession=\"(.+?)\"').search(assembly_xml).group(1)
+            url = None
+            for url_link in root.iter("URL_LINK"):
+                if url_link.find("LABEL").text == "WGS_SET_FLATFILE":
+                    url = url_link.find("URL").text
+            if accession and url:
+                yield [accession, url]
+        aggregate_chunk_string = aggregate_chunk_string[final_end_position:]
+
+def run(name, parse, body, chunk_size):
+    start = time.perf_counter()
+    n_records = sum(1 for r in parse(chunked(body, chunk_size)))
+    elapsed = time.perf_counter() - start
+    print("{:<8} chunk={:<6} {:>8} records {:>8.2f}s {:>12.0f} records/s"
+        .format(name, chunk_size, n_records, elapsed, n_records / elapsed))
+    return n_records
+
+def main():
+    n_assemblies = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    body = synthetic_response(n_assemblies)
+    print("synthetic response: {} assemblies, {:.1f} MB".format(n_assemblies,
+        len(body) / 1e6))
+    for chunk_size in [8192, 65536]:
+        run("legacy", legacy_records, body, chunk_size)
+        run("pull", iter_assembly_records, body, chunk_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Benchmark processing of a synthetic EMBL flatfile
+
+Processes a synthetic WGS set flatfile (plain and gzipped) with the native
+FlatfileProcessor, with 1 worker and with one worker per CPU, reporting
+records/sec and MB/sec of sequence. If the path
+to ena-refget-processor's script is given, the same flatfiles are processed
+with it for comparison.
+
+usage: python benchmarks/bench_flatfile_processor.py [n_records]
+    [record_length] [perl_script]
+"""
+
+import gzip
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_processor \
+    import FlatfileProcessor
+
+HEADER_TEMPLATE = """ID   ABCD01{n:06d}; SV 1; linear; genomic DNA; WGS; MAM; {length} BP.
+XX
+AC   ABCD01{n:06d};
+XX
+DE   Synthetic organism contig_{n}, whole genome shotgun sequence.
+XX
+OS   Synthetic organism
+OC   Eukaryota; Synthetic.
+XX
+DR   BioSample; SAMEA0000001.
+XX
+FH   Key             Location/Qualifiers
+FT   source          1..{length}
+FT                   /organism="Synthetic organism"
+FT                   /mol_type="genomic DNA"
+FT                   /db_xref="taxon:32644"
+XX
+SQ   Sequence {length} BP; 0 A; 0 C; 0 G; 0 T; 0 other;
+"""
+
+def synthetic_flatfile(file_path, n_records, record_length):
+    # records are slices of a random pool, so that sequences differ without
+    # generating each base
+    rng = random.Random(0)
+    pool = "".join(rng.choice("acgt") for i in range(record_length * 2))
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, "wt") as output_file:
+        for n in range(n_records):
+            output_file.write(HEADER_TEMPLATE.format(n=n, length=record_length))
+            offset = rng.randrange(record_length)
+            seq = pool[offset:offset + record_length]
+            for start in range(0, record_length, 60):
+                line = seq[start:start + 60]
+                blocks = [line[i:i + 10] for i in range(0, len(line), 10)]
+                output_file.write("     {:<66}{:>9}\n".format(" ".join(blocks),
+                    start + len(line)))
+            output_file.write("//\n")
+
+def run(name, process, file_path, n_records, n_bases):
+    start = time.perf_counter()
+    process(file_path)
+    elapsed = time.perf_counter() - start
+    print("{:<10} {:<18} {:>8} records {:>8.2f}s {:>10.0f} records/s "
+        "{:>8.1f} MB/s".format(name, os.path.basename(file_path), n_records,
+        elapsed, n_records / elapsed, n_bases / elapsed / 1e6))
+
+def main():
+    n_records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    record_length = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    perl_script = sys.argv[3] if len(sys.argv) > 3 else None
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        for filename in ["synthetic.dat", "synthetic.dat.gz"]:
+            file_path = os.path.join(work_dir, filename)
+            synthetic_flatfile(file_path, n_records, record_length)
+
+            def native(file_path, workers=1):
+                store_path = os.path.join(work_dir, "native")
+                shutil.rmtree(store_path, ignore_errors=True)
+                FlatfileProcessor(store_path, "bench",
+                    workers=workers).process(file_path)
+
+            def perl(file_path):
+                store_path = os.path.join(work_dir, "perl")
+                shutil.rmtree(store_path, ignore_errors=True)
+                os.makedirs(store_path)
+                subprocess.check_call([perl_script, "--store-path", store_path,
+                    "--file-path", file_path, "--process-id", "bench"])
+
+            run("native-1", native, file_path, n_records,
+                n_records * record_length)
+            run("native-{}".format(os.cpu_count()),
+                lambda f: native(f, workers=os.cpu_count()), file_path,
+                n_records, n_records * record_length)
+            if perl_script:
+                run("perl", perl, file_path, n_records,
+                    n_records * record_length)
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Benchmark overlapped decompression of a synthetic gzipped flatfile
+
+Reads a synthetic gzipped WGS set flatfile with gzip.open and with
+OverlappedGzipReader, then processes it with the native FlatfileProcessor
+with and without overlap, reporting MB/sec of decompressed flatfile.
+
+usage: python benchmarks/bench_flatfile_reader.py [n_records]
+    [record_length]
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+from bench_flatfile_processor import synthetic_flatfile
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_processor \
+    import FlatfileProcessor, open_flatfile
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_reader \
+    import INFLATE_IMPLEMENTATION
+
+def read_all(file_path, overlap):
+    with open_flatfile(file_path, overlap=overlap) as flatfile:
+        for record in FlatfileProcessor("", "").iter_raw_records(flatfile):
+            pass
+
+def run(name, process, file_path, n_bytes):
+    start = time.perf_counter()
+    process(file_path)
+    elapsed = time.perf_counter() - start
+    print("{:<22} {:>8.2f}s {:>8.1f} MB/s".format(name, elapsed,
+        n_bytes / elapsed / 1e6))
+
+def main():
+    n_records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    record_length = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        file_path = os.path.join(work_dir, "synthetic.dat.gz")
+        synthetic_flatfile(file_path, n_records, record_length)
+        with gzip.open(file_path, "rb") as flatfile:
+            n_bytes = sum(len(b) for b in iter(lambda: flatfile.read(1 << 22),
+                b""))
+        print("inflate: {}, {:.1f} MB decompressed".format(
+            INFLATE_IMPLEMENTATION, n_bytes / 1e6))
+
+        def process(file_path, overlap):
+            store_path = os.path.join(work_dir, "native")
+            shutil.rmtree(store_path, ignore_errors=True)
+            FlatfileProcessor(store_path, "bench",
+                overlap=overlap).process(file_path)
+
+        run("split, serial", lambda f: read_all(f, False), file_path, n_bytes)
+        run("split, overlapped", lambda f: read_all(f, True), file_path,
+            n_bytes)
+        run("process, serial", lambda f: process(f, False), file_path,
+            n_bytes)
+        run("process, overlapped", lambda f: process(f, True), file_path,
+            n_bytes)
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Benchmark manifest generation from a synthetic pair of processed CSVs
+
+Joins a synthetic loader and full CSV pair with the streaming join used by
+the manifest subcommand, and with the previous approach (both CSVs loaded
+into dicts keyed by trunc512), reporting rows/sec and the growth in peak
+memory (max RSS) of each. The streaming join is run first, as max RSS only
+grows. Species names contain no commas, which the previous approach could not
+parse.
+
+usage: python benchmarks/bench_manifest_join.py [n_rows]
+"""
+
+import hashlib
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from ga4gh.refget.loader.manifest.writer import ManifestWriter
+from ga4gh.refget.loader.sources.ena.assembly.utils.processed_csv import \
+    iter_processed_rows
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_processor \
+    import FULL_COLUMNS, LOADER_COLUMNS
+
+def synthetic_csvs(loader_csv_path, full_csv_path, n_rows):
+    with open(loader_csv_path, "w") as loader_file, \
+        open(full_csv_path, "w") as full_file:
+        loader_file.write(",".join(LOADER_COLUMNS) + "\n")
+        full_file.write(",".join(FULL_COLUMNS) + "\n")
+        for n in range(n_rows):
+            sha512 = hashlib.sha512(str(n).encode()).hexdigest()
+            trunc512 = sha512[:48]
+            md5 = sha512[48:80]
+            path = "/scratch/files/AB/AB000001/sequence/{}/{}".format(
+                trunc512[:2], trunc512)
+            loader_file.write(",".join(["2020-01-01T00:00:00", "1", trunc512,
+                md5, path, path + ".json"]) + "\n")
+            full_file.write(",".join(["SQ." + trunc512[:32], trunc512, md5,
+                "50000", sha512, trunc512[:32],
+                "ABCD01{:06d}.1".format(n), "WGS",
+                "Synthetic organism", "SAMEA0000001", "32644"])
+                + "\n")
+
+def streaming_join(loader_csv_path, full_csv_path, manifest_path):
+    writer = ManifestWriter(manifest_path, "source.json", "destination.json",
+        flush=False)
+    writer.write_seq_header()
+    for row in iter_processed_rows(loader_csv_path, full_csv_path):
+        writer.write_seq_entry(row)
+    writer.close()
+
+def legacy_join(loader_csv_path, full_csv_path, manifest_path):
+    def load_csv(csv_path):
+        csv_dict = {}
+        columns = []
+        parse_header = True
+        for line in open(csv_path, "r"):
+            ls = line.rstrip().split(",")
+            if parse_header:
+                columns = ls
+                parse_header = False
+            else:
+                subdict = {columns[i]: ls[i] for i in range(0, len(ls))}
+                csv_dict[subdict["trunc512"]] = subdict
+        return csv_dict
+
+    full_csv_dict = load_csv(full_csv_path)
+    loader_csv_dict = load_csv(loader_csv_path)
+    output_lines = []
+    for trunc512 in loader_csv_dict.keys():
+        loader_csv_subdict = loader_csv_dict[trunc512]
+        full_csv_subdict = full_csv_dict[trunc512]
+        output_lines.append("\t".join([
+            loader_csv_subdict["completed"],
+            loader_csv_subdict["seq_path"],
+            loader_csv_subdict["json_path"],
+            full_csv_subdict["ga4gh"],
+            loader_csv_subdict["trunc512"],
+            loader_csv_subdict["md5"],
+        ]))
+    open(manifest_path, "w").write("\n".join(output_lines) + "\n")
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run(name, join, loader_csv_path, full_csv_path, manifest_path, n_rows):
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    join(loader_csv_path, full_csv_path, manifest_path)
+    elapsed = time.perf_counter() - start
+    print("{:<10} {:>8} rows {:>8.2f}s {:>10.0f} rows/s {:>8.1f} MB peak "
+        "growth".format(name, n_rows, elapsed, n_rows / elapsed,
+        max_rss_mb() - rss_before))
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        loader_csv_path = os.path.join(work_dir, "bench.loader.csv")
+        full_csv_path = os.path.join(work_dir, "bench.full.csv")
+        manifest_path = os.path.join(work_dir, "bench.manifest.csv")
+        synthetic_csvs(loader_csv_path, full_csv_path, n_rows)
+        run("streaming", streaming_join, loader_csv_path, full_csv_path,
+            manifest_path, n_rows)
+        run("legacy", legacy_join, loader_csv_path, full_csv_path,
+            manifest_path, n_rows)
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
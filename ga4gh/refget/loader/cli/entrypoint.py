@@ -2,7 +2,10 @@
 """Main entrypoint into the program"""
 
 import click
+from ga4gh.refget.loader.cli.methods.index import index
 from ga4gh.refget.loader.cli.methods.load import load
+from ga4gh.refget.loader.cli.methods.reconcile import reconcile
+from ga4gh.refget.loader.cli.methods.status import status
 from ga4gh.refget.loader.cli.methods.subcommands import subcommands
 from ga4gh.refget.loader.cli.methods.upload import upload
 # from ga4gh.refget.ena.cli.methods.checkpoint import checkpoint
@@ -13,7 +16,10 @@ from ga4gh.refget.loader.cli.methods.upload import upload
 def main():
     """process sequences into refget format and upload to cloud storage"""
 
+main.add_command(index)
 main.add_command(load)
+main.add_command(reconcile)
+main.add_command(status)
 main.add_command(subcommands)
 main.add_command(upload)
 # main.add_command(checkpoint)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Click group and subcommands to manage the uploaded digest index"""
+
+import click
+import json
+from ga4gh.refget.loader.config.constants import Status
+from ga4gh.refget.loader.config.methods import METHODS
+from ga4gh.refget.loader.validation.validator import validate_destination
+
+@click.group()
+def index():
+    """manage the index of digests already uploaded to a destination"""
+
+@index.command()
+@click.option("-d", "--destination",
+    help="JSON file describing cloud resource destination")
+def rebuild(**kwargs):
+    """add all digests present in the destination to its digest index"""
+
+    try:
+        if not kwargs["destination"]:
+            raise Exception("destination (-d) JSON file required")
+
+        result = validate_destination(kwargs["destination"])
+        if result["status"] != Status.SUCCESS:
+            raise Exception(result["message"])
+
+        destination_obj = json.load(open(kwargs["destination"]))
+        rebuild_method = METHODS["rebuild_index"][destination_obj["type"]]
+        n_digests = rebuild_method(destination_obj)
+        print("indexed {} digests".format(n_digests))
+
+    except Exception as e:
+        print(e)
@@ -10,6 +10,13 @@ from ga4gh.refget.loader.validation.validator import \
     help="JSON file describing reference sequence source")
 @click.option("-d", "--destination",
     help="JSON file describing cloud resource destination")
+@click.option("--plan", is_flag=True,
+    help="report the flatfiles, input bytes, estimated sequences, S3 PUTs "
+    + "and wall time of the load, based on earlier runs, without "
+    + "processing anything")
+@click.option("--concurrency", type=int,
+    help="number of concurrent jobs to project wall time for, with --plan "
+    + "(default: local_concurrency, or CPUs)")
 def load(**kwargs):
     """process and load to cloud storage"""
 
@@ -29,6 +36,11 @@ def load(**kwargs):
                 raise Exception(result["message"])
         
         source_obj = json.load(open(kwargs["source"]))
+        if kwargs["plan"]:
+            planning_method = METHODS["planning"][source_obj["type"]]
+            planning_method(source_obj, kwargs["source"],
+                kwargs["destination"], concurrency=kwargs["concurrency"])
+            return
         processing_method = METHODS["processing"][source_obj["type"]]
         processing_method(source_obj, kwargs["source"], kwargs["destination"])
 
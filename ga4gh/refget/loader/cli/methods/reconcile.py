@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Reconcile click command, finds manifest objects missing from destination"""
+
+import click
+import glob
+import json
+import os
+from ga4gh.refget.loader.config.methods import METHODS
+from ga4gh.refget.loader.manifest.reader import ManifestReader
+
+@click.command()
+@click.argument("manifests", nargs=-1)
+@click.option("-p", "--processing-dir", multiple=True,
+    help="date processing directory, all manifests beneath it are included")
+@click.option("--upload", is_flag=True, default=False,
+    help="upload missing and size-mismatched objects")
+def reconcile(**kwargs):
+    """compare manifests with destination contents, list missing objects"""
+
+    try:
+        manifest_paths = list(kwargs["manifests"])
+        for processing_dir in kwargs["processing_dir"]:
+            manifest_paths += sorted(glob.glob(os.path.join(processing_dir,
+                "files", "*", "*", "logs", "*.manifest.csv")))
+        if not manifest_paths:
+            raise Exception("at least one manifest or processing dir (-p) "
+                + "required")
+
+        # manifests are reconciled together for each destination config
+        # named in their header
+        manifests_by_destination = {}
+        for manifest_path in manifest_paths:
+            reader = ManifestReader(manifest_path)
+            manifests_by_destination.setdefault(reader.destination_config, []) \
+                .append(manifest_path)
+            reader.close()
+
+        for destination_config in sorted(manifests_by_destination.keys()):
+            destination_obj = json.load(open(destination_config, "r"))
+            reconcile_method = METHODS["reconcile"][destination_obj["type"]]
+            summary = reconcile_method(destination_obj,
+                manifests_by_destination[destination_config],
+                upload=kwargs["upload"])
+
+            message = ("{}: {} expected objects, {} missing, {} size "
+                + "mismatched").format(destination_config,
+                    summary["n_expected"], summary["n_missing"],
+                    summary["n_mismatched"])
+            if "upload" in summary:
+                message += ", {} uploaded, {} failed".format(
+                    summary["upload"]["n_uploaded"],
+                    summary["upload"]["n_failed"])
+            print(message)
+
+    except Exception as e:
+        print(e)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Status click command, summarizes job statuses from the status store"""
+
+import click
+import json
+import os
+from ga4gh.refget.loader.config.constants import Status
+from ga4gh.refget.loader.store.status_store import StatusStore
+from ga4gh.refget.loader.validation.validator import validate_source
+
+@click.command()
+@click.option("-s", "--source",
+    help="JSON file describing reference sequence source")
+@click.option("--db", help="path to status database, instead of the one "
+    + "described by the source")
+@click.option("--date", help="only summarize jobs of this YYYY-MM-DD date")
+@click.option("--failures", is_flag=True,
+    help="list failed jobs by error message, most common first")
+def status(**kwargs):
+    """summarize job statuses by date, state and error message"""
+
+    try:
+        db_path = kwargs["db"]
+        if not db_path:
+            if not kwargs["source"]:
+                raise Exception("source (-s) JSON file or status database "
+                    + "(--db) required")
+            result = validate_source(kwargs["source"])
+            if result["status"] != Status.SUCCESS:
+                raise Exception(result["message"])
+            source_obj = json.load(open(kwargs["source"]))
+            db_path = StatusStore.get_path(source_obj)
+
+        if not os.path.exists(db_path):
+            raise Exception("status database not found: " + db_path)
+
+        status_store = StatusStore(db_path)
+        if kwargs["failures"]:
+            print("\t".join(["count", "stage", "message"]))
+            for message, stage, n in status_store.failures(kwargs["date"]):
+                print("\t".join([str(n), str(stage), str(message)]))
+        else:
+            print("\t".join(["date", "status", "stage", "count"]))
+            for date, state, stage, n in status_store.summarize(kwargs["date"]):
+                print("\t".join([str(date), state, str(stage), str(n)]))
+        status_store.close()
+
+    except Exception as e:
+        print(e)
@@ -1,9 +1,12 @@
 import click
 from ga4gh.refget.loader.cli.methods.subcommands.ena.assembly.manifest \
     import manifest
+from ga4gh.refget.loader.cli.methods.subcommands.ena.assembly.process \
+    import process
 
 @click.group()
 def assembly():
     "ena assembly-related internal commands for batch jobs"
 
 assembly.add_command(manifest)
+assembly.add_command(process)
@@ -1,73 +1,90 @@
 import click
+import glob
+import os
+import sys
+import time
+from ga4gh.refget.loader.manifest.shards import ShardedManifestWriter
+from ga4gh.refget.loader.manifest.writer import ManifestWriter
+from ga4gh.refget.loader.sources.ena.assembly.utils.processed_csv import \
+    iter_processed_rows
+from ga4gh.refget.loader.store.status_store import StatusStore
 
 @click.command()
 @click.argument("processing_dir")
 @click.argument("file_id")
 @click.argument("source_config")
 @click.argument("destination_config")
+@click.option("--shards", type=int, default=1,
+    help="also split the manifest into this many shards, balanced by bytes, "
+    + "to be uploaded by parallel tasks")
 def manifest(**kwargs):
     "generate an upload manifest from processed ENA flatfile"
 
-    def load_csv(csv_path):
-        csv_dict = {}
-        columns = []
-        parse_header = True
-        for line in open(csv_path, "r"):
-            ls = line.rstrip().split(",")
-            if parse_header:
-                columns = ls
-                parse_header = False
-            else:
-                subdict = {columns[i]: ls[i] for i in range(0, len(ls))}
-                csv_dict[subdict["trunc512"]] = subdict
-
-        return csv_dict
-
     processing_dir = kwargs["processing_dir"]
     file_id = kwargs["file_id"]
     logs_dir = processing_dir + "/logs"
     full_csv_path = logs_dir + "/" + file_id + ".full.csv"
     loader_csv_path = logs_dir + "/" + file_id + ".loader.csv"
-    full_csv_dict = load_csv(full_csv_path)
-    loader_csv_dict = load_csv(loader_csv_path)
-
     output_manifest_path = logs_dir + "/" + file_id + ".manifest.csv"
-    output_content_template = \
-        "# Refget loader manifest\n" \
-        + "# source config: {}\n" \
-        + "# destination config: {}\n" \
-        + "{}\n" \
-        + "{}\n"
-    output_header = [
-        "completed", "seq", "metadata", "primary_id", "trunc512_id", "md5_id"
-    ]
-    output_lines = []
 
-    for trunc512 in loader_csv_dict.keys():
-        loader_csv_subdict = loader_csv_dict[trunc512]
-        full_csv_subdict = full_csv_dict[trunc512]
-        output_lines.append("\t".join([
-            loader_csv_subdict["completed"],
-            loader_csv_subdict["seq_path"],
-            loader_csv_subdict["json_path"],
-            full_csv_subdict["ga4gh"],
-            loader_csv_subdict["trunc512"],
-            loader_csv_subdict["md5"],
-        ]))
+    # the job's status is recorded in the source's status store, a failure
+    # to read the processed csvs fails the job
+    job = StatusStore.get_job_key(output_manifest_path)
+    status_store = StatusStore.from_config_file(kwargs["source_config"])
+    if status_store:
+        status_store.update(job, {"stage": "manifest", "status": "InProgress",
+            "message": "None"})
 
-    # add additional lines for uploading the .full.csv
-    output_lines.append("# additional uploads")
-    output_lines.append("\t".join(["source", "destination"]))
-    output_lines.append("\t".join([
-        full_csv_path,
-        "metadata/csv/" + file_id + ".full.csv"
-    ]))
+    # the processed csvs are joined as they are streamed, and the manifest
+    # (and its shards) are moved into place only once complete
+    tmp_suffix = ".tmp"
+    writer = None
+    n_sequences = 0
+    start = time.time()
+    try:
+        if kwargs["shards"] > 1:
+            if status_store:
+                status_store.clear_shards(job)
+            writer = ShardedManifestWriter(output_manifest_path,
+                kwargs["source_config"], kwargs["destination_config"],
+                kwargs["shards"], tmp_suffix=tmp_suffix)
+            manifest_paths = writer.get_paths()
+        else:
+            writer = ManifestWriter(output_manifest_path + tmp_suffix,
+                kwargs["source_config"], kwargs["destination_config"],
+                flush=False)
+            manifest_paths = [output_manifest_path]
+        writer.write_seq_header()
+        for row in iter_processed_rows(loader_csv_path, full_csv_path):
+            writer.write_seq_entry(row)
+            n_sequences += 1
 
-    output_content = output_content_template.format(
-        kwargs["source_config"],
-        kwargs["destination_config"],
-        "\t".join(output_header),
-        "\n".join(output_lines)
-    )
-    
-    open(output_manifest_path, "w").write(output_content)
+        # add additional lines for uploading the .full.csv
+        writer.write_additional_header()
+        writer.write_additional_entry(full_csv_path,
+            "metadata/csv/" + file_id + ".full.csv")
+        writer.close()
+        for manifest_path in manifest_paths:
+            os.replace(manifest_path + tmp_suffix, manifest_path)
+    except Exception as e:
+        if writer:
+            writer.close()
+            # manifests renamed before the failure have no temporary file
+            for manifest_path in manifest_paths:
+                if os.path.exists(manifest_path + tmp_suffix):
+                    os.remove(manifest_path + tmp_suffix)
+        if status_store:
+            status_store.update(job, {"status": "Failed",
+                "message": "processed csv could not be read: " + str(e)})
+            status_store.close()
+        print(e)
+        sys.exit(1)
+    if status_store:
+        # sequences per input byte are recorded for planning later runs,
+        # the flatfile is linked into the processing dir by the scheduler
+        flatfiles = glob.glob(os.path.join(processing_dir, file_id + ".dat*"))
+        if flatfiles:
+            status_store.record_metrics(job, "manifest",
+                input_bytes=os.path.getsize(flatfiles[0]),
+                sequences=n_sequences, seconds=time.time() - start)
+        status_store.close()
@@ -0,0 +1,169 @@
+import click
+import json
+import os
+import sys
+import time
+from ga4gh.refget.loader.config.methods import METHODS
+from ga4gh.refget.loader.manifest.journal import UploadJournal
+from ga4gh.refget.loader.manifest.writer import ManifestWriter
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_processor \
+    import FlatfileProcessor
+from ga4gh.refget.loader.sources.ena.assembly.utils.staging_manager import \
+    is_cleanup_enabled, remove_staged_outputs
+from ga4gh.refget.loader.store.content_store import ContentStore
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+@click.command()
+@click.option("--store-path", required=True,
+    help="directory to write sequences, metadata, and csvs")
+@click.option("--file-path", required=True,
+    help="path to .dat or .dat.gz flatfile")
+@click.option("--process-id", required=True,
+    help="unique id of the flatfile, names the output csvs")
+@click.option("--workers", type=int,
+    help="number of checksum and write worker threads (default: CPUs, up to 8)")
+@click.option("--overlap/--no-overlap", default=True,
+    help="decompress gzipped flatfiles in a separate thread (default: on)")
+@click.option("--content-store",
+    help="shared directory to stage sequences in by digest, each sequence is "
+    + "written once")
+@click.option("--upload", is_flag=True,
+    help="upload each sequence as it is processed, writing the upload "
+    + "manifest as a journal, instead of leaving it to later jobs")
+@click.option("--source-config",
+    help="JSON file describing reference sequence source, required with "
+    + "--upload, otherwise only used to record throughput")
+@click.option("--destination-config",
+    help="JSON file describing upload destination, with --upload")
+def process(**kwargs):
+    "process an ENA flatfile into refget sequences and metadata"
+
+    content_store = None
+    if kwargs["content_store"]:
+        content_store = ContentStore(kwargs["content_store"])
+    processor = FlatfileProcessor(kwargs["store_path"], kwargs["process_id"],
+        workers=kwargs["workers"], overlap=kwargs["overlap"],
+        content_store=content_store)
+    if kwargs["upload"]:
+        process_and_upload(processor, kwargs)
+        return
+
+    start = time.time()
+    try:
+        processor.process(kwargs["file_path"])
+    except Exception as e:
+        print("processing failed: " + str(e))
+        sys.exit(1)
+    print_processed(processor)
+
+    # the processing rate is recorded for planning later runs
+    status_store = None
+    if kwargs["source_config"]:
+        status_store = StatusStore.from_config_file(kwargs["source_config"])
+    if status_store:
+        record_metrics(status_store, processor, kwargs, "process",
+            time.time() - start)
+        status_store.close()
+
+def record_metrics(status_store, processor, kwargs, stage, seconds,
+    objects=0):
+    """record the work done processing a flatfile, and how long it took"""
+
+    manifest = os.path.join(processor.logs_dir,
+        kwargs["process_id"] + ".manifest.csv")
+    status_store.record_metrics(StatusStore.get_job_key(manifest), stage,
+        input_bytes=os.path.getsize(kwargs["file_path"]),
+        sequences=processor.n_records, objects=objects, seconds=seconds)
+
+def print_processed(processor):
+    print(("processed {} sequences ({} bases, {} already staged), skipped {} "
+        + "records without a sequence").format(processor.n_records,
+        processor.n_bases, processor.n_deduplicated, processor.n_skipped))
+
+def process_and_upload(processor, kwargs):
+    """process a flatfile, uploading each sequence as soon as it is written
+
+    Processed records are turned into manifest entries and streamed straight
+    to the destination's upload method, which uploads them while later
+    records are processed. Each entry is also appended to the manifest, and
+    each uploaded object to the manifest's upload journal, so an interrupted
+    run can be resumed, or its manifest uploaded again with the upload
+    command. The job's status is recorded as it moves from processing to
+    uploading.
+    """
+
+    if not kwargs["source_config"] or not kwargs["destination_config"]:
+        print("--source-config and --destination-config are required with "
+            + "--upload")
+        sys.exit(1)
+
+    destination_obj = json.load(open(kwargs["destination_config"], "r"))
+    upload_method = METHODS["upload"][destination_obj["type"]]
+    if not os.path.exists(processor.logs_dir):
+        os.makedirs(processor.logs_dir, exist_ok=True)
+    manifest = os.path.join(processor.logs_dir,
+        kwargs["process_id"] + ".manifest.csv")
+    writer = ManifestWriter(manifest, kwargs["source_config"],
+        kwargs["destination_config"])
+    journal = UploadJournal.for_manifest(manifest)
+
+    job = StatusStore.get_job_key(manifest)
+    status_store = StatusStore.from_config_file(kwargs["source_config"])
+    if status_store:
+        status_store.update(job, {"stage": "process", "status": "InProgress",
+            "message": "None"})
+
+    def seq_table():
+        yield writer.write_seq_header()
+        for row in processor.iter_process(kwargs["file_path"]):
+            yield writer.write_seq_entry(row)
+
+    def additional_table():
+        # the seq table has been consumed, so the full csv is complete
+        if status_store:
+            status_store.update(job, {"stage": "upload",
+                "status": "InProgress"})
+        yield writer.write_additional_header()
+        yield writer.write_additional_entry(processor.full_csv,
+            "metadata/csv/" + kwargs["process_id"] + ".full.csv")
+
+    start = time.time()
+    try:
+        summary = upload_method(destination_obj, seq_table(),
+            additional_table(), journal=journal)
+    except Exception as e:
+        if status_store:
+            status_store.update(job, {"status": "Failed", "message": str(e)})
+            status_store.close()
+        print("processing failed: " + str(e))
+        sys.exit(1)
+    finally:
+        journal.close()
+        writer.close()
+
+    print_processed(processor)
+    for failure in summary["failures"]:
+        print("upload failed: {}: {}".format(failure["key"],
+            failure["message"]))
+    print(("uploaded {} of {} objects, skipped {} completed by a previous "
+        + "run, skipped {} already in the destination digest index").format(
+            summary["n_uploaded"], summary["n_uploaded"] + summary["n_failed"],
+            journal.n_skipped, summary.get("n_indexed", 0)))
+    if status_store:
+        # processing and upload overlap, so they are recorded as one stage
+        record_metrics(status_store, processor, kwargs, "fused",
+            time.time() - start,
+            objects=summary["n_uploaded"] + summary["n_failed"])
+        if summary["n_failed"] > 0:
+            status_store.update(job, {"status": "Failed",
+                "message": "{} objects failed to upload".format(
+                    summary["n_failed"])})
+        else:
+            status_store.update(job, {"status": "Completed",
+                "message": "None"})
+            if is_cleanup_enabled(kwargs["source_config"]):
+                print("removed {} bytes of staged outputs".format(
+                    remove_staged_outputs(manifest)))
+        status_store.close()
+    if summary["n_failed"] > 0:
+        sys.exit(1)
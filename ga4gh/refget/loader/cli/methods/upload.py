@@ -3,7 +3,15 @@
 
 import click
 import json
+import sys
+import time
 from ga4gh.refget.loader.config.methods import METHODS
+from ga4gh.refget.loader.manifest.journal import UploadJournal
+from ga4gh.refget.loader.manifest.reader import ManifestReader
+from ga4gh.refget.loader.manifest.shards import get_shard_path
+from ga4gh.refget.loader.sources.ena.assembly.utils.staging_manager import \
+    is_cleanup_enabled, remove_staged_outputs
+from ga4gh.refget.loader.store.status_store import StatusStore
 # from ga4gh.refget.ena.utils.uploader import Uploader
 
 # @click.command()
@@ -17,36 +25,101 @@ from ga4gh.refget.loader.config.methods import METHODS
 
 @click.command()
 @click.argument("manifest")
+@click.option("--resume/--force", default=True,
+    help="skip objects recorded in the manifest's upload journal by a "
+        + "previous run (default), or re-upload all objects")
+@click.option("--shards", type=int, default=1,
+    help="number of shards the manifest was split into")
+@click.option("--shard", type=int,
+    help="upload only this shard (from 1) of the manifest, the job's status "
+        + "is rolled up once all shards have been uploaded")
 def upload(**kwargs):
     "upload sequences and metadata according to file manifest"
 
-    def parse_manifest(manifest_path):
+    manifest = kwargs["manifest"]
+    shard = kwargs["shard"]
+    upload_manifest = manifest
+    if shard:
+        if shard < 1 or shard > kwargs["shards"]:
+            print("shard must be between 1 and {}".format(kwargs["shards"]))
+            sys.exit(1)
+        upload_manifest = get_shard_path(manifest, shard)
+    reader = ManifestReader(upload_manifest)
+    destination_obj = json.load(open(reader.destination_config, "r"))
+    destination_type = destination_obj["type"]
+    upload_method = METHODS["upload"][destination_type]
 
-        manifest_file = open(manifest_path, "r")
-        manifest_file.readline()
-        source_config = manifest_file.readline().split(":")[1].strip()
-        destination_config = manifest_file.readline().split(":")[1].strip()
+    # the job's status is recorded in the status store of the manifest's
+    # source, if it has one
+    job = StatusStore.get_job_key(manifest)
+    status_store = StatusStore.from_config_file(reader.source_config)
+    if status_store:
+        status_store.update(job, {"stage": "upload", "status": "InProgress",
+            "message": "None"})
 
-        seq_table = []
-        additional_table = []
-        add_to_seq_table = True
+    # manifest tables are streamed to the upload method, which begins
+    # uploading as soon as the first entry is read
+    journal = UploadJournal.for_manifest(upload_manifest,
+        resume=kwargs["resume"])
+    start = time.time()
+    try:
+        summary = upload_method(destination_obj, reader.seq_table(),
+            reader.additional_table(), journal=journal)
+    except Exception as e:
+        if status_store:
+            update_status(status_store, job, shard, kwargs["shards"],
+                "Failed", str(e))
+            status_store.close()
+        raise
+    finally:
+        journal.close()
+        reader.close()
 
-        for line in manifest_file.readlines():
-            if line.startswith("# additional uploads"):
-                add_to_seq_table = False
-            else:
-                if add_to_seq_table:
-                    seq_table.append(line)
-                else:
-                    additional_table.append(line)
-                
-        return [source_config, destination_config, seq_table, additional_table]
+    # report every failed object, and exit non-zero so that the batch job
+    # is recorded as failed
+    for failure in summary["failures"]:
+        print("upload failed: {}: {}".format(failure["key"],
+            failure["message"]))
+    print(("uploaded {} of {} objects, skipped {} completed by a previous "
+        + "run, skipped {} already in the destination digest index").format(
+            summary["n_uploaded"], summary["n_uploaded"] + summary["n_failed"],
+            journal.n_skipped, summary.get("n_indexed", 0)))
+    if status_store:
+        # the upload rate is recorded for planning later runs
+        n_objects = summary["n_uploaded"] + summary["n_failed"]
+        if n_objects > 0:
+            status_store.record_metrics(job, "upload", shard=shard,
+                objects=n_objects, seconds=time.time() - start)
+        if summary["n_failed"] > 0:
+            update_status(status_store, job, shard, kwargs["shards"],
+                "Failed", "{} objects failed to upload".format(
+                    summary["n_failed"]))
+        else:
+            status = update_status(status_store, job, shard, kwargs["shards"],
+                "Completed", "None")
+            # once every object has been uploaded, the staged sequences and
+            # metadata are no longer needed
+            if status == "Completed" \
+                and is_cleanup_enabled(reader.source_config):
+                print("removed {} bytes of staged outputs".format(
+                    remove_staged_outputs(manifest)))
+        status_store.close()
+    if summary["n_failed"] > 0:
+        sys.exit(1)
 
-    manifest = kwargs["manifest"]
-    source_config, destination_config, seq_table, additional_table = \
-        parse_manifest(manifest)
-    
-    destination_obj = json.load(open(destination_config, "r"))
-    destination_type = destination_obj["type"]
-    upload_method = METHODS["upload"][destination_type]
-    upload_method(destination_obj, seq_table, additional_table)
+def update_status(status_store, job, shard, n_shards, status, message):
+    """record the final status of an upload, or of one shard of an upload
+
+    The status of a sharded upload is only recorded for the job once every
+    shard has finished, by whichever shard finishes last, and the job's
+    status is returned once recorded, otherwise None.
+    """
+
+    if shard:
+        rolled_up = status_store.update_shard(job, shard, n_shards, status,
+            message)
+        if rolled_up is None:
+            return None
+        status, message = rolled_up
+    status_store.update(job, {"status": status, "message": message})
+    return status
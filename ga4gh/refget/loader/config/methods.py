@@ -1,12 +1,27 @@
+from ga4gh.refget.loader.sources.ena.assembly.plan import \
+    ena_assembly_plan
 from ga4gh.refget.loader.sources.ena.assembly.process import \
     ena_assembly_process
+from ga4gh.refget.loader.destinations.aws.s3.listing import \
+    aws_s3_rebuild_index
+from ga4gh.refget.loader.destinations.aws.s3.reconcile import \
+    aws_s3_reconcile
 from ga4gh.refget.loader.destinations.aws.s3.upload import aws_s3_upload
 
 METHODS = {
     "processing": {
         "ena_assembly": ena_assembly_process
     },
+    "planning": {
+        "ena_assembly": ena_assembly_plan
+    },
     "upload": {
         "aws_s3": aws_s3_upload
+    },
+    "rebuild_index": {
+        "aws_s3": aws_s3_rebuild_index
+    },
+    "reconcile": {
+        "aws_s3": aws_s3_reconcile
     }
 }
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""Defines S3UploadEngine class, uploads objects over a pooled S3 client"""
+
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from ga4gh.refget.loader.config.constants import Status
+from ga4gh.refget.loader.destinations.aws.s3.multipart import \
+    MultipartUploader
+from ga4gh.refget.loader.destinations.aws.s3.scheduler import UploadScheduler
+
+class S3UploadEngine(object):
+    """Uploads objects to an S3 bucket from a pool of worker threads
+
+    S3UploadEngine holds a single, long-lived S3 client for the lifetime of
+    an upload run. The client's connection pool keeps TCP/TLS connections
+    alive between requests, and is sized to match the number of worker
+    threads, so each in-flight PUT reuses an open connection rather than
+    paying for a new process and handshake per object.
+
+    Each upload task is a dictionary with a "key" (S3 object key), and either
+    a "file_path" (local file uploaded as the object body) or a "redirect"
+    (empty object with a website redirect location). Each task produces a
+    result dictionary reporting the key, status, message, ETag and size.
+
+    Files larger than the multipart threshold are uploaded as a multipart
+    upload, with their parts sent in parallel on a separate part executor, so
+    that a large sequence does not occupy a single connection serially.
+
+    Every request is sent through an UploadScheduler, which retries failed
+    requests with backoff and adapts the number of in-flight requests to
+    throttling responses from the bucket. max_concurrency is the upper bound
+    on in-flight requests, shared by whole objects and multipart parts.
+
+    :param config_obj: destination config, as validated by aws_s3.json schema
+    :type config_obj: dict
+    :param bucket_name: name of S3 bucket that will receive objects
+    :type bucket_name: str
+    :param max_concurrency: maximum number of in-flight requests
+    :type max_concurrency: int
+    :param max_attempts: maximum number of attempts for each request
+    :type max_attempts: int
+    :param queue_size: maximum number of tasks queued ahead of the workers
+    :type queue_size: int
+    :param multipart_threshold: files of this size (bytes) or larger are
+        uploaded as multipart uploads
+    :type multipart_threshold: int
+    :param multipart_chunksize: size (bytes) of each part
+    :type multipart_chunksize: int
+    :param multipart_concurrency: maximum number of in-flight part uploads
+    :type multipart_concurrency: int
+    :param acl: canned ACL applied to every uploaded object
+    :type acl: str
+    :param client: S3 client shared by all worker threads
+    :type client: class:`botocore.client.S3`
+    :param scheduler: paces and retries every request
+    :type scheduler: class:`UploadScheduler`
+    :param part_executor: executor for parts of multipart uploads
+    :type part_executor: class:`concurrent.futures.ThreadPoolExecutor`
+    :param multipart_uploader: uploads files above the multipart threshold
+    :type multipart_uploader: class:`MultipartUploader`
+    """
+
+    DEFAULT_MAX_CONCURRENCY = 16
+    DEFAULT_MAX_ATTEMPTS = 8
+    DEFAULT_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+    DEFAULT_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+    DEFAULT_MULTIPART_CONCURRENCY = 8
+
+    def __init__(self, config_obj):
+        """Constructor method"""
+
+        self.config_obj = config_obj
+        self.bucket_name = config_obj["bucket_name"]
+        self.max_concurrency = config_obj.get("max_concurrency",
+            self.DEFAULT_MAX_CONCURRENCY)
+        self.max_attempts = config_obj.get("max_attempts",
+            self.DEFAULT_MAX_ATTEMPTS)
+        self.queue_size = self.max_concurrency * 4
+        self.multipart_threshold = config_obj.get("multipart_threshold",
+            self.DEFAULT_MULTIPART_THRESHOLD)
+        self.multipart_chunksize = config_obj.get("multipart_chunksize",
+            self.DEFAULT_MULTIPART_CHUNKSIZE)
+        self.multipart_concurrency = config_obj.get("multipart_concurrency",
+            self.DEFAULT_MULTIPART_CONCURRENCY)
+        self.acl = "public-read"
+        self.client = self.__initialize_client()
+        self.scheduler = UploadScheduler(self.max_concurrency,
+            max_attempts=self.max_attempts)
+        self.part_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.multipart_concurrency)
+        self.multipart_uploader = MultipartUploader(self.client,
+            self.scheduler, self.part_executor, self.bucket_name, self.acl,
+            self.multipart_chunksize)
+
+    def put_object(self, task):
+        """Upload a single object described by an upload task
+
+        :param task: upload task, "key" and one of "file_path" or "redirect"
+        :type task: dict[str, str]
+        :return: upload result for the task
+        :rtype: dict
+        """
+
+        result = {
+            "key": task["key"],
+            "status": Status.SUCCESS,
+            "message": "",
+            "etag": "",
+            "size": 0
+        }
+
+        try:
+            params = {
+                "Bucket": self.bucket_name,
+                "Key": task["key"],
+                "ACL": self.acl
+            }
+            if task.get("redirect"):
+                params["WebsiteRedirectLocation"] = task["redirect"]
+                response = self.scheduler.call(self.client.put_object,
+                    **params)
+            else:
+                result["size"] = os.path.getsize(task["file_path"])
+                if result["size"] >= self.multipart_threshold:
+                    response = self.multipart_uploader.upload(task["key"],
+                        task["file_path"])
+                else:
+                    response = self.scheduler.call(self.put_file, task,
+                        params)
+            result["etag"] = response["ETag"].strip('"')
+
+        except (BotoCoreError, ClientError, OSError) as e:
+            result["status"] = Status.FAILURE
+            result["message"] = str(e)
+            logging.error("{} - upload failed: {}".format(task["key"], str(e)))
+
+        return result
+
+    def put_file(self, task, params):
+        """Upload a local file as the body of a single PUT request
+
+        The file is re-opened on each call, so that a retried request sends
+        the body from the start.
+
+        :param task: upload task, with "key" and "file_path"
+        :type task: dict[str, str]
+        :param params: put_object request parameters, excluding body
+        :type params: dict[str, str]
+        :return: put_object response
+        :rtype: dict
+        """
+
+        with open(task["file_path"], "rb") as body:
+            return self.client.put_object(Body=body, **params)
+
+    def upload_all(self, tasks, callback=None):
+        """Upload all objects described by an iterable of upload tasks
+
+        Tasks are pulled from the iterable by the calling thread, and placed
+        on a bounded queue consumed by the worker threads. When the queue is
+        full, the caller blocks until a worker frees a slot, so a lazily
+        generated iterable (e.g. a streamed manifest) is only read as fast as
+        objects are uploaded, and memory use is independent of task count.
+
+        Only failed results are retained in the returned summary, successful
+        results are passed to the callback and then discarded.
+
+        :param tasks: upload tasks
+        :type tasks: iterable[dict[str, str]]
+        :param callback: called with each task and its result as the upload
+            completes, from the worker thread that performed the upload
+        :type callback: function, optional
+        :return: number of uploaded and failed objects, failed results
+        :rtype: dict
+        """
+
+        summary = {"n_uploaded": 0, "n_failed": 0, "failures": []}
+        summary_lock = threading.Lock()
+        task_queue = queue.Queue(maxsize=self.queue_size)
+
+        def record(result):
+            with summary_lock:
+                if result["status"] == Status.SUCCESS:
+                    summary["n_uploaded"] += 1
+                else:
+                    summary["n_failed"] += 1
+                    summary["failures"].append(result)
+
+        # any error in a task (including its callback) fails that task only,
+        # a worker never exits before its sentinel, so the producer's puts
+        # to the bounded queue cannot block on a queue nobody consumes
+        def worker():
+            while True:
+                task = task_queue.get()
+                if task is None:
+                    break
+                try:
+                    result = self.put_object(task)
+                except Exception as e:
+                    result = self.__get_failure(task, e)
+                    logging.error("{} - upload failed: {}".format(
+                        task.get("key"), str(e)))
+                try:
+                    if callback:
+                        callback(task, result)
+                except Exception as e:
+                    logging.error("{} - upload callback failed: {}".format(
+                        task.get("key"), str(e)))
+                    if result["status"] == Status.SUCCESS:
+                        result = self.__get_failure(task, e)
+                record(result)
+
+        workers = [threading.Thread(target=worker, daemon=True)
+            for i in range(0, self.max_concurrency)]
+        for w in workers:
+            w.start()
+
+        # a sentinel is sent to each worker once all tasks are queued, or if
+        # the task iterable raises, so that workers always exit
+        try:
+            for task in tasks:
+                task_queue.put(task)
+        finally:
+            for w in workers:
+                task_queue.put(None)
+            for w in workers:
+                w.join()
+
+        return summary
+
+    def close(self):
+        """Shut down the multipart part executor"""
+
+        self.part_executor.shutdown()
+
+    def __get_failure(self, task, error):
+        """Get the failed result of a task that raised an unexpected error
+
+        :param task: upload task
+        :type task: dict[str, str]
+        :param error: error raised by the upload or its callback
+        :type error: Exception
+        :return: upload result for the task
+        :rtype: dict
+        """
+
+        return {
+            "key": task.get("key"),
+            "status": Status.FAILURE,
+            "message": str(error),
+            "etag": "",
+            "size": 0
+        }
+
+    def __initialize_client(self):
+        """Create the S3 client shared by all worker threads
+
+        Retries are made by the scheduler, so the client's own retries are
+        disabled.
+
+        :return: S3 client, with a connection for every object and part worker
+        :rtype: class:`botocore.client.S3`
+        """
+
+        session = boto3.session.Session(
+            profile_name=self.config_obj.get("profile"))
+        client_config = Config(
+            max_pool_connections=self.max_concurrency \
+                + self.multipart_concurrency,
+            tcp_keepalive=True,
+            retries={"total_max_attempts": 1}
+        )
+        return session.client(
+            "s3",
+            endpoint_url=self.config_obj.get("endpoint_url"),
+            config=client_config
+        )
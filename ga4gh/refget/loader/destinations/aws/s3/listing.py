@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Bulk listing of S3 objects, and rebuild of the uploaded digest index"""
+
+from ga4gh.refget.loader.destinations.aws.s3.engine import S3UploadEngine
+from ga4gh.refget.loader.store.digest_index import DigestIndex
+
+SEQUENCE_PREFIX = "sequence/"
+METADATA_PREFIX = "metadata/json/"
+METADATA_SUFFIX = ".json"
+
+def get_destination_id(config_obj):
+    """Get a string uniquely identifying an S3 destination
+
+    :param config_obj: destination config, as validated by aws_s3.json schema
+    :type config_obj: dict
+    :return: destination id, e.g. s3://bucket_name
+    :rtype: str
+    """
+
+    return config_obj.get("endpoint_url", "") + "s3://" \
+        + config_obj["bucket_name"]
+
+def list_objects(engine, prefix):
+    """Generator function, yields all objects under a prefix in key order
+
+    Objects are listed with paginated ListObjectsV2 requests, each returning up
+    to 1000 keys, rather than checking each object individually.
+
+    :param engine: upload engine providing the S3 client and scheduler
+    :type engine: class:`S3UploadEngine`
+    :param prefix: key prefix
+    :type prefix: str
+
+    Yields:
+        (list): object key, and size in bytes
+    """
+
+    params = {"Bucket": engine.bucket_name, "Prefix": prefix}
+    while True:
+        response = engine.scheduler.call(engine.client.list_objects_v2,
+            **params)
+        for obj in response.get("Contents", []):
+            yield [obj["Key"], obj["Size"]]
+        if not response.get("IsTruncated"):
+            break
+        params["ContinuationToken"] = response["NextContinuationToken"]
+
+def list_uploaded_digests(engine):
+    """Generator function, yields digests with both sequence and metadata
+
+    The sequence and metadata listings are both in key order, and are merged
+    so that neither needs to be held in memory.
+
+    :param engine: upload engine providing the S3 client and scheduler
+    :type engine: class:`S3UploadEngine`
+
+    Yields:
+        (str): digest with both a sequence and a metadata object
+    """
+
+    def digests(prefix, suffix):
+        for key, size in list_objects(engine, prefix):
+            if key.endswith(suffix):
+                yield key[len(prefix):len(key) - len(suffix)]
+
+    seq_iter = digests(SEQUENCE_PREFIX, "")
+    metadata_iter = digests(METADATA_PREFIX, METADATA_SUFFIX)
+    seq_digest = next(seq_iter, None)
+    metadata_digest = next(metadata_iter, None)
+    while seq_digest is not None and metadata_digest is not None:
+        if seq_digest == metadata_digest:
+            yield seq_digest
+            seq_digest = next(seq_iter, None)
+            metadata_digest = next(metadata_iter, None)
+        elif seq_digest < metadata_digest:
+            seq_digest = next(seq_iter, None)
+        else:
+            metadata_digest = next(metadata_iter, None)
+
+def aws_s3_rebuild_index(config_obj):
+    """Add every digest present in an S3 bucket to the uploaded digest index
+
+    :param config_obj: destination config, as validated by aws_s3.json schema
+    :type config_obj: dict
+    :return: number of digests found in the bucket
+    :rtype: int
+    """
+
+    if not config_obj.get("digest_index"):
+        raise Exception("destination config has no 'digest_index' property")
+
+    engine = S3UploadEngine(config_obj)
+    index = DigestIndex(config_obj["digest_index"],
+        get_destination_id(config_obj))
+    n_digests = 0
+    batch = []
+    try:
+        for digest in list_uploaded_digests(engine):
+            n_digests += 1
+            batch.append(digest)
+            if len(batch) >= index.FLUSH_SIZE:
+                index.add(batch)
+                batch = []
+        index.add(batch)
+    finally:
+        index.close()
+        engine.close()
+    return n_digests
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Defines MultipartUploader class, uploads large files to S3 in parts"""
+
+import concurrent.futures
+import logging
+import os
+
+class MultipartUploader(object):
+    """Uploads a single large file to S3 as parts sent in parallel
+
+    The file is divided into fixed size parts, which are read and uploaded
+    concurrently on a shared executor. Each request, including each part, is
+    retried independently by the scheduler, so a transient failure only
+    re-sends that part rather than the whole object. If any part exhausts
+    its attempts, the parts not yet started are cancelled, and the multipart
+    upload is aborted once those in flight have finished, so that no
+    orphaned parts are left stored in the bucket.
+
+    :param client: S3 client
+    :type client: class:`botocore.client.S3`
+    :param scheduler: paces and retries every request
+    :type scheduler: class:`UploadScheduler`
+    :param executor: executor that part uploads are submitted to
+    :type executor: class:`concurrent.futures.Executor`
+    :param bucket_name: name of S3 bucket that will receive objects
+    :type bucket_name: str
+    :param acl: canned ACL applied to the completed object
+    :type acl: str
+    :param chunksize: size (bytes) of each part, other than the last
+    :type chunksize: int
+    """
+
+    # S3 limits on multipart uploads
+    MIN_CHUNKSIZE = 5 * 1024 * 1024
+    MAX_PARTS = 10000
+
+    def __init__(self, client, scheduler, executor, bucket_name, acl,
+        chunksize):
+        """Constructor method"""
+
+        self.client = client
+        self.scheduler = scheduler
+        self.executor = executor
+        self.bucket_name = bucket_name
+        self.acl = acl
+        self.chunksize = max(chunksize, self.MIN_CHUNKSIZE)
+
+    def upload(self, key, file_path):
+        """Upload a file to the specified key as a multipart upload
+
+        :param key: S3 object key
+        :type key: str
+        :param file_path: path to local file
+        :type file_path: str
+        :return: response of the complete multipart upload request
+        :rtype: dict
+        """
+
+        size = os.path.getsize(file_path)
+        chunksize = self.get_chunksize(size)
+        upload_id = self.scheduler.call(self.client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=key,
+            ACL=self.acl
+        )["UploadId"]
+
+        futures = []
+        try:
+            part_number = 1
+            for offset in range(0, size, chunksize):
+                futures.append(self.executor.submit(self.upload_part, key,
+                    file_path, upload_id, part_number, offset,
+                    min(chunksize, size - offset)))
+                part_number += 1
+            parts = [f.result() for f in futures]
+
+            return self.scheduler.call(self.client.complete_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+
+        except Exception:
+            # parts still uploading would be stored after an abort, so
+            # pending parts are cancelled and running parts waited on first.
+            # A failed abort is logged, the original error is raised
+            for f in futures:
+                f.cancel()
+            concurrent.futures.wait(futures)
+            try:
+                self.scheduler.call(self.client.abort_multipart_upload,
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    UploadId=upload_id
+                )
+            except Exception as e:
+                logging.error("{} - abort multipart upload failed: {}".format(
+                    key, str(e)))
+            raise
+
+    def upload_part(self, key, file_path, upload_id, part_number, offset,
+        length):
+        """Upload a single part, retrying it on failure
+
+        :param key: S3 object key
+        :type key: str
+        :param file_path: path to local file
+        :type file_path: str
+        :param upload_id: id of the multipart upload
+        :type upload_id: str
+        :param part_number: 1-based part number
+        :type part_number: int
+        :param offset: byte offset of the part in the file
+        :type offset: int
+        :param length: size (bytes) of the part
+        :type length: int
+        :return: part number and ETag, as required to complete the upload
+        :rtype: dict
+        """
+
+        with open(file_path, "rb") as body:
+            body.seek(offset)
+            data = body.read(length)
+
+        response = self.scheduler.call(self.client.upload_part,
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def get_chunksize(self, size):
+        """Get part size for a file, within the S3 maximum number of parts
+
+        :param size: size (bytes) of the file
+        :type size: int
+        :return: part size (bytes)
+        :rtype: int
+        """
+
+        chunksize = self.chunksize
+        while size > chunksize * self.MAX_PARTS:
+            chunksize *= 2
+        return chunksize
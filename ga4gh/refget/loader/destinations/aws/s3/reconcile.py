@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Compare manifests with S3 bucket contents, re-upload missing objects"""
+
+import concurrent.futures
+import os
+from botocore.exceptions import ClientError
+from ga4gh.refget.loader.destinations.aws.s3.engine import S3UploadEngine
+from ga4gh.refget.loader.destinations.aws.s3.listing import list_objects
+from ga4gh.refget.loader.destinations.aws.s3.upload import \
+    manifest_entry_tasks, additional_entry_tasks
+from ga4gh.refget.loader.manifest.reader import ManifestReader
+
+# expected keys are grouped by their directory and the leading characters of
+# their digest, each group is listed or, if small, checked object by object
+GA4GH_TAG = "SQ."
+LIST_PREFIX_CHARS = 2
+HEAD_THRESHOLD = 100
+MISSING_ERROR_CODES = set(["404", "NoSuchKey", "NotFound"])
+
+def load_expected_objects(manifest_paths):
+    """Load the upload tasks of all manifests, keyed by object key
+
+    :param manifest_paths: paths to upload manifests
+    :type manifest_paths: list[str]
+    :return: object key -> upload task
+    :rtype: dict[str, dict]
+    """
+
+    expected = {}
+    for manifest_path in manifest_paths:
+        reader = ManifestReader(manifest_path)
+        for table, entry_tasks in [
+            [reader.seq_table(), manifest_entry_tasks],
+            [reader.additional_table(), additional_entry_tasks]
+        ]:
+            header = True
+            for line in table:
+                if header:
+                    header = False
+                else:
+                    for task in entry_tasks(line):
+                        expected[task["key"]] = task
+        reader.close()
+    return expected
+
+def get_expected_size(task):
+    """Get the expected size of the object uploaded by a task
+
+    :param task: upload task, "key" and one of "file_path" or "redirect"
+    :type task: dict[str, str]
+    :return: size (bytes), or None if the local file no longer exists
+    :rtype: int
+    """
+
+    if task.get("redirect"):
+        return 0
+    try:
+        return os.path.getsize(task["file_path"])
+    except OSError:
+        return None
+
+def get_list_prefix(key):
+    """Get the prefix under which an object is listed with its neighbours
+
+    :param key: object key, e.g. sequence/SQ.abc
+    :type key: str
+    :return: key directory, plus the leading characters of the object name
+        after any SQ. tag, e.g. sequence/SQ.ab
+    :rtype: str
+    """
+
+    directory, name = key.rsplit("/", 1)
+    n_chars = LIST_PREFIX_CHARS
+    if name.startswith(GA4GH_TAG):
+        n_chars += len(GA4GH_TAG)
+    return directory + "/" + name[:n_chars]
+
+def head_object(engine, key):
+    """Get the size of a single object
+
+    :param engine: upload engine providing the S3 client and scheduler
+    :type engine: class:`S3UploadEngine`
+    :param key: object key
+    :type key: str
+    :return: object key, and size in bytes, or None if it does not exist
+    :rtype: list
+    """
+
+    try:
+        response = engine.scheduler.call(engine.client.head_object,
+            Bucket=engine.bucket_name, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in MISSING_ERROR_CODES:
+            return [key, None]
+        raise
+    return [key, response["ContentLength"]]
+
+def find_objects(engine, keys):
+    """Generator function, yields the objects that exist among the given keys
+
+    Keys are grouped by list prefix. Groups of at least HEAD_THRESHOLD keys
+    are listed in bulk, as one listing request covers up to 1000 objects,
+    while smaller groups are checked with concurrent HEAD requests, so that
+    a few keys never cause a whole busy prefix to be listed.
+
+    :param engine: upload engine providing the S3 client and scheduler
+    :type engine: class:`S3UploadEngine`
+    :param keys: object keys
+    :type keys: iterable[str]
+
+    Yields:
+        (list): object key, and size in bytes, possibly of objects listed
+            alongside the given keys
+    """
+
+    groups = {}
+    for key in keys:
+        groups.setdefault(get_list_prefix(key), []).append(key)
+
+    head_keys = []
+    for list_prefix in sorted(groups.keys()):
+        if len(groups[list_prefix]) >= HEAD_THRESHOLD:
+            for key, size in list_objects(engine, list_prefix):
+                yield [key, size]
+        else:
+            head_keys += groups[list_prefix]
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=engine.max_concurrency) as executor:
+        for key, size in executor.map(lambda k: head_object(engine, k),
+            head_keys):
+            if size is not None:
+                yield [key, size]
+
+def aws_s3_reconcile(config_obj, manifest_paths, upload=False, out=print):
+    """Find objects referenced by manifests that are missing from the bucket
+
+    Only the objects near the expected keys are requested (see
+    find_objects), rather than every object under sequence/ and
+    metadata/json/, which may hold far more objects than the manifests.
+    Objects that are absent, or whose size differs from the local file, are
+    reported, and optionally uploaded again.
+
+    :param config_obj: destination config, as validated by aws_s3.json schema
+    :type config_obj: dict
+    :param manifest_paths: paths to upload manifests
+    :type manifest_paths: list[str]
+    :param upload: if True, upload the missing and mismatched objects
+    :type upload: bool
+    :param out: called with one report line per missing/mismatched object
+    :type out: function
+    :return: number of expected, missing, and mismatched objects, plus the
+        upload summary if upload was requested
+    :rtype: dict
+    """
+
+    expected = load_expected_objects(manifest_paths)
+    summary = {
+        "n_expected": len(expected),
+        "n_missing": 0,
+        "n_mismatched": 0
+    }
+    engine = S3UploadEngine(config_obj)
+
+    try:
+        # remove each listed object from the expected dict, unless its size
+        # differs from the local file, leaving only objects to re-upload
+        for key, size in find_objects(engine, list(expected.keys())):
+            task = expected.get(key)
+            if task is None:
+                continue
+            expected_size = get_expected_size(task)
+            if expected_size is None or expected_size == size:
+                del expected[key]
+            else:
+                summary["n_mismatched"] += 1
+                task["mismatch"] = [expected_size, size]
+
+        for key in sorted(expected.keys()):
+            task = expected[key]
+            if "mismatch" in task:
+                out("\t".join(["size_mismatch", key,
+                    str(task["mismatch"][0]), str(task["mismatch"][1])]))
+            else:
+                summary["n_missing"] += 1
+                out("\t".join(["missing", key]))
+
+        if upload:
+            summary["upload"] = engine.upload_all(
+                [expected[k] for k in sorted(expected.keys())])
+    finally:
+        engine.close()
+
+    return summary
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Defines UploadScheduler class, retries and paces S3 requests"""
+
+import logging
+import random
+import threading
+import time
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+
+class UploadScheduler(object):
+    """Limits in-flight S3 requests, and retries them with backoff
+
+    Every S3 request made during an upload run is executed through the
+    scheduler. Before a request is sent, it must acquire one of a limited
+    number of slots. The number of slots is adjusted by AIMD (additive
+    increase, multiplicative decrease): each successful request grows the
+    limit by 1/limit (i.e. about 1 slot per round of requests), while a
+    throttling response (e.g. 503 SlowDown) halves it. Only one decrease is
+    applied per round, as requests already in flight when the limit was cut
+    were sent under the old limit. The limit therefore converges on the
+    request rate the bucket accepts.
+
+    Failed requests are classified as throttled, retryable (server errors,
+    timeouts, dropped connections) or fatal (e.g. access denied, missing
+    local file). Throttled and retryable requests are retried after a
+    delay drawn uniformly between 0 and an exponentially growing cap ("full
+    jitter"), so that many jobs throttled at once do not retry in lockstep.
+    Fatal errors, and requests that exhaust their attempts, are raised.
+
+    :param max_concurrency: upper bound on the number of in-flight requests
+    :type max_concurrency: int
+    :param min_concurrency: lower bound on the number of in-flight requests
+    :type min_concurrency: int
+    :param max_attempts: maximum number of attempts for each request
+    :type max_attempts: int
+    :param base_delay: backoff cap (seconds) after the first failed attempt
+    :type base_delay: float
+    :param max_delay: upper bound (seconds) on the backoff cap
+    :type max_delay: float
+    :param limit: current number of request slots
+    :type limit: float
+    :param in_flight: number of requests currently holding a slot
+    :type in_flight: int
+    :param epoch: incremented on every decrease of the limit
+    :type epoch: int
+    """
+
+    SUCCESS = 0
+    THROTTLED = 1
+    RETRYABLE = 2
+    FATAL = 3
+
+    THROTTLING_ERROR_CODES = set([
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "TooManyRequestsException",
+        "RequestThrottled"
+    ])
+
+    RETRYABLE_ERROR_CODES = set([
+        "InternalError",
+        "ServiceUnavailable",
+        "RequestTimeout",
+        "RequestTimeoutException",
+        "PriorRequestNotComplete"
+    ])
+
+    def __init__(self, max_concurrency, min_concurrency=1, max_attempts=8,
+        base_delay=0.1, max_delay=20.0):
+        """Constructor method"""
+
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.epoch = 0
+        self.condition = threading.Condition()
+
+    def call(self, func, *args, **kwargs):
+        """Execute an S3 request, retrying it until success or fatal error
+
+        :param func: function making the request, must be safe to call again
+        :type func: function
+        :return: return value of func
+        :raises: the exception of the final failed attempt
+        """
+
+        attempt = 1
+        while True:
+            epoch = self.acquire()
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                outcome = self.classify(e)
+                self.release(epoch, outcome)
+                if outcome == self.FATAL or attempt >= self.max_attempts:
+                    raise
+                delay = self.get_delay(attempt)
+                logging.debug(("request attempt {} failed, retrying in "
+                    + "{:.2f}s: {}").format(attempt, delay, str(e)))
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.release(epoch, self.SUCCESS)
+                return response
+
+    def acquire(self):
+        """Wait for a free request slot, then take it
+
+        :return: epoch at the time the slot was acquired
+        :rtype: int
+        """
+
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return self.epoch
+
+    def release(self, epoch, outcome):
+        """Free a request slot, and adjust the limit by the request outcome
+
+        :param epoch: epoch returned when the slot was acquired
+        :type epoch: int
+        :param outcome: SUCCESS, THROTTLED, RETRYABLE, or FATAL
+        :type outcome: int
+        """
+
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == self.SUCCESS:
+                self.limit = min(float(self.max_concurrency),
+                    self.limit + 1.0 / self.limit)
+            elif outcome == self.THROTTLED and epoch == self.epoch:
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                self.epoch += 1
+                logging.warning("throttled, reduced concurrency to {}".format(
+                    int(self.limit)))
+            self.condition.notify_all()
+
+    def classify(self, exception):
+        """Classify a failed request as throttled, retryable, or fatal
+
+        :param exception: exception raised by the request
+        :type exception: Exception
+        :return: THROTTLED, RETRYABLE, or FATAL
+        :rtype: int
+        """
+
+        if isinstance(exception, ClientError):
+            error = exception.response.get("Error", {})
+            code = error.get("Code", "")
+            http_status = exception.response.get("ResponseMetadata", {}) \
+                .get("HTTPStatusCode", 0)
+            if code in self.THROTTLING_ERROR_CODES or http_status in [429, 503]:
+                return self.THROTTLED
+            if code in self.RETRYABLE_ERROR_CODES or http_status >= 500:
+                return self.RETRYABLE
+            return self.FATAL
+
+        if isinstance(exception, (BotoConnectionError, HTTPClientError)):
+            return self.RETRYABLE
+
+        return self.FATAL
+
+    def get_delay(self, attempt):
+        """Get a randomized backoff delay for a failed attempt
+
+        :param attempt: number of the attempt that failed, starting at 1
+        :type attempt: int
+        :return: delay (seconds)
+        :rtype: float
+        """
+
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, cap)
@@ -1,80 +1,155 @@
-import os
-
-def aws_s3_upload(config_obj, seq_table, additional_table):
-    
-    put_object_template = \
-        "aws s3api put-object " \
-        + "--bucket {bucket_name} " \
-        + "--key {s3_path} " \
-        + "--acl public-read " \
-        + "{aws_profile} "
-    
-    put_primary_template = put_object_template \
-        + "--body {file_path}"
-    
-    put_secondary_template = put_object_template \
-        + "--website-redirect-location {redirect}"
-
-    base_config = {"bucket_name": config_obj["bucket_name"]}
-    base_config["aws_profile"] = \
-        "--profile " + config_obj["profile"] \
-        if "profile" in config_obj.keys() \
-        else ""
-    
-    def upload_manifest_entry(line):
-        ls = line.rstrip().split("\t")
-        completed, seq, metadata, primary_id = ls[:4]
-        secondary_ids = ls[4:]
-
-        seq_primary_path = "sequence/" + primary_id
-        metadata_primary_path = "metadata/json/" + primary_id + ".json"
-        
-        # upload files by primary checksum
-        # seq
-        upload_file_primary_checksum(s3_path=seq_primary_path, file_path=seq)
-        # metadata
-        upload_file_primary_checksum(s3_path=metadata_primary_path,
-            file_path=metadata)
-
-        # upload empty redirect files by secondary checksums
-        for secondary_id in secondary_ids:
-            seq_secondary_path = "sequence/" + secondary_id
-            metadata_secondary_path = "metadata/json/" + secondary_id + ".json"
-            # seq
-            upload_file_secondary_checksum(s3_path=seq_secondary_path,
-                redirect="/"+seq_primary_path)
-            # metadata
-            upload_file_secondary_checksum(s3_path=metadata_secondary_path,
-                redirect="/"+metadata_primary_path)
-
-    def upload_file_primary_checksum(**kwargs):
-        kwargs.update(base_config)
-        upload(put_primary_template, kwargs)
-
-    def upload_file_secondary_checksum(**kwargs):
-        kwargs.update(base_config)
-        upload(put_secondary_template, kwargs)
-
-    def upload_additional_entry(line):
-        ls = line.rstrip().split("\t")
-        params = {"file_path": ls[0], "s3_path": ls[1]}
-        params.update(base_config)
-        upload(put_primary_template, params)
-
-    def upload(template, parameters):
-        cmd = template.format(**parameters)
-        os.system(cmd)
-
-    header = True
-    for line in seq_table:
-        if header:
-            header = False
-        else:
-            upload_manifest_entry(line)
-    
-    header = True
-    for line in additional_table:
-        if header:
-            header = False
-        else:
-            upload_additional_entry(line)
+import threading
+from ga4gh.refget.loader.config.constants import Status
+from ga4gh.refget.loader.destinations.aws.s3.engine import S3UploadEngine
+from ga4gh.refget.loader.destinations.aws.s3.listing import get_destination_id
+from ga4gh.refget.loader.store.digest_index import DigestIndex
+
+def manifest_entry_tasks(line):
+    """Get upload tasks for a single manifest sequence entry
+
+    Each entry uploads the sequence and metadata by primary checksum, plus an
+    empty redirect object for each secondary checksum.
+
+    :param line: manifest sequence table line
+    :type line: str
+    :return: upload tasks for the entry
+    :rtype: list[dict[str, str]]
+    """
+
+    ls = line.rstrip().split("\t")
+    completed, seq, metadata, primary_id = ls[:4]
+    secondary_ids = ls[4:]
+
+    seq_primary_path = "sequence/" + primary_id
+    metadata_primary_path = "metadata/json/" + primary_id + ".json"
+
+    # upload files by primary checksum
+    tasks = [
+        {"key": seq_primary_path, "file_path": seq},
+        {"key": metadata_primary_path, "file_path": metadata}
+    ]
+
+    # upload empty redirect files by secondary checksums
+    for secondary_id in secondary_ids:
+        tasks.append({
+            "key": "sequence/" + secondary_id,
+            "redirect": "/" + seq_primary_path
+        })
+        tasks.append({
+            "key": "metadata/json/" + secondary_id + ".json",
+            "redirect": "/" + metadata_primary_path
+        })
+
+    return tasks
+
+def additional_entry_tasks(line):
+    """Get upload tasks for a single manifest additional upload entry
+
+    :param line: manifest additional uploads table line
+    :type line: str
+    :return: upload tasks for the entry
+    :rtype: list[dict[str, str]]
+    """
+
+    ls = line.rstrip().split("\t")
+    return [{"key": ls[1], "file_path": ls[0]}]
+
+def aws_s3_upload(config_obj, seq_table, additional_table, journal=None):
+    """Upload all objects referenced by manifest tables to an S3 bucket
+
+    If a journal is provided, objects it lists as completed are skipped, and
+    each newly uploaded object is recorded in it.
+
+    If the destination config sets "digest_index", sequence entries whose
+    digests are all in the index are skipped entirely, and the digests of
+    each entry are added to the index once all of its objects are uploaded.
+
+    :param config_obj: destination config, as validated by aws_s3.json schema
+    :type config_obj: dict
+    :param seq_table: manifest sequence table lines, including header
+    :type seq_table: iterable[str]
+    :param additional_table: manifest additional table lines, including header
+    :type additional_table: iterable[str]
+    :param journal: upload journal for the manifest
+    :type journal: class:`UploadJournal`, optional
+    :return: number of uploaded, failed, and indexed (skipped) objects, failed
+        results
+    :rtype: dict
+    """
+
+    index = None
+    if config_obj.get("digest_index"):
+        index = DigestIndex(config_obj["digest_index"],
+            get_destination_id(config_obj))
+    n_indexed = [0]
+    entry_lock = threading.Lock()
+
+    def pending_tasks(tasks):
+        if journal:
+            return [t for t in tasks if not journal.is_completed(t)]
+        return tasks
+
+    def generate_seq_tasks():
+        header = True
+        for line in seq_table:
+            if header:
+                header = False
+                continue
+
+            tasks = manifest_entry_tasks(line)
+            if not index:
+                for task in pending_tasks(tasks):
+                    yield task
+                continue
+
+            digests = line.rstrip().split("\t")[3:]
+            if index.contains_all(digests):
+                n_indexed[0] += len(tasks)
+                continue
+
+            # all tasks of the entry share a counter, the last task to be
+            # uploaded adds the entry's digests to the index
+            tasks = pending_tasks(tasks)
+            if not tasks:
+                index.add(digests)
+                continue
+            entry = {"remaining": len(tasks), "digests": digests}
+            for task in tasks:
+                task["entry"] = entry
+                yield task
+
+    def generate_additional_tasks():
+        header = True
+        for line in additional_table:
+            if header:
+                header = False
+            else:
+                for task in pending_tasks(additional_entry_tasks(line)):
+                    yield task
+
+    def generate_tasks():
+        for task in generate_seq_tasks():
+            yield task
+        for task in generate_additional_tasks():
+            yield task
+
+    def on_result(task, result):
+        if journal:
+            journal.record(result)
+        if "entry" in task and result["status"] == Status.SUCCESS:
+            entry = task["entry"]
+            with entry_lock:
+                entry["remaining"] -= 1
+                completed = entry["remaining"] == 0
+            if completed:
+                index.add(entry["digests"])
+
+    engine = S3UploadEngine(config_obj)
+    try:
+        summary = engine.upload_all(generate_tasks(), callback=on_result)
+    finally:
+        engine.close()
+        if index:
+            index.close()
+    summary["n_indexed"] = n_indexed[0]
+    return summary
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Defines UploadJournal class, records completed uploads for a manifest"""
+
+import os
+import threading
+from ga4gh.refget.loader.config.constants import Status
+
+class UploadJournal(object):
+    """Append-only record of objects uploaded from a single manifest
+
+    Every successfully uploaded object is appended to the journal file as a
+    tab-separated line of object key, size, and ETag. When an upload of the
+    same manifest is restarted, the journal is loaded into a dictionary keyed
+    by object key, so that each upload task can be checked and skipped in
+    constant time. A partially written final line (e.g. if the job was killed
+    mid-write) is discarded, and that object is uploaded again.
+
+    :param journal_path: path to the journal file
+    :type journal_path: str
+    :param resume: if True, load existing journal and skip completed objects,
+        otherwise truncate the journal and upload all objects
+    :type resume: bool
+    :param completed: object key -> [size, etag] of all completed objects
+    :type completed: dict[str, list]
+    :param n_skipped: number of upload tasks skipped as already completed
+    :type n_skipped: int
+    """
+
+    def __init__(self, journal_path, resume=True):
+        """Constructor method"""
+
+        self.journal_path = journal_path
+        self.completed = {}
+        self.n_skipped = 0
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(self.journal_path):
+            self.completed = self.__load()
+        self.journal_file = open(self.journal_path, "a" if resume else "w")
+
+    @classmethod
+    def for_manifest(cls, manifest_path, resume=True):
+        """Open the journal that accompanies a manifest file
+
+        :param manifest_path: path to the upload manifest
+        :type manifest_path: str
+        :param resume: load existing journal, or start over
+        :type resume: bool
+        :return: journal for the manifest
+        :rtype: class:`UploadJournal`
+        """
+
+        return cls(manifest_path + ".journal", resume=resume)
+
+    def is_completed(self, task):
+        """Check whether an upload task was completed by a previous run
+
+        Tasks uploading a local file are only considered complete if the
+        journaled size matches the current size of the file.
+
+        :param task: upload task, "key" and one of "file_path" or "redirect"
+        :type task: dict[str, str]
+        :return: True if the object does not need to be uploaded again
+        :rtype: bool
+        """
+
+        entry = self.completed.get(task["key"])
+        if entry is None:
+            return False
+        if task.get("file_path"):
+            try:
+                if os.path.getsize(task["file_path"]) != entry[0]:
+                    return False
+            except OSError:
+                return False
+        self.n_skipped += 1
+        return True
+
+    def record(self, result):
+        """Append a successful upload result to the journal
+
+        :param result: upload result, as returned by the upload method
+        :type result: dict
+        """
+
+        if result["status"] != Status.SUCCESS:
+            return
+        line = "\t".join([result["key"], str(result["size"]), result["etag"]])
+        with self.lock:
+            self.completed[result["key"]] = [result["size"], result["etag"]]
+            self.journal_file.write(line + "\n")
+            self.journal_file.flush()
+
+    def close(self):
+        """Close the journal file"""
+
+        self.journal_file.close()
+
+    def __load(self):
+        """Load all complete lines of an existing journal file
+
+        :return: object key -> [size, etag] of all completed objects
+        :rtype: dict[str, list]
+        """
+
+        completed = {}
+        valid_bytes = 0
+        with open(self.journal_path, "rb") as journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    break
+                valid_bytes += len(line)
+                ls = line.decode().rstrip("\n").split("\t")
+                if len(ls) != 3:
+                    continue
+                key, size, etag = ls
+                completed[key] = [int(size), etag]
+
+        # drop any partially written final line, so that new entries are not
+        # appended onto it
+        if os.path.getsize(self.journal_path) != valid_bytes:
+            with open(self.journal_path, "r+b") as journal_file:
+                journal_file.truncate(valid_bytes)
+        return completed
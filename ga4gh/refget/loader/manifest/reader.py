@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Defines ManifestReader class, lazily reads an upload manifest"""
+
+class ManifestReader(object):
+    """Reads an upload manifest line by line, without loading it into memory
+
+    An upload manifest consists of a 3 line comment header (title, source
+    config, destination config), a tab-separated sequence table, then a
+    "# additional uploads" comment line followed by a tab-separated table of
+    additional files. ManifestReader parses the comment header on
+    construction, and exposes both tables as generators reading from the same
+    open file, so that memory use is independent of manifest size, and
+    consumers can begin work as soon as the first line has been read.
+
+    The sequence table must be consumed before the additional table. If the
+    additional table is requested first, any remaining sequence table lines
+    are skipped.
+
+    :param manifest_path: path to the upload manifest
+    :type manifest_path: str
+    :param source_config: path to source JSON config, from manifest header
+    :type source_config: str
+    :param destination_config: path to destination JSON config, from header
+    :type destination_config: str
+    """
+
+    ADDITIONAL_UPLOADS_MARKER = "# additional uploads"
+
+    def __init__(self, manifest_path):
+        """Constructor method"""
+
+        self.manifest_path = manifest_path
+        self.manifest_file = open(manifest_path, "r")
+        self.manifest_file.readline()
+        self.source_config = self.__parse_header_value()
+        self.destination_config = self.__parse_header_value()
+        self.in_seq_table = True
+
+    def seq_table(self):
+        """Generator function, yields sequence table lines, including header
+
+        Yields:
+            (str): a single line of the sequence table
+        """
+
+        while self.in_seq_table:
+            line = self.manifest_file.readline()
+            if not line or line.startswith(self.ADDITIONAL_UPLOADS_MARKER):
+                self.in_seq_table = False
+            else:
+                yield line
+
+    def additional_table(self):
+        """Generator function, yields additional table lines, including header
+
+        Yields:
+            (str): a single line of the additional uploads table
+        """
+
+        for line in self.seq_table():
+            pass
+        for line in self.manifest_file:
+            yield line
+
+    def close(self):
+        """Close the manifest file"""
+
+        self.manifest_file.close()
+
+    def __parse_header_value(self):
+        """Parse the value of the next "# key: value" comment header line
+
+        :return: value of the header line
+        :rtype: str
+        """
+
+        return self.manifest_file.readline().split(":", 1)[1].strip()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Defines ShardedManifestWriter class, splits a manifest into upload shards"""
+
+import heapq
+import os
+from ga4gh.refget.loader.manifest.writer import ManifestWriter
+
+def get_shard_path(manifest_path, shard):
+    """Get the path of a shard of an upload manifest
+
+    :param manifest_path: path to the whole upload manifest
+    :type manifest_path: str
+    :param shard: shard number, from 1
+    :type shard: int
+    :return: path to the shard manifest, e.g. <id>.manifest.<shard>.csv
+    :rtype: str
+    """
+
+    stem, ext = os.path.splitext(manifest_path)
+    return "{}.{}{}".format(stem, shard, ext)
+
+class ShardedManifestWriter(object):
+    """Writes a whole upload manifest, and the same entries split into shards
+
+    Each shard is a complete manifest, uploaded by its own task, so that a
+    large flatfile's upload is spread across several jobs. Entries are
+    assigned to the shard with the fewest bytes so far, so that shards are
+    balanced by the size of the files they upload rather than by their number
+    of entries. The whole manifest is still written, for reconciliation and
+    for uploading in a single job.
+
+    :param manifest_path: path to the whole upload manifest
+    :type manifest_path: str
+    :param source_config: path to source JSON config
+    :type source_config: str
+    :param destination_config: path to destination JSON config
+    :type destination_config: str
+    :param n_shards: number of shards
+    :type n_shards: int
+    :param tmp_suffix: suffix of the paths written to, until moved into place
+    :type tmp_suffix: str
+    :param writer: writes the whole manifest
+    :type writer: class:`ManifestWriter`
+    :param shard_writers: writes each shard manifest
+    :type shard_writers: list[class:`ManifestWriter`]
+    :param heap: bytes and entries assigned so far, and index, of each shard
+    :type heap: list[list[int]]
+    """
+
+    def __init__(self, manifest_path, source_config, destination_config,
+        n_shards, tmp_suffix=""):
+        """Constructor method"""
+
+        self.manifest_path = manifest_path
+        self.n_shards = n_shards
+        self.writer = ManifestWriter(manifest_path + tmp_suffix,
+            source_config, destination_config, flush=False)
+        self.shard_writers = [ManifestWriter(
+            get_shard_path(manifest_path, i + 1) + tmp_suffix, source_config,
+            destination_config, flush=False) for i in range(n_shards)]
+        self.heap = [[0, 0, i] for i in range(n_shards)]
+
+    def write_seq_header(self):
+        """Write the header line of each sequence table"""
+
+        self.writer.write_seq_header()
+        for shard_writer in self.shard_writers:
+            shard_writer.write_seq_header()
+
+    def write_seq_entry(self, row):
+        """Write a processed sequence to the manifest, and to one shard
+
+        :param row: processed record, with seq_path and json_path
+        :type row: dict
+        """
+
+        self.writer.write_seq_entry(row)
+        self.__next_shard(row["seq_path"], row["json_path"]).write_seq_entry(
+            row)
+
+    def write_additional_header(self):
+        """End each sequence table, write each additional uploads header"""
+
+        self.writer.write_additional_header()
+        for shard_writer in self.shard_writers:
+            shard_writer.write_additional_header()
+
+    def write_additional_entry(self, source, destination):
+        """Write a file to the additional uploads of the manifest and a shard
+
+        :param source: path to local file
+        :type source: str
+        :param destination: object key to upload the file to
+        :type destination: str
+        """
+
+        self.writer.write_additional_entry(source, destination)
+        self.__next_shard(source).write_additional_entry(source, destination)
+
+    def close(self):
+        """Close the manifest and shard files"""
+
+        self.writer.close()
+        for shard_writer in self.shard_writers:
+            shard_writer.close()
+
+    def get_paths(self):
+        """Get the path of the whole manifest, and of each shard
+
+        :return: manifest path, then shard paths in order
+        :rtype: list[str]
+        """
+
+        return [self.manifest_path] + [get_shard_path(self.manifest_path,
+            i + 1) for i in range(self.n_shards)]
+
+    def __next_shard(self, *file_paths):
+        """Assign files to the shard with the fewest bytes so far
+
+        :param file_paths: paths of the files uploaded by the entry
+        :type file_paths: str
+        :return: writer of the assigned shard
+        :rtype: class:`ManifestWriter`
+        """
+
+        n_bytes = 0
+        for file_path in file_paths:
+            try:
+                n_bytes += os.path.getsize(file_path)
+            except OSError:
+                pass
+        shard = heapq.heappop(self.heap)
+        shard[0] += n_bytes
+        shard[1] += 1
+        heapq.heappush(self.heap, shard)
+        return self.shard_writers[shard[2]]
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Defines ManifestWriter class, journals an upload manifest as it is built"""
+
+class ManifestWriter(object):
+    """Writes an upload manifest entry by entry, as sequences are produced
+
+    The manifest has the same layout as one written by the manifest
+    subcommand, and read by ManifestReader: a 3 line comment header, the
+    sequence table, then the additional uploads table. By default, each line
+    is flushed as soon as it is written, so the manifest is a journal of
+    every entry queued so far, even if the run is interrupted, and can be
+    uploaded again with the upload command.
+
+    Each write method returns the line it wrote, so that it can be passed
+    on, e.g. to an upload method reading manifest tables.
+
+    :param manifest_path: path to the upload manifest
+    :type manifest_path: str
+    :param source_config: path to source JSON config
+    :type source_config: str
+    :param destination_config: path to destination JSON config
+    :type destination_config: str
+    :param flush: flush each line as it is written
+    :type flush: bool
+    """
+
+    SEQ_HEADER = ["completed", "seq", "metadata", "primary_id", "trunc512_id",
+        "md5_id"]
+    ADDITIONAL_HEADER = ["source", "destination"]
+    ADDITIONAL_UPLOADS_MARKER = "# additional uploads"
+
+    def __init__(self, manifest_path, source_config, destination_config,
+        flush=True):
+        """Constructor method"""
+
+        self.manifest_path = manifest_path
+        self.flush = flush
+        self.manifest_file = open(manifest_path, "w")
+        self.manifest_file.write(
+            "# Refget loader manifest\n"
+            + "# source config: {}\n".format(source_config)
+            + "# destination config: {}\n".format(destination_config))
+
+    def write_seq_header(self):
+        """Write the header line of the sequence table
+
+        :return: header line
+        :rtype: str
+        """
+
+        return self.__write("\t".join(self.SEQ_HEADER))
+
+    def write_seq_entry(self, row):
+        """Write a processed sequence to the sequence table
+
+        :param row: processed record, as produced by FlatfileProcessor
+        :type row: dict
+        :return: sequence table line
+        :rtype: str
+        """
+
+        return self.__write("\t".join([
+            str(row["completed"]),
+            row["seq_path"],
+            row["json_path"],
+            row["ga4gh"],
+            row["trunc512"],
+            row["md5"]
+        ]))
+
+    def write_additional_header(self):
+        """End the sequence table, write the additional uploads table header
+
+        :return: header line
+        :rtype: str
+        """
+
+        self.__write(self.ADDITIONAL_UPLOADS_MARKER)
+        return self.__write("\t".join(self.ADDITIONAL_HEADER))
+
+    def write_additional_entry(self, source, destination):
+        """Write a file to the additional uploads table
+
+        :param source: path to local file
+        :type source: str
+        :param destination: object key to upload the file to
+        :type destination: str
+        :return: additional uploads table line
+        :rtype: str
+        """
+
+        return self.__write("\t".join([source, destination]))
+
+    def close(self):
+        """Close the manifest file"""
+
+        self.manifest_file.close()
+
+    def __write(self, line):
+        """Write a single line, flushing it if required
+
+        :param line: line, without line terminator
+        :type line: str
+        :return: line, with line terminator
+        :rtype: str
+        """
+
+        self.manifest_file.write(line + "\n")
+        if self.flush:
+            self.manifest_file.flush()
+        return line + "\n"
@@ -0,0 +1,50 @@
+import os
+from ga4gh.refget.loader.sources.ena.assembly.process import \
+    get_dates_dirs, scan_dates
+from ga4gh.refget.loader.sources.ena.assembly.process_date import \
+    read_accession_list, select_flatfiles
+from ga4gh.refget.loader.sources.ena.assembly.utils.accession_index import \
+    AccessionIndex
+from ga4gh.refget.loader.sources.ena.assembly.utils.batch_planner import \
+    FlatfilePlanner
+from ga4gh.refget.loader.sources.ena.assembly.utils.capacity_planner import \
+    CapacityPlanner
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    get_upload_shards
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+def ena_assembly_plan(config_obj, source_config, destination_config,
+    concurrency=None):
+    """report the expected work of a load, without processing anything
+
+    Accession lists are generated by scanning, or read if already cached,
+    and flatfiles are selected and planned into jobs as they would be by a
+    load. Estimates are based on the throughput recorded in the status store
+    by earlier runs.
+    """
+
+    dates_dirs = get_dates_dirs(config_obj)
+    accession_index = AccessionIndex.from_config(config_obj)
+    scan_dates(config_obj, dates_dirs, accession_index=accession_index)
+
+    planner = FlatfilePlanner(config_obj.get("batch_target_bytes"))
+    status_store = StatusStore.from_config(config_obj)
+    capacity_planner = CapacityPlanner(status_store.get_throughput(),
+        fused=bool(config_obj.get("fused_upload")),
+        upload_shards=get_upload_shards(config_obj))
+    status_store.close()
+
+    for date_string, sub_dir in dates_dirs:
+        accessions_urls = read_accession_list(date_string, sub_dir,
+            config_obj, accession_index=accession_index)
+        flatfiles, n_unchanged = select_flatfiles(accessions_urls, config_obj,
+            accession_index=accession_index)
+        capacity_planner.add_date(date_string, planner.plan(flatfiles),
+            n_unchanged=n_unchanged)
+    if accession_index:
+        accession_index.close()
+
+    if not concurrency:
+        concurrency = config_obj.get("local_concurrency", os.cpu_count())
+    for line in capacity_planner.report(concurrency):
+        print(line)
@@ -2,38 +2,87 @@ import datetime
 import logging
 import os
 from ga4gh.refget.loader.sources.ena.assembly.process_date import process_date
+from ga4gh.refget.loader.sources.ena.assembly.utils.range_scanner import \
+    scan_date_range, ACCESSION_LIST_FILENAME, DEFAULT_SCAN_CONCURRENCY
+from ga4gh.refget.loader.sources.ena.assembly.utils.accession_index import \
+    AccessionIndex
+from ga4gh.refget.loader.sources.ena.assembly.utils.response_cache import \
+    ResponseCache
 
-def ena_assembly_process(config_obj, source_config, destination_config):
+def start_logfile(logfile):
+    logging.basicConfig(
+        filename=logfile,
+        format='%(asctime)s\t%(levelname)s\t%(message)s',
+        level=logging.DEBUG,
+    )
+
+def stop_logfile():
+    # remove logging handlers so a new log file can be written
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+        handler.close()
+
+def get_next_date_string(date_string):
+    date = datetime.date(*[int(a) for a in date_string.split("-")])
+    next_date = date + datetime.timedelta(days=1)
+    return next_date.strftime("%Y-%m-%d")
+
+def get_dates_dirs(config_obj):
     root_dir = config_obj["processing_dir"]
     date_string = config_obj["start_date"]
     n_days = config_obj["number_of_days"]
 
+    # create sub directory for each date
+    dates_dirs = []
     for i in range(0, n_days):
         year, month, day = date_string.split("-")
-    
-        # create sub directory, logfile
         sub_dir = os.path.join(root_dir, year, month, day)
         if not os.path.exists(sub_dir):
             os.makedirs(sub_dir)
-        logfile = os.path.join(sub_dir, "logfile.txt")
-        logging.basicConfig(
-            filename=logfile,
-            format='%(asctime)s\t%(levelname)s\t%(message)s',
-            level=logging.DEBUG,
-        )
+        dates_dirs.append([date_string, sub_dir])
+        date_string = get_next_date_string(date_string)
+    return dates_dirs
+
+def scan_dates(config_obj, dates_dirs, accession_index=None):
+    # scan all dates without an accessions list concurrently, any dates that
+    # fail are scanned again by process_date. The scan is logged to the
+    # run's logfile in the root processing directory, as it spans dates
+    unscanned = [[d, sub_dir] for d, sub_dir in dates_dirs
+        if not os.path.exists(os.path.join(sub_dir, ACCESSION_LIST_FILENAME))]
+    if len(unscanned) > 1:
+        start_logfile(os.path.join(config_obj["processing_dir"],
+            "logfile.txt"))
+        logging.info("scanning accessions of {} dates, {} to {}".format(
+            len(unscanned), unscanned[0][0], unscanned[-1][0]))
+        try:
+            scan_date_range(unscanned,
+                config_obj.get("scan_concurrency", DEFAULT_SCAN_CONCURRENCY),
+                url=config_obj.get("search_url"),
+                cache=ResponseCache.from_config(config_obj),
+                split_threshold=config_obj.get("split_threshold"),
+                accession_index=accession_index)
+        finally:
+            stop_logfile()
+
+def ena_assembly_process(config_obj, source_config, destination_config):
+    dates_dirs = get_dates_dirs(config_obj)
+    accession_index = AccessionIndex.from_config(config_obj)
+    scan_dates(config_obj, dates_dirs, accession_index=accession_index)
+
+    for date_string, sub_dir in dates_dirs:
+    
+        # create logfile
+        start_logfile(os.path.join(sub_dir, "logfile.txt"))
         logging.info("logs for sequences uploaded on: " + date_string)
 
         # processing method
         process_date(date_string, sub_dir, config_obj, source_config, 
-            destination_config)
-
-        # create the next date and update the config file
-        date = datetime.date(*[int(a) for a in [year, month, day]])
-        next_date = date + datetime.timedelta(days=1)
-        next_date_string = next_date.strftime("%Y-%m-%d")
-        date_string = next_date_string
-        logging.info("set checkpoint date to " + next_date_string)
+            destination_config, accession_index=accession_index)
+        logging.info("set checkpoint date to "
+            + get_next_date_string(date_string))
 
         # remove logging handler so new log file is written to the next date
-        for handler in logging.root.handlers:
-            logging.root.removeHandler(handler)
+        stop_logfile()
+
+    if accession_index:
+        accession_index.close()
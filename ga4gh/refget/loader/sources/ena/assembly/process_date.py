@@ -3,19 +3,41 @@
 
 import logging
 import os
+from ga4gh.refget.loader.sources.ena.assembly.functions.time import timestamp
 from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_scanner \
     import AssemblyScanner
+from ga4gh.refget.loader.sources.ena.assembly.utils.batch_planner import \
+    FlatfilePlanner, FlatfileBatch
+from ga4gh.refget.loader.sources.ena.assembly.utils.range_scanner import \
+    create_session, DEFAULT_SCAN_CONCURRENCY
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    get_executor
+from ga4gh.refget.loader.sources.ena.assembly.utils.response_cache import \
+    ResponseCache
+from ga4gh.refget.loader.sources.ena.assembly.utils.staging_manager import \
+    StagingManager
 from ga4gh.refget.loader.sources.ena.assembly.process_flatfile \
-    import process_flatfile
+    import process_flatfile, get_local_flatfile_path, get_flatfile_id, \
+    get_flatfile_manifest
+from ga4gh.refget.loader.store.status_store import StatusStore
 
-def process_date(date_string, processing_dir, config_obj, source_config,
-    destination_config):
-    """process all seqs that were deployed on ena on the same date
+def read_accession_list(date_string, processing_dir, config_obj,
+    accession_index=None):
+    """Read the accessions and urls of a date's flatfiles
 
-    :param date_string: YYYY-MM-DD formatted string, date to scan and process
+    The accession list is generated by scanning the search API, unless it
+    already exists in the processing directory from an earlier run.
+
+    :param date_string: YYYY-MM-DD formatted string, date to scan
     :type date_string: str
-    :param processing_dir: directory to process all seqs for given date
+    :param processing_dir: processing directory of the date
     :type processing_dir: str
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :param accession_index: persistent index, updated with scanned records
+    :type accession_index: class:`AccessionIndex`, optional
+    :return: accession and url of each flatfile
+    :rtype: list[list[str]]
     """
 
     # generate the accession list via AssemblyScanner,
@@ -27,11 +49,20 @@ def process_date(date_string, processing_dir, config_obj, source_config,
                      + "search")
     else:
         logging.info("generating accessions list from search API scan")
-        scanner = AssemblyScanner(date_string)
+        max_concurrency = config_obj.get("scan_concurrency",
+            DEFAULT_SCAN_CONCURRENCY)
+        session = create_session(max_concurrency)
+        scanner = AssemblyScanner(date_string,
+            url=config_obj.get("search_url"),
+            session=session,
+            cache=ResponseCache.from_config(config_obj),
+            split_threshold=config_obj.get("split_threshold"),
+            max_concurrency=max_concurrency,
+            accession_index=accession_index)
         scanner.generate_accession_list(accession_list_file)
+        session.close()
 
-    # for each accession (line) in the list file, send the accession and url
-    # to the process_single_flatfile method
+    # each line of the list file (after the header) is an accession and url
     accessions_urls = []
     header = True
     for line in open(accession_list_file, "r"):
@@ -41,7 +72,145 @@ def process_date(date_string, processing_dir, config_obj, source_config,
             accession, url =\
                 line.strip().split("\t")
             accessions_urls.append([accession, url])
-    
+    return accessions_urls
+
+def select_flatfiles(accessions_urls, config_obj, accession_index=None):
+    """Select the flatfiles that need processing
+
+    :param accessions_urls: accession and url of each flatfile
+    :type accessions_urls: list[list[str]]
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :param accession_index: persistent index of scanned/processed accessions
+    :type accession_index: class:`AccessionIndex`, optional
+    :return: accession, url, and local path of each flatfile that is new,
+        changed, or not completed since it was last submitted, and the
+        number unchanged
+    :rtype: list
+    """
+
+    # the status store holds the final status of flatfiles whose jobs did
+    # not report back to the scheduler (e.g. LSF jobs)
+    status_store = StatusStore.from_config(config_obj) if accession_index \
+        else None
+    flatfiles = []
+    n_unchanged = 0
     for accession, url in accessions_urls:
-        process_flatfile(processing_dir, accession, url, config_obj, 
-            source_config, destination_config)
+        flatfile_path = get_local_flatfile_path(url,
+            config_obj.get("flatfile_dir"))
+        if accession_index and not accession_index.needs_processing(
+            accession, url, flatfile_path, status_store=status_store):
+            n_unchanged += 1
+            continue
+        flatfiles.append([accession, url, flatfile_path])
+    if status_store:
+        status_store.close()
+    return [flatfiles, n_unchanged]
+
+def process_date(date_string, processing_dir, config_obj, source_config,
+    destination_config, accession_index=None):
+    """process all seqs that were deployed on ena on the same date
+
+    If an accession index is given, flatfiles that have completed and are
+    unchanged since they were last submitted are skipped, and the state of
+    each submitted flatfile is recorded in the index. Every other flatfile
+    is submitted, even if its jobs completed on an earlier run of the date,
+    as its flatfile has changed since.
+
+    Flatfile jobs are run by the executor selected by submission_mode:
+    three LSF jobs per flatfile ("job"), one LSF job array per stage for all
+    flatfiles ("array"), or local processes ("local"). Once all flatfiles
+    have been submitted, any final statuses reported by the executor (e.g.
+    local runs, or failed array submission) are recorded.
+
+    Flatfiles are submitted largest first. If batch_target_bytes is set,
+    flatfiles smaller than it are packed into batches of up to that many
+    bytes, and each batch is submitted to the executor as a single flatfile.
+    The plan is logged and printed before submission.
+
+    If staging_high_water_bytes is set, new processing is paused while the
+    bytes staged for upload beneath the root processing directory, by this
+    and earlier dates, are above it, until uploads have drained them to
+    staging_low_water_bytes.
+
+    :param date_string: YYYY-MM-DD formatted string, date to scan and process
+    :type date_string: str
+    :param processing_dir: directory to process all seqs for given date
+    :type processing_dir: str
+    :param accession_index: persistent index of scanned/processed accessions
+    :type accession_index: class:`AccessionIndex`, optional
+    """
+
+    accessions_urls = read_accession_list(date_string, processing_dir,
+        config_obj, accession_index=accession_index)
+
+    name = "{}.{}".format(date_string, timestamp().replace(":", ""))
+    executor = get_executor(config_obj, name, processing_dir,
+        staging=StagingManager.from_config(config_obj))
+
+    candidates, n_unchanged = select_flatfiles(accessions_urls, config_obj,
+        accession_index=accession_index)
+
+    planner = FlatfilePlanner(config_obj.get("batch_target_bytes"))
+    plan = planner.plan(candidates)
+    summary = planner.summarize(plan)
+    logging.info(summary)
+    print("{} {}".format(date_string, summary))
+
+    status_store = StatusStore.from_config(config_obj)
+    submitted = {}
+    batches = {}
+    for i, flatfiles in enumerate(plan):
+        # a batch collects its flatfiles' jobs, and is submitted in their
+        # place once their command files have been written
+        batch = None
+        flatfile_executor = executor
+        if len(flatfiles) > 1:
+            batch_id = "{}.batch{}".format(name, i + 1)
+            batch = FlatfileBatch(batch_id,
+                os.path.join(processing_dir, "batches", batch_id),
+                stages=executor.stages, stage_tasks=executor.stage_tasks)
+            flatfile_executor = batch
+
+        for accession, url, flatfile_path, size in flatfiles:
+            status_dict = process_flatfile(processing_dir, accession, url,
+                config_obj, source_config, destination_config,
+                executor=flatfile_executor, date_string=date_string,
+                status_store=status_store,
+                force=accession_index is not None)
+            submitted[get_flatfile_id(url)] = [accession, url, flatfile_path]
+            if accession_index:
+                accession_index.record_state(accession, url,
+                    status_dict["status"], flatfile_path)
+
+        if batch and len(batch) > 0:
+            batch.write()
+            executor.submit(batch.batch_id, batch.cmd_dir, batch.log_dir)
+            batches[batch.batch_id] = batch
+
+    # failed flatfiles are marked in the index so they are retried on the
+    # next run
+    results = executor.finish()
+    for batch_id, batch in batches.items():
+        if batch_id in results:
+            results.update(batch.get_results(*results.pop(batch_id)))
+    for job_id in sorted(results.keys()):
+        if job_id not in submitted:
+            continue
+        status, message = results[job_id]
+        accession, url, flatfile_path = submitted[job_id]
+        status_store.update(StatusStore.get_job_key(
+            get_flatfile_manifest(processing_dir, url)),
+            {"status": status, "message": message})
+        if accession_index:
+            accession_index.record_state(accession, url, status,
+                flatfile_path)
+    status_store.close()
+    if results:
+        n_completed = len([r for r in results.values() if r[0] == "Completed"])
+        logging.info("{} of {} flatfiles completed".format(n_completed,
+            len(results)))
+
+    if n_unchanged:
+        logging.info("skipped {} of {} flatfiles unchanged since last "
+            .format(n_unchanged, len(accessions_urls)) + "processed")
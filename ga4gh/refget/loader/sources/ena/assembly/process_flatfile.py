@@ -5,9 +5,12 @@ import json
 import logging
 import os
 from ga4gh.refget.loader.sources.ena.assembly.functions.time import timestamp
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    LsfJobExecutor, SHARD_ENV, get_upload_shards
+from ga4gh.refget.loader.store.status_store import StatusStore
 
 def write_cmd_and_bsub(cmd, cmd_dir, log_dir, cmd_name, job_id, 
-    hold_jobname=None):
+    hold_jobname=None, n_tasks=1):
     """Write command and bsub files for a single batch job/component
 
     :param cmd: cli command
@@ -22,6 +25,8 @@ def write_cmd_and_bsub(cmd, cmd_dir, log_dir, cmd_name, job_id,
     :type job_id: str
     :param hold_jobname: this job will wait for the specified job to complete
     :type hold_jobname: str, optional
+    :param n_tasks: if greater than 1, submit a job array of this many tasks
+    :type n_tasks: int, optional
     :return: path to bsub command file
     :rtype: str
     """
@@ -31,6 +36,10 @@ def write_cmd_and_bsub(cmd, cmd_dir, log_dir, cmd_name, job_id,
     job_name = "{}.{}".format(cmd_name, job_id)
     logfile_out = os.path.join(log_dir, job_name + ".log.out")
     logfile_err = os.path.join(log_dir, job_name + ".log.err")
+    if n_tasks > 1:
+        logfile_out = os.path.join(log_dir, job_name + ".%I.log.out")
+        logfile_err = os.path.join(log_dir, job_name + ".%I.log.err")
+        job_name = "'{}[1-{}]'".format(job_name, n_tasks)
 
     # set command and bsub file paths, set bsub command
     # write command, bsub to specified file paths, modify permissions so they
@@ -48,6 +57,28 @@ def write_cmd_and_bsub(cmd, cmd_dir, log_dir, cmd_name, job_id,
     os.chmod(bsub_file, 0o744)
     return bsub_file
 
+def get_processor_command(config_obj):
+    """Get the command that processes a single flatfile
+
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :return: native processor subcommand, or the ena-refget-processor script
+    :rtype: str
+    """
+
+    if config_obj.get("processor") == "native":
+        cmd = NATIVE_PROCESSOR_COMMAND
+        if config_obj.get("processor_workers"):
+            cmd += " --workers {}".format(config_obj["processor_workers"])
+        if config_obj.get("content_store_dir"):
+            cmd += " --content-store {}".format(
+                config_obj["content_store_dir"])
+        return cmd
+    if not config_obj.get("ena_refget_processor_script"):
+        raise Exception("ena_refget_processor_script is required unless the "
+            + "native processor is used")
+    return config_obj["ena_refget_processor_script"]
+
 def write_process_cmd_and_bsub(subdir, perl_script, file_path, job_id, cmd_dir,
     log_dir):
     """Write batch files for processing (ena-refget-processor) step
@@ -70,31 +101,163 @@ def write_process_cmd_and_bsub(subdir, perl_script, file_path, job_id, cmd_dir,
     cmd = cmd_template.format(perl_script, subdir, file_path, job_id)
     return write_cmd_and_bsub(cmd, cmd_dir, log_dir, "process", job_id)
 
+def write_fused_cmd_and_bsub(subdir, processor, file_path, job_id,
+    source_config, destination_config, cmd_dir, log_dir):
+    """Write batch files for the fused process and upload step
+
+    :param subdir: directory where output seqs will be written
+    :type subdir: str
+    :param processor: native processor command
+    :type processor: str
+    :param file_path: path to input .dat flat file
+    :type file_path: str
+    :param job_id: unique id distinguishing it from other process jobs
+    :type job_id: str
+    :param source_config: path to source JSON config
+    :type source_config: str
+    :param destination_config: path to destination JSON config
+    :type destination_config: str
+    :param cmd_dir: path to batch command directory
+    :type cmd_dir: str
+    :param log_dir: path to logs directory
+    :type log_dir: str
+    :return: path to bsub command file
+    :rtype: str
+    """
+
+    cmd_template = "{} --store-path {} --file-path {} --process-id {} " \
+        + "--upload --source-config {} --destination-config {}"
+    cmd = cmd_template.format(processor, subdir, file_path, job_id,
+        source_config, destination_config)
+    return write_cmd_and_bsub(cmd, cmd_dir, log_dir, "process", job_id)
+
 def write_manifest_cmd_and_bsub(subdir, job_id, source_config, 
-    destination_config, cmd_dir, log_dir):
+    destination_config, cmd_dir, log_dir, n_shards=1):
     hold_jobname = "process.{}".format(job_id)
     cmd_template = "refget-loader subcommands ena assembly manifest " \
         + "{} {} {} {}"
     cmd = cmd_template.format(subdir, job_id, source_config, destination_config)
+    if n_shards > 1:
+        cmd += " --shards {}".format(n_shards)
     return write_cmd_and_bsub(cmd, cmd_dir, log_dir, "manifest", job_id,
         hold_jobname=hold_jobname)
 
-def write_upload_cmd_and_bsub(manifest, job_id, cmd_dir, log_dir): 
+def write_upload_cmd_and_bsub(manifest, job_id, cmd_dir, log_dir,
+    n_shards=1): 
     
+    # each shard is uploaded by a separate task, which is given its shard
+    # number by the executor, or by LSF as the job array index
     hold_jobname = "manifest.{}".format(job_id)
     cmd_template = "refget-loader upload {}"
     cmd = cmd_template.format(manifest)
+    if n_shards > 1:
+        cmd += ' --shards {} --shard "${{{}:-$LSB_JOBINDEX}}"'.format(
+            n_shards, SHARD_ENV)
     return write_cmd_and_bsub(cmd, cmd_dir, log_dir, "upload", job_id,
-        hold_jobname=hold_jobname)
+        hold_jobname=hold_jobname, n_tasks=n_shards)
+
+DEFAULT_FLATFILE_DIR = "/nfs/ftp"
+NATIVE_PROCESSOR_COMMAND = "refget-loader subcommands ena assembly process"
+
+def get_local_flatfile_path(url, flatfile_dir=None):
+    """Get the onsite path of a flatfile from its FTP url
+
+    :param url: FTP url for the flatfile
+    :type url: str
+    :param flatfile_dir: local directory mirroring the FTP site root
+    :type flatfile_dir: str, optional
+    :return: local path to the flatfile
+    :rtype: str
+    """
+
+    if not flatfile_dir:
+        flatfile_dir = DEFAULT_FLATFILE_DIR
+    return url.replace("ftp://ftp.ebi.ac.uk", flatfile_dir)
+
+def get_flatfile_id(url):
+    """Get the id of a flatfile's jobs from its FTP url
+
+    :param url: FTP url for the flatfile
+    :type url: str
+    :return: flatfile id, the file name without extensions
+    :rtype: str
+    """
+
+    return os.path.basename(url).split(".")[0]
+
+def get_flatfile_subdir(processing_dir, url):
+    """Get the processing sub-directory of a flatfile
+
+    :param processing_dir: processing directory of the flatfile's date
+    :type processing_dir: str
+    :param url: FTP url for the flatfile
+    :type url: str
+    :return: path to the flatfile's processing sub-directory
+    :rtype: str
+    """
+
+    url_basename = os.path.basename(url)
+    return os.path.join(processing_dir, "files", url_basename[:2],
+        get_flatfile_id(url))
+
+def get_flatfile_manifest(processing_dir, url):
+    """Get the upload manifest path of a flatfile
+
+    :param processing_dir: processing directory of the flatfile's date
+    :type processing_dir: str
+    :param url: FTP url for the flatfile
+    :type url: str
+    :return: path to the manifest written by the manifest subcommand
+    :rtype: str
+    """
+
+    return os.path.join(get_flatfile_subdir(processing_dir, url), "logs",
+        get_flatfile_id(url) + ".manifest.csv")
+
+def load_flatfile_status(status_store, processing_dir, accession, url):
+    """Load a flatfile's status, or initialize it if not yet recorded
+
+    A status.json file written by earlier versions, before statuses were held
+    in the status store, is read if the store has no status for the flatfile.
+
+    :param status_store: status store shared by all jobs
+    :type status_store: class:`StatusStore`
+    :param processing_dir: processing directory of the flatfile's date
+    :type processing_dir: str
+    :param accession: unique flatfile accession
+    :type accession: str
+    :param url: FTP url for the flatfile
+    :type url: str
+    :return: flatfile status (accession, url, status, message, last_modified)
+    :rtype: dict
+    """
+
+    job = StatusStore.get_job_key(get_flatfile_manifest(processing_dir, url))
+    status_dict = status_store.get(job)
+    if status_dict is None:
+        status_dict = {
+            "accession": accession,
+            "url": url,
+            "status": "NotAttempted",
+            "message": "None",
+            "last_modified": timestamp()
+        }
+        status_fp = os.path.join(get_flatfile_subdir(processing_dir, url),
+            "status.json")
+        if os.path.exists(status_fp):
+            status_dict = json.loads(open(status_fp, "r").read())
+    return status_dict
 
 def process_flatfile(processing_dir, accession, url, config_obj, source_config,
-    destination_config):
+    destination_config, executor=None, date_string=None, status_store=None,
+    force=False):
     """submit process and upload jobs for a single flatfile
 
     There are 2 components to getting flatfiles to S3: processing via 
     ena-refget-processor, and the upload of processed files. These 2 components
     are submitted as separate batch jobs, where the second job waits until the
-    first has completed.
+    first has completed. The jobs are run by the given executor, e.g. as LSF
+    jobs, LSF job arrays, or local processes.
 
     :param processing_dir: directory to write processed files
     :type processing_dir: str
@@ -102,44 +265,52 @@ def process_flatfile(processing_dir, accession, url, config_obj, source_config,
     :type accession: str
     :param url: FTP url for this flatfile (from AssemblyScanner list)
     :type url: str
+    :param executor: runs the flatfile's jobs, defaults to one LSF job each
+    :type executor: class:`FlatfileExecutor`, optional
+    :param date_string: YYYY-MM-DD date the flatfile is processed under
+    :type date_string: str, optional
+    :param status_store: status store shared by all jobs, opened from the
+        source config if not given
+    :type status_store: class:`StatusStore`, optional
+    :param force: submit the flatfile even if its jobs have completed, e.g.
+        if the flatfile has changed since
+    :type force: bool, optional
+    :return: flatfile status (accession, url, status, message, last_modified)
+    :rtype: dict
     """
 
-    perl_script = config_obj["ena_refget_processor_script"]
     logging.debug("{} - flatfile process attempt".format(accession))
 
     # create the processing sub-directory to prevent too many files in 
     # NFS filesystem
     # create directory to hold batch commands and logs
     url_basename = os.path.basename(url)
-    url_id = url_basename.split(".")[0]
-    subdir = os.path.join(processing_dir, "files", url_basename[:2], url_id)
+    url_id = get_flatfile_id(url)
+    subdir = get_flatfile_subdir(processing_dir, url)
     cmd_dir = os.path.join(subdir, "cmd")
     log_dir = os.path.join(subdir, "log")
     for d in [subdir, cmd_dir, log_dir]:
         if not os.path.exists(d):
             os.makedirs(d)
 
-    # initialize the status if the file hasn't been created, otherwise load
-    # status from the file
-    status_fp = os.path.join(subdir, "status.json")
-    status_dict = {
-        "accession": accession,
-        "url": url,
-        "status": "NotAttempted",
-        "message": "None",
-        "last_modified": timestamp()
-    }
-    if os.path.exists(status_fp):
-        status_dict = json.loads(open(status_fp, "r").read())
-
-    # only execute if status is not "Completed"
-    if status_dict["status"] != "Completed":
+    # initialize the status if it hasn't been recorded, otherwise load
+    # status from the status store
+    close_status_store = status_store is None
+    if status_store is None:
+        status_store = StatusStore.from_config(config_obj)
+    manifest = get_flatfile_manifest(processing_dir, url)
+    status_dict = load_flatfile_status(status_store, processing_dir,
+        accession, url)
+
+    # only execute if status is not "Completed", unless forced
+    if force or status_dict["status"] != "Completed":
         try:
             status_dict["status"] = "InProgress"
 
             # the ftp url maps to a local file path onsite, we do not need
             # to download the flatfile to process
-            dat_orig = url.replace("ftp://ftp.ebi.ac.uk", "/nfs/ftp")
+            dat_orig = get_local_flatfile_path(url,
+                config_obj.get("flatfile_dir"))
             dat_link = os.path.join(subdir, url_basename)
 
             # if local file doesn't exist, set status to "Failed"
@@ -153,24 +324,37 @@ def process_flatfile(processing_dir, accession, url, config_obj, source_config,
                 os.remove(dat_link)
             os.symlink(dat_orig, dat_link)
 
-            manifest = subdir + "/" + "/logs/" + url_id \
-                + ".manifest.csv"
-
             # create cmd and bsub files for both components:
             # 1. ena-refget-processor
             # 2. generate manifest from full and loader csv
             # 3. upload
-            process_bsub_file = write_process_cmd_and_bsub(subdir, perl_script,
-                dat_link, url_id, cmd_dir, log_dir)
-            manifest_bsub_file = write_manifest_cmd_and_bsub(subdir, url_id,
-                source_config, destination_config, cmd_dir, log_dir)
-            upload_bsub_file = write_upload_cmd_and_bsub(manifest, url_id, 
-                cmd_dir, log_dir)
-
-            #TODO: un-comment these when ready to execute
-            os.system(process_bsub_file)
-            os.system(manifest_bsub_file)
-            os.system(upload_bsub_file)
+            # in fused mode, a single native processor job uploads each
+            # sequence as it is processed, writing the manifest as it goes
+            if config_obj.get("fused_upload"):
+                if config_obj.get("processor") != "native":
+                    raise Exception("fused_upload requires the native "
+                        + "processor")
+                write_fused_cmd_and_bsub(subdir,
+                    get_processor_command(config_obj), dat_link, url_id,
+                    source_config, destination_config, cmd_dir, log_dir)
+            else:
+                # the native processor records its throughput in the
+                # source's status store
+                processor = get_processor_command(config_obj)
+                if config_obj.get("processor") == "native":
+                    processor += " --source-config " + source_config
+                write_process_cmd_and_bsub(subdir, processor, dat_link,
+                    url_id, cmd_dir, log_dir)
+                n_shards = get_upload_shards(config_obj)
+                write_manifest_cmd_and_bsub(subdir, url_id,
+                    source_config, destination_config, cmd_dir, log_dir,
+                    n_shards=n_shards)
+                write_upload_cmd_and_bsub(manifest, url_id,
+                    cmd_dir, log_dir, n_shards=n_shards)
+
+            if executor is None:
+                executor = LsfJobExecutor()
+            executor.submit(url_id, cmd_dir, log_dir)
 
         except Exception as e:
             # any exceptions in the above will set the status to "Failed",
@@ -180,7 +364,17 @@ def process_flatfile(processing_dir, accession, url, config_obj, source_config,
             logging.error("{} - flatfile process attempt failed: {}".format(
                 accession, str(e)))
         finally:
-            # write the status dictionary to the status file
+            # write the status to the status store
             status_dict["last_modified"] = timestamp()
-            open(status_fp, "w").write(
-                json.dumps(status_dict, indent=4, sort_keys=True) + "\n")
+            status_store.update(StatusStore.get_job_key(manifest), {
+                "date": date_string,
+                "accession": accession,
+                "url": url,
+                "stage": "submit",
+                "status": status_dict["status"],
+                "message": status_dict["message"]
+            })
+
+    if close_status_store:
+        status_store.close()
+    return status_dict
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Defines AccessionIndex class, records scanned and processed assemblies"""
+
+import os
+import sqlite3
+import threading
+from ga4gh.refget.loader.sources.ena.assembly.functions.time import timestamp
+
+class AccessionIndex(object):
+    """Persistent record of each assembly accession seen across runs
+
+    Each accession (without its version) maps to the latest version and WGS
+    set flatfile url returned by the search API, the date window it was last
+    updated in, the size and modification time of the local flatfile when it
+    was last submitted for processing, and its processing state.
+
+    Scanning an accession whose version or url differs from the recorded one
+    resets its state, marking it as changed. An accession is only skipped if
+    its processing has completed, and its local flatfile has the same size
+    and modification time as the recorded one. Lookups are by primary key,
+    so no status files need to be probed.
+
+    Jobs submitted to LSF report no result to the scheduler, so their state
+    is left InProgress when submitted. If a status store is given, such an
+    accession is marked Completed once its latest job in the store has
+    completed, otherwise it is processed again.
+
+    :param index_path: path to the SQLite database
+    :type index_path: str
+    """
+
+    NOT_ATTEMPTED = "NotAttempted"
+    COMPLETED = "Completed"
+
+    def __init__(self, index_path):
+        """Constructor method"""
+
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(index_path, timeout=60,
+            check_same_thread=False)
+        # may be on a shared filesystem with the processing directory, where
+        # only a rollback journal is safe
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute("PRAGMA busy_timeout=60000")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS accession ("
+            + "accession TEXT PRIMARY KEY, "
+            + "version INTEGER NOT NULL, "
+            + "url TEXT NOT NULL, "
+            + "last_updated TEXT, "
+            + "flatfile_size INTEGER, "
+            + "flatfile_mtime REAL, "
+            + "state TEXT NOT NULL, "
+            + "last_modified TEXT)"
+        )
+        self.connection.commit()
+
+    @classmethod
+    def from_config(cls, config_obj):
+        """Open the accession index described by a source config
+
+        :param config_obj: source config, as validated by ena_assembly.json
+        :type config_obj: dict
+        :return: accession index, or None if no index path is configured
+        :rtype: class:`AccessionIndex`
+        """
+
+        if not config_obj.get("accession_index"):
+            return None
+        return cls(config_obj["accession_index"])
+
+    def split_accession(self, accession):
+        """Split a versioned accession into its base accession and version
+
+        :param accession: versioned accession, e.g. GCA_000001405.28
+        :type accession: str
+        :return: base accession, and version (0 if unversioned)
+        :rtype: list
+        """
+
+        base, sep, version = accession.rpartition(".")
+        if sep and version.isdigit():
+            return [base, int(version)]
+        return [accession, 0]
+
+    def record_scanned(self, records, last_updated):
+        """Add or update accessions returned by the search API
+
+        :param records: versioned accession, and WGS set flatfile url
+        :type records: list[list[str]]
+        :param last_updated: date the accessions were last updated on
+        :type last_updated: str
+        """
+
+        rows = []
+        for accession, url in records:
+            base, version = self.split_accession(accession)
+            rows.append((base, version, url, last_updated, self.NOT_ATTEMPTED,
+                timestamp()))
+
+        # a new version or url resets the state, an older version is ignored
+        with self.lock:
+            self.connection.executemany(
+                "INSERT INTO accession (accession, version, url, "
+                + "last_updated, state, last_modified) "
+                + "VALUES (?, ?, ?, ?, ?, ?) "
+                + "ON CONFLICT (accession) DO UPDATE SET "
+                + "state = CASE WHEN excluded.version != version "
+                + "OR excluded.url != url THEN excluded.state ELSE state END, "
+                + "version = excluded.version, "
+                + "url = excluded.url, "
+                + "last_updated = excluded.last_updated, "
+                + "last_modified = excluded.last_modified "
+                + "WHERE excluded.version >= version",
+                rows
+            )
+            self.connection.commit()
+
+    def get(self, accession):
+        """Get the recorded entry for an accession
+
+        :param accession: versioned or unversioned accession
+        :type accession: str
+        :return: entry (accession, version, url, last_updated, flatfile_size,
+            flatfile_mtime, state, last_modified), or None if not recorded
+        :rtype: dict
+        """
+
+        base, version = self.split_accession(accession)
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT * FROM accession WHERE accession = ?", (base,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def needs_processing(self, accession, url, flatfile_path,
+        status_store=None):
+        """Check whether an accession's flatfile is new, has changed, or has
+        not yet been processed to completion
+
+        :param accession: versioned accession
+        :type accession: str
+        :param url: WGS set flatfile url
+        :type url: str
+        :param flatfile_path: path to the local copy of the flatfile
+        :type flatfile_path: str
+        :param status_store: status store, consulted for the final status of
+            a flatfile not recorded as completed
+        :type status_store: class:`StatusStore`, optional
+        :return: True if the flatfile should be (re)processed
+        :rtype: bool
+        """
+
+        entry = self.get(accession)
+        if entry is None:
+            return True
+        base, version = self.split_accession(accession)
+        if version > entry["version"] or url != entry["url"]:
+            return True
+        if entry["state"] != self.COMPLETED:
+            if status_store is None or status_store.get_latest_status(
+                accession, url) != self.COMPLETED:
+                return True
+            self.__record_completed(base)
+        size, mtime = self.__stat(flatfile_path)
+        return size != entry["flatfile_size"] \
+            or mtime != entry["flatfile_mtime"]
+
+    def record_state(self, accession, url, state, flatfile_path=None):
+        """Record the processing state of an accession
+
+        :param accession: versioned accession
+        :type accession: str
+        :param url: WGS set flatfile url
+        :type url: str
+        :param state: processing state, e.g. InProgress, Failed
+        :type state: str
+        :param flatfile_path: path to the local copy of the processed flatfile
+        :type flatfile_path: str, optional
+        """
+
+        base, version = self.split_accession(accession)
+        size, mtime = self.__stat(flatfile_path)
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO accession (accession, version, url, "
+                + "flatfile_size, flatfile_mtime, state, last_modified) "
+                + "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                + "ON CONFLICT (accession) DO UPDATE SET "
+                + "version = excluded.version, "
+                + "url = excluded.url, "
+                + "flatfile_size = excluded.flatfile_size, "
+                + "flatfile_mtime = excluded.flatfile_mtime, "
+                + "state = excluded.state, "
+                + "last_modified = excluded.last_modified",
+                (base, version, url, size, mtime, state, timestamp())
+            )
+            self.connection.commit()
+
+    def close(self):
+        """Close the database"""
+
+        with self.lock:
+            self.connection.close()
+
+    def __record_completed(self, base):
+        """Mark an accession as completed, keeping its recorded flatfile
+
+        :param base: unversioned accession
+        :type base: str
+        """
+
+        with self.lock:
+            self.connection.execute(
+                "UPDATE accession SET state = ?, last_modified = ? "
+                + "WHERE accession = ?", (self.COMPLETED, timestamp(), base))
+            self.connection.commit()
+
+    def __stat(self, file_path):
+        """Get the size and modification time of a file
+
+        :param file_path: path to the file
+        :type file_path: str
+        :return: size (bytes) and mtime, or None for both if not found
+        :rtype: list
+        """
+
+        if not file_path:
+            return [None, None]
+        try:
+            stat = os.stat(file_path)
+            return [stat.st_size, stat.st_mtime]
+        except OSError:
+            return [None, None]
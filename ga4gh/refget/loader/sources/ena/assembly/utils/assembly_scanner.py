@@ -1,27 +1,58 @@
 # -*- coding: utf-8 -*-
 """Defines AssemblyScanner class, uses ENA search API to find assemblies"""
 
+import concurrent.futures
 import datetime
 import logging
 import os
 import re
+import threading
 import requests
 from urllib.parse import urlencode, quote
-from xml.etree import ElementTree
+from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_xml_parser \
+    import iter_assembly_records
 
 class AssemblyScanner(object):
     """Builds list of all assemblies deployed to ENA on a specific date
 
     AssemblyScanner uses the ENA search API to search all assemblies made
     available on ENA on a specific date. The returned assembly XML is parsed 
-    for all accessions and ftp links, which are used to build a master list of 
-    accessions by date. The accessions list can be used as input to the 
-    ena-refget-processor.
+    incrementally as it is streamed, for all accessions and ftp links, which
+    are used to build a master list of accessions by date. The accessions list
+    can be used as input to the ena-refget-processor.
+
+    If a split threshold is set, the number of results for the date is
+    counted first. A date with more results than the threshold is split into
+    pages by offset and length. The search API filters last_updated by day
+    only, so the date cannot be split into smaller time windows. The pages
+    are requested in parallel, each retried on its own, and their records
+    merged in page order into one list, skipping any accession already
+    returned by an earlier page (e.g. if results shifted between requests).
+
+    Every request, including counts, holds one of the request slots while
+    it is in flight. Scanners of many dates share the same slots (and
+    session), so the number of requests in flight never exceeds
+    max_concurrency, or the session's connection pool, however many dates
+    and split requests are scanned at once.
 
     :param date_string: YYYY-MM-DD date string used to define search window
     :type date_string: str
     :param url: base url to ENA assembly search API
     :type url: str
+    :param session: HTTP session, shared between scanners to reuse connections
+    :type session: class:`requests.Session`
+    :param cache: on-disk cache of search responses
+    :type cache: class:`ResponseCache`
+    :param page: offset and length of the page of results to request
+    :type page: list[int]
+    :param split_threshold: result count above which the date is paged
+    :type split_threshold: int
+    :param max_concurrency: maximum number of concurrent split requests
+    :type max_concurrency: int
+    :param request_slots: limits in-flight requests, shared between scanners
+    :type request_slots: class:`threading.Semaphore`
+    :param accession_index: persistent index, updated with scanned records
+    :type accession_index: class:`AccessionIndex`
     :param query_template: url query string template
     :type query_template: str
     :param query: mature query string, modified from template with current date
@@ -29,16 +60,31 @@ class AssemblyScanner(object):
     :param chunk_size: size (bytes) of each chunk in response stream
     :type chunk_size: int
     """
+
+    DEFAULT_URL = "https://www.ebi.ac.uk/ena/data/warehouse/search"
+
+    FIRST_OFFSET = 1
+    MAX_ATTEMPTS = 3
     
-    def __init__(self, date_string):
+    def __init__(self, date_string, url=None, session=None, cache=None,
+        page=None, split_threshold=None, max_concurrency=1,
+        request_slots=None, accession_index=None):
         """Constructor method"""
 
         self.date_string = date_string
-        self.url = "https://www.ebi.ac.uk/ena/data/warehouse/search"
+        self.url = url if url else self.DEFAULT_URL
+        self.session = session if session else requests.Session()
+        self.cache = cache
+        self.page = page
+        self.split_threshold = split_threshold
+        self.max_concurrency = max_concurrency
+        self.request_slots = request_slots if request_slots \
+            else threading.BoundedSemaphore(max_concurrency)
+        self.accession_index = accession_index
         self.query_template = "last_updated>={current_date} AND " \
                               + "last_updated<{next_date}"
         self.query = self.__initialize_query()
-        self.chunk_size = 8192
+        self.chunk_size = 65536
     
     def get_params(self):
         """Get all data parameters for the search request
@@ -47,12 +93,16 @@ class AssemblyScanner(object):
         :rtype: dict[str, str]
         """
 
-        return {
+        params = {
             "result": "assembly",
             "query": self.query,
             "fields": "accession",
             "display": "xml"
         }
+        if self.page:
+            params["offset"] = str(self.page[0])
+            params["length"] = str(self.page[1])
+        return params
     
     def get_headers(self):
         """Get all headers for the search request
@@ -65,105 +115,212 @@ class AssemblyScanner(object):
             "Content-Type": "application/x-www-form-urlencoded"
         }
 
-    def make_request(self):
+    def make_request(self, extra_headers=None):
         """Execute request to the ENA search API
 
+        :param extra_headers: headers added to the defaults, e.g. validators
+        :type extra_headers: dict[str, str], optional
         :return: HTTP response from search request
         :rtype: class:`requests.models.Response`
         """
 
-        return requests.post(
+        headers = self.get_headers()
+        if extra_headers:
+            headers.update(extra_headers)
+        return self.session.post(
             self.url, 
             data=self.get_params(),
-            headers=self.get_headers(),
+            headers=headers,
             stream=True
         )
     
-    def assemblies_xml_generator(self):
-        """Generator function, yields the assembly xml of a single assembly
+    def assembly_records_generator(self):
+        """Generator function, yields the accession and url of each assembly
 
         This generator function makes a request to the ENA search API, and
-        streams the response body. As the body is streamed, each chunk is 
-        parsed for the presence of any complete assembly xml, thereby creating
-        an iterator, in which each element is an xml string for a single 
-        assembly.
+        streams the response body into an incremental XML parser, yielding
+        each assembly's accession and WGS set flatfile url as soon as its
+        closing tag has been received.
+
+        If the scanner has a response cache, a cached response is revalidated
+        with a conditional request, and read from disk if unchanged. A new
+        response is written to the cache as it is streamed.
 
         Yields:
-            (str): xml for a single assembly 
+            (list): accession, and WGS set flatfile url
         """
 
-        # make search API request, and iterate over response body by chunk size
-        response = self.make_request()
-        aggregate_chunk_string = ""
-        for chunk in response.iter_content(chunk_size=self.chunk_size):
-
-            # add the current chunk to any unused sections of the previous
-            # chunk
-            chunk_string = chunk.decode()
-            aggregate_chunk_string += chunk_string
-
-            # find all assembly start/end tags by regex
-            assembly_pattern = re.compile("<ASSEMBLY.+?</ASSEMBLY>", re.DOTALL)
-            assembly_iter = assembly_pattern.finditer(aggregate_chunk_string)
-
-            # yield each detected assembly
-            final_end_position = 0
-            for assembly_match in assembly_iter:
-                start = assembly_match.start()
-                end = assembly_match.end()
-                assembly_xml = assembly_match.string[start:end]
-                final_end_position = end
-                yield assembly_xml
-
-            # remove XML that has already been parsed and yielded from the 
-            # aggregated chunk string to prevent it from continuously growing,
-            # and to prevent assemblies from being yielded multiple times
-            aggregate_chunk_string = aggregate_chunk_string[final_end_position:]
-    
+        if self.split_threshold:
+            for record in self.split_records_generator():
+                yield record
+        else:
+            # the slot is held until the streamed response has been read
+            with self.request_slots:
+                records = iter_assembly_records(self.get_response_chunks())
+                for record in records:
+                    yield record
+
+    def get_result_count(self):
+        """Request the number of results in the search window
+
+        :return: number of assemblies matching the query
+        :rtype: int
+        """
+
+        with self.request_slots:
+            response = self.session.post(
+                self.url,
+                data={
+                    "result": "assembly",
+                    "query": self.query,
+                    "resultcount": ""
+                },
+                headers=self.get_headers()
+            )
+        response.raise_for_status()
+        match = re.search(r"([\d,]+)", response.text)
+        if not match:
+            raise Exception("unexpected result count response: "
+                + response.text[:200])
+        return int(match.group(1).replace(",", ""))
+
+    def plan_requests(self):
+        """Split the date's search into pages below the threshold
+
+        :return: scanners for each page, in page order
+        :rtype: list[class:`AssemblyScanner`]
+        """
+
+        count = self.get_result_count()
+        if count <= self.split_threshold:
+            return [self.__sub_scanner()] if count else []
+        return [self.__sub_scanner(page=[offset + self.FIRST_OFFSET,
+            self.split_threshold])
+            for offset in range(0, count, self.split_threshold)]
+
+    def split_records_generator(self):
+        """Generator function, yields records of all split requests
+
+        :return: accession, and WGS set flatfile url
+        :rtype: list
+        """
+
+        scanners = self.plan_requests()
+        logging.info("{} - search split into {} requests".format(
+            self.date_string, len(scanners)))
+
+        def fetch(scanner):
+            attempt = 1
+            while True:
+                try:
+                    return list(scanner.assembly_records_generator())
+                except Exception as e:
+                    if attempt >= self.MAX_ATTEMPTS:
+                        raise
+                    logging.warning(("{} - search request failed ({}), "
+                        + "retrying: {}").format(self.date_string,
+                        scanner.query, str(e)))
+                    attempt += 1
+
+        # requests are made in parallel, but their records are merged in
+        # page order, skipping accessions already seen in an earlier one
+        seen = set()
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_concurrency)
+        with executor:
+            for records in executor.map(fetch, scanners):
+                for accession, url in records:
+                    if accession not in seen:
+                        seen.add(accession)
+                        yield [accession, url]
+
+    def get_response_chunks(self):
+        """Get the search response body, from the cache or the search API
+
+        :return: response body, as an iterable of byte chunks
+        :rtype: iterable[bytes]
+        """
+
+        if not self.cache:
+            response = self.make_request()
+            response.raise_for_status()
+            return response.iter_content(chunk_size=self.chunk_size)
+
+        key = self.cache.get_key(self.url, self.get_params())
+        meta = self.cache.get(key)
+        if meta and meta["fresh"]:
+            logging.debug("{} - using cached search response".format(
+                self.date_string))
+            return self.cache.read(key, self.chunk_size)
+
+        extra_headers = self.cache.get_conditional_headers(meta) if meta else {}
+        response = self.make_request(extra_headers=extra_headers)
+        if meta and response.status_code == 304:
+            logging.debug("{} - search response not modified".format(
+                self.date_string))
+            response.close()
+            return self.cache.read(key, self.chunk_size)
+
+        response.raise_for_status()
+        return self.cache.store(key,
+            response.iter_content(chunk_size=self.chunk_size),
+            response.headers)
+
     def generate_accession_list(self, file_path):
         """Writes assembly accessions to list file
 
+        The list is written to a temporary file, which is renamed to the
+        output path only once the whole search response has been parsed, so
+        an interrupted scan never leaves a partial list at the output path.
+        If an accession index is set, it is updated with the scanned records
+        once the list is complete.
+
         :param file_path: path to write output file
         :type file_path: str
         """
 
-        # open the new file and write list header
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        output_file = open(file_path, "a")
+        # open a temporary file and write list header
+        tmp_path = file_path + ".tmp"
+        output_file = open(tmp_path, "w")
         header = "\t".join(
             ["Accession", "URL"])+"\n"
         output_file.write(header)
 
-        # runs the generator
-        for assembly_xml in self.assemblies_xml_generator():
-            accession = None
-            url = None
-            status = "NotAttempted"
-            message = "N/A"
-            last_modified = datetime.datetime.now().strftime(
-                "%Y-%m-%dT%H:%M:%S")
-
-            # for each assembly, load the XML as a tree, get the accession id,
-            # as well as the flatfile ftp url
-            # add these as a new line in the list
-            root = ElementTree.fromstring(assembly_xml)
-            accession = re.compile(
-                'accession=\"(.+?)\"').search(assembly_xml).group(1)
-            for assembly_links in root.iter("ASSEMBLY_LINKS"):
-                for assembly_link in assembly_links.iter("ASSEMBLY_LINK"):
-                    for url_link in assembly_link.iter("URL_LINK"):
-                        label = url_link.find("LABEL").text
-                        if label == "WGS_SET_FLATFILE":
-                            url = url_link.find("URL").text
-            
-            if accession and url:
+        # runs the generator, adding each accession and flatfile url as a new
+        # line in the list
+        records = []
+        try:
+            for accession, url in self.assembly_records_generator():
                 output_line = "\t".join(
                     [accession, url]
                 ) + "\n"
                 output_file.write(output_line)
-        output_file.close()
+                if self.accession_index:
+                    records.append([accession, url])
+            output_file.close()
+            if self.accession_index:
+                self.accession_index.record_scanned(records, self.date_string)
+            os.replace(tmp_path, file_path)
+        finally:
+            if not output_file.closed:
+                output_file.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
+    def __sub_scanner(self, page=None):
+        """Create a scanner for a page of this scanner's results
+
+        :param page: offset and length of the page of results
+        :type page: list[int], optional
+        :return: scanner for the page
+        :rtype: class:`AssemblyScanner`
+        """
+
+        return AssemblyScanner(self.date_string, url=self.url,
+            session=self.session, cache=self.cache, page=page,
+            max_concurrency=self.max_concurrency,
+            request_slots=self.request_slots)
+
     def __initialize_query(self):
         """Format the query string template with date string of interest
 
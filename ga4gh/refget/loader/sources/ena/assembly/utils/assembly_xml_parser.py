@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Incremental parsing of ENA assembly search API XML responses"""
+
+from xml.etree import ElementTree
+
+FLATFILE_LABEL = "WGS_SET_FLATFILE"
+
+def iter_assembly_records(chunks):
+    """Generator function, yields accession and flatfile url of each assembly
+
+    Bytes are fed to a pull parser as they arrive, and each assembly's
+    accession and WGS set flatfile url are read from parser events, so the
+    response is parsed exactly once and never accumulated as a string.
+    Each assembly element is cleared once it has been read, keeping memory
+    use constant regardless of response size. Assemblies without a WGS set
+    flatfile link are skipped.
+
+    :param chunks: response body, as an iterable of byte chunks
+    :type chunks: iterable[bytes]
+
+    Yields:
+        (list): accession, and WGS set flatfile url
+    """
+
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = None
+    accession = None
+    url = None
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                elif element.tag == "ASSEMBLY":
+                    accession = element.get("accession")
+                    url = None
+
+            elif element.tag == "URL_LINK":
+                if element.findtext("LABEL") == FLATFILE_LABEL:
+                    url = element.findtext("URL")
+
+            elif element.tag == "ASSEMBLY":
+                if accession and url:
+                    yield [accession, url]
+                accession = None
+                url = None
+                root.clear()
+
+    # an empty response contains no assemblies, otherwise closing the parser
+    # raises an error if the response was truncated
+    if root is not None:
+        parser.close()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Plans flatfile jobs by size, packing small flatfiles into shared jobs"""
+
+import os
+from ga4gh.refget.loader.sources.ena.assembly.process_flatfile import \
+    write_cmd_and_bsub
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    FlatfileExecutor, SHARD_ENV
+
+class FlatfilePlanner(object):
+    """Orders flatfiles largest first, and packs small flatfiles into batches
+
+    Each flatfile is stat'ed once. Flatfiles are ordered by size, largest
+    first, so that the longest jobs start first rather than setting the tail
+    of the run. If a target is set, flatfiles smaller than the target are
+    packed into batches of up to target_bytes (first fit, in decreasing
+    size), each run as a single job, so that many small flatfiles do not each
+    pay a job's overhead. Batches are dispatched in decreasing total size.
+
+    :param target_bytes: target size of a batch, or None to not pack
+    :type target_bytes: int
+    """
+
+    def __init__(self, target_bytes=None):
+        """Constructor method"""
+
+        self.target_bytes = target_bytes
+
+    def plan(self, flatfiles):
+        """Plan the jobs for a list of flatfiles
+
+        :param flatfiles: accession, url, and local path of each flatfile
+        :type flatfiles: list[list[str]]
+        :return: batches in dispatch order, each a list of accession, url,
+            local path, and size of its flatfiles
+        :rtype: list[list[list]]
+        """
+
+        sized = []
+        for accession, url, flatfile_path in flatfiles:
+            try:
+                size = os.path.getsize(flatfile_path)
+            except OSError:
+                # missing flatfiles are failed when submitted
+                size = 0
+            sized.append([accession, url, flatfile_path, size])
+        sized.sort(key=lambda f: f[3], reverse=True)
+
+        if not self.target_bytes:
+            return [[f] for f in sized]
+
+        batches = []
+        batch_sizes = []
+        for flatfile in sized:
+            for i in range(len(batches)):
+                if batch_sizes[i] + flatfile[3] <= self.target_bytes:
+                    batches[i].append(flatfile)
+                    batch_sizes[i] += flatfile[3]
+                    break
+            else:
+                batches.append([flatfile])
+                batch_sizes.append(flatfile[3])
+
+        # a first fit batch's total can exceed the batches opened before it
+        order = sorted(range(len(batches)), key=lambda i: batch_sizes[i],
+            reverse=True)
+        return [batches[i] for i in order]
+
+    def summarize(self, batches):
+        """Describe a plan
+
+        :param batches: batches in dispatch order, as returned by plan
+        :type batches: list[list[list]]
+        :return: plan summary
+        :rtype: str
+        """
+
+        n_flatfiles = sum([len(b) for b in batches])
+        total_bytes = sum([f[3] for b in batches for f in b])
+        packed = [b for b in batches if len(b) > 1]
+        lines = ["plan: {} flatfiles ({}) in {} jobs".format(n_flatfiles,
+            format_bytes(total_bytes), len(batches))]
+        if self.target_bytes:
+            lines.append("  {} jobs pack {} flatfiles, up to {} each, {} jobs "
+                .format(len(packed), sum([len(b) for b in packed]),
+                format_bytes(self.target_bytes), len(batches) - len(packed))
+                + "have a single flatfile")
+        if batches:
+            lines.append("  first job: {} ({}), last job: {} ({})".format(
+                get_batch_label(batches[0]),
+                format_bytes(sum([f[3] for f in batches[0]])),
+                get_batch_label(batches[-1]),
+                format_bytes(sum([f[3] for f in batches[-1]]))))
+        return "\n".join(lines)
+
+def format_bytes(n_bytes):
+    """Format a number of bytes for display
+
+    :param n_bytes: number of bytes
+    :type n_bytes: int
+    :return: size in the largest unit that is at least 1, e.g. 1.5 GB
+    :rtype: str
+    """
+
+    for unit, size in [["TB", 1e12], ["GB", 1e9], ["MB", 1e6], ["KB", 1e3]]:
+        if n_bytes >= size:
+            return "{:.1f} {}".format(n_bytes / size, unit)
+    return "{:.0f} B".format(n_bytes)
+
+def get_batch_label(batch):
+    """Get a short description of a batch's flatfiles
+
+    :param batch: accession, url, local path, and size of each flatfile
+    :type batch: list[list]
+    :return: accession of a single flatfile, or the number of flatfiles
+    :rtype: str
+    """
+
+    if len(batch) == 1:
+        return batch[0][0]
+    return "{} flatfiles".format(len(batch))
+
+class FlatfileBatch(FlatfileExecutor):
+    """Collects flatfiles whose jobs are run together as a single job
+
+    The batch is passed to process_flatfile in place of an executor, so that
+    each flatfile's stage command files are written as usual, but not
+    submitted. write then writes the batch's own stage command files, each
+    running that stage for every flatfile in turn, appending to the
+    flatfile's own logs. A flatfile whose stage fails is recorded in the
+    batch's failures file, and skipped by later stages, without stopping the
+    other flatfiles. The batch itself is submitted to the executor.
+
+    :param batch_id: unique id of the batch's jobs
+    :type batch_id: str
+    :param batch_dir: directory to write the batch's command files and logs
+    :type batch_dir: str
+    :param members: job id, command dir, and log dir of each flatfile
+    :type members: list[list[str]]
+    """
+
+    FAILURES_FILENAME = "failed.tsv"
+
+    def __init__(self, batch_id, batch_dir, stages=None, stage_tasks=None):
+        """Constructor method"""
+
+        super(FlatfileBatch, self).__init__(stages=stages,
+            stage_tasks=stage_tasks)
+        self.batch_id = batch_id
+        self.batch_dir = batch_dir
+        self.cmd_dir = os.path.join(batch_dir, "cmd")
+        self.log_dir = os.path.join(batch_dir, "log")
+        self.failures_file = os.path.join(batch_dir, self.FAILURES_FILENAME)
+        self.members = []
+
+    def __len__(self):
+        """Get the number of flatfiles in the batch
+
+        :return: number of flatfiles
+        :rtype: int
+        """
+
+        return len(self.members)
+
+    def submit(self, job_id, cmd_dir, log_dir):
+        """Add a flatfile whose stage command files have been written
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+        self.members.append([job_id, cmd_dir, log_dir])
+
+    def write(self):
+        """Write the batch's stage command files, each waiting on the
+        previous stage of the batch"""
+
+        for d in [self.cmd_dir, self.log_dir]:
+            if not os.path.exists(d):
+                os.makedirs(d)
+        if os.path.exists(self.failures_file):
+            os.remove(self.failures_file)
+
+        hold_jobname = None
+        for stage in self.stages:
+            # each task of a split stage writes to its own member logs
+            log_name = "{}.$1".format(stage)
+            if self.get_n_tasks(stage) > 1:
+                log_name += ".${{{}:-$LSB_JOBINDEX}}".format(SHARD_ENV)
+            lines = [
+                "failed=" + self.failures_file,
+                "run_member() {",
+                "    grep -q \"^$1\t\" \"$failed\" 2>/dev/null && return 0",
+                "    /bin/sh \"$2/{}.sh\" >> \"$3/{}.log.out\" ".format(
+                    stage, log_name)
+                    + "2>> \"$3/{}.log.err\" \\".format(log_name),
+                "        || printf '%s\\t%s\\n' \"$1\" \"{}\" >> \"$failed\""
+                    .format(stage),
+                "}"
+            ]
+            for job_id, cmd_dir, log_dir in self.members:
+                lines.append("run_member {} {} {}".format(job_id, cmd_dir,
+                    log_dir))
+            write_cmd_and_bsub("\n".join(lines), self.cmd_dir, self.log_dir,
+                stage, self.batch_id, hold_jobname=hold_jobname,
+                n_tasks=self.get_n_tasks(stage))
+            hold_jobname = "{}.{}".format(stage, self.batch_id)
+
+    def get_results(self, status, message):
+        """Get the outcome of each flatfile, from the outcome of the batch
+
+        :param status: final status of the batch
+        :type status: str
+        :param message: error message of the batch
+        :type message: str
+        :return: job id -> final status and message, for each flatfile
+        :rtype: dict[str, list[str]]
+        """
+
+        results = {m[0]: [status, message] for m in self.members}
+        if os.path.exists(self.failures_file):
+            for line in open(self.failures_file, "r"):
+                ls = line.rstrip("\n").split("\t")
+                if len(ls) == 2 and ls[0] in results:
+                    results[ls[0]] = ["Failed", "{} stage failed in batch {}"
+                        .format(ls[1], self.batch_id)]
+        return results
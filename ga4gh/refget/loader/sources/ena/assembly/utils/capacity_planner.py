@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Estimates the sequences, uploads and wall time of a run before it starts"""
+
+import heapq
+import os
+from ga4gh.refget.loader.sources.ena.assembly.utils.batch_planner import \
+    format_bytes
+
+# a sequence and its metadata, and a trunc512 and md5 redirect to each
+PUTS_PER_SEQUENCE = 6
+# the flatfile's full csv
+PUTS_PER_FLATFILE = 1
+
+class CapacityPlanner(object):
+    """Estimates the work of a run from flatfile sizes and earlier throughput
+
+    Dates are added with their planned jobs, as planned by FlatfilePlanner.
+    Sequences are estimated from input bytes, at the number of sequences per
+    flatfile byte recorded by earlier runs, and S3 PUTs from sequences. Wall
+    time is projected from the recorded processing rate (seconds per flatfile
+    byte) and upload rate (seconds per object), by dispatching each date's
+    jobs in order to the given number of concurrent slots, the dates running
+    one after another as they do in a run.
+
+    :param throughput: stage -> number of jobs, input bytes, sequences,
+        objects and seconds, recorded by earlier runs
+    :type throughput: dict[str, dict]
+    :param fused: flatfiles are processed and uploaded by a single job
+    :type fused: bool
+    :param upload_shards: number of parallel tasks of each upload
+    :type upload_shards: int
+    :param dates: date, planned jobs, number of unchanged and of missing
+        flatfiles, of each date
+    :type dates: list[list]
+    """
+
+    def __init__(self, throughput, fused=False, upload_shards=1):
+        """Constructor method"""
+
+        self.throughput = throughput
+        self.fused = fused
+        self.upload_shards = upload_shards
+        self.dates = []
+
+        # sequences per byte are recorded by the manifest stage, or the
+        # fused stage, whichever processor was used
+        self.sequences_per_byte = None
+        for stage in ["manifest", "fused"]:
+            self.sequences_per_byte = self.__get_rate(stage, "sequences",
+                "input_bytes")
+            if self.sequences_per_byte is not None:
+                break
+
+        self.seconds_per_byte = self.__get_rate(
+            "fused" if fused else "process", "seconds", "input_bytes")
+        self.seconds_per_object = 0.0 if fused \
+            else self.__get_rate("upload", "seconds", "objects")
+
+    def add_date(self, date_string, batches, n_unchanged=0):
+        """Add a date's planned jobs
+
+        :param date_string: YYYY-MM-DD date
+        :type date_string: str
+        :param batches: planned jobs, each a list of accession, url, local
+            path, and size of its flatfiles
+        :type batches: list[list[list]]
+        :param n_unchanged: number of flatfiles skipped as unchanged
+        :type n_unchanged: int
+        """
+
+        n_missing = len([f for b in batches for f in b
+            if not os.path.exists(f[2])])
+        self.dates.append([date_string, batches, n_unchanged, n_missing])
+
+    def estimate_sequences(self, n_bytes):
+        """Estimate the number of sequences in flatfiles
+
+        :param n_bytes: total size of the flatfiles
+        :type n_bytes: int
+        :return: estimated sequences, or None if no rate has been recorded
+        :rtype: int
+        """
+
+        if self.sequences_per_byte is None:
+            return None
+        return int(round(n_bytes * self.sequences_per_byte))
+
+    def estimate_seconds(self, n_bytes):
+        """Estimate the wall time of a single flatfile's jobs
+
+        :param n_bytes: size of the flatfile
+        :type n_bytes: int
+        :return: estimated seconds, or None if a rate has not been recorded
+        :rtype: float
+        """
+
+        if self.seconds_per_byte is None or self.seconds_per_object is None \
+            or self.sequences_per_byte is None:
+            return None
+        n_puts = self.estimate_sequences(n_bytes) * PUTS_PER_SEQUENCE \
+            + PUTS_PER_FLATFILE
+        return n_bytes * self.seconds_per_byte \
+            + n_puts * self.seconds_per_object / self.upload_shards
+
+    def project(self, concurrency):
+        """Project the wall time of the run
+
+        :param concurrency: number of jobs run at once
+        :type concurrency: int
+        :return: projected seconds, or None if a rate has not been recorded
+        :rtype: float
+        """
+
+        total = 0.0
+        for date_string, batches, n_unchanged, n_missing in self.dates:
+            # each job starts on the first free slot, in dispatch order
+            slots = [0.0] * min(concurrency, max(len(batches), 1))
+            for batch in batches:
+                seconds = self.estimate_seconds(sum([f[3] for f in batch]))
+                if seconds is None:
+                    return None
+                heapq.heappush(slots, heapq.heappop(slots) + seconds)
+            total += max(slots)
+        return total
+
+    def report(self, concurrency):
+        """Describe the estimated work of the run
+
+        :param concurrency: number of jobs run at once
+        :type concurrency: int
+        :return: report lines
+        :rtype: list[str]
+        """
+
+        batches = [b for d in self.dates for b in d[1]]
+        n_flatfiles = sum([len(b) for b in batches])
+        n_bytes = sum([f[3] for b in batches for f in b])
+        n_unchanged = sum([d[2] for d in self.dates])
+        n_missing = sum([d[3] for d in self.dates])
+
+        lines = []
+        if self.dates:
+            lines.append("dates: {} to {} ({} dates)".format(
+                self.dates[0][0], self.dates[-1][0], len(self.dates)))
+        lines.append("flatfiles: {} to process in {} jobs, {} unchanged since "
+            .format(n_flatfiles, len(batches), n_unchanged)
+            + "last processed, {} not found locally".format(n_missing))
+        lines.append("input: " + format_bytes(n_bytes))
+
+        n_sequences = self.estimate_sequences(n_bytes)
+        if n_sequences is None:
+            lines.append("sequences: unknown, no earlier run has recorded "
+                + "sequences per flatfile byte")
+            lines.append("S3 PUTs: {} per sequence, {} per flatfile".format(
+                PUTS_PER_SEQUENCE, PUTS_PER_FLATFILE))
+        else:
+            lines.append("sequences: ~{:,} ({:.3g} per KB, over {} earlier "
+                .format(n_sequences, self.sequences_per_byte * 1000,
+                self.__get_jobs("manifest", "fused")) + "flatfiles)")
+            n_puts = n_sequences * PUTS_PER_SEQUENCE \
+                + n_flatfiles * PUTS_PER_FLATFILE
+            lines.append("S3 PUTs: ~{:,} ({:,} sequence and metadata objects, "
+                .format(n_puts, n_sequences * 2) + "{:,} redirects, {:,} csvs)"
+                .format(n_sequences * (PUTS_PER_SEQUENCE - 2),
+                n_flatfiles * PUTS_PER_FLATFILE))
+
+        seconds = self.project(concurrency)
+        if seconds is None:
+            missing = [name for name, rate in [
+                ["sequences per byte", self.sequences_per_byte],
+                ["processing", self.seconds_per_byte],
+                ["upload", self.seconds_per_object]] if rate is None]
+            lines.append("wall time: unknown, no earlier run has recorded "
+                + "{} throughput".format(", ".join(missing)))
+        else:
+            rates = ["{} {}/s per job".format(
+                "processing and upload" if self.fused else "processing",
+                format_bytes(1 / self.seconds_per_byte
+                    if self.seconds_per_byte else 0))]
+            if not self.fused:
+                rates.append("upload {:.0f} objects/s per task".format(
+                    1 / self.seconds_per_object
+                    if self.seconds_per_object else 0))
+            lines.append("wall time: ~{} at concurrency {} ({})".format(
+                format_seconds(seconds), concurrency, ", ".join(rates)))
+        return lines
+
+    def __get_rate(self, stage, numerator, denominator):
+        """Get a rate recorded by earlier runs of a stage
+
+        :param stage: stage name
+        :type stage: str
+        :param numerator: recorded total, e.g. seconds
+        :type numerator: str
+        :param denominator: recorded total, e.g. input_bytes
+        :type denominator: str
+        :return: numerator per denominator, or None if not recorded
+        :rtype: float
+        """
+
+        totals = self.throughput.get(stage)
+        if not totals or not totals[denominator]:
+            return None
+        return float(totals[numerator] or 0) / totals[denominator]
+
+    def __get_jobs(self, *stages):
+        """Get the number of jobs that recorded throughput for stages
+
+        :param stages: stage names
+        :type stages: str
+        :return: number of jobs of the first stage recorded
+        :rtype: int
+        """
+
+        for stage in stages:
+            if stage in self.throughput:
+                return self.throughput[stage]["jobs"]
+        return 0
+
+def format_seconds(seconds):
+    """Format a duration for display
+
+    :param seconds: duration in seconds
+    :type seconds: float
+    :return: duration in days, hours and minutes, e.g. 1d 2h 5m
+    :rtype: str
+    """
+
+    minutes = int(round(seconds / 60))
+    if minutes == 0:
+        return "{:.0f}s".format(seconds)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if days:
+        parts.append("{}d".format(days))
+    if days or hours:
+        parts.append("{}h".format(hours))
+    parts.append("{}m".format(minutes))
+    return " ".join(parts)
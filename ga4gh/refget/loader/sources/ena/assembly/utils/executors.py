@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""Executors run the process, manifest and upload stages of flatfiles"""
+
+import abc
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from ga4gh.refget.loader.sources.ena.assembly.functions.time import timestamp
+from ga4gh.refget.loader.sources.ena.assembly.utils.job_array import \
+    LsfJobArray
+
+STAGES = ["process", "manifest", "upload"]
+# in fused mode, the process stage uploads each sequence as it is processed
+FUSED_STAGES = ["process"]
+# environment variable giving a stage task its shard number, from 1
+SHARD_ENV = "REFGET_LOADER_SHARD"
+
+class FlatfileExecutor(abc.ABC):
+    """Abstract base class of executors, which run each flatfile's stages in
+    order
+
+    process_flatfile writes a command file for each stage (process.sh,
+    manifest.sh, upload.sh) to the flatfile's command directory, then
+    submits the flatfile to the executor. Once all of a date's flatfiles have
+    been submitted, finish is called, returning the outcome of any flatfile
+    whose stages have completed or could not be submitted.
+
+    A stage may be split into several tasks (e.g. the upload of each shard
+    of a flatfile's manifest), which run in parallel, each with its shard
+    number in the REFGET_LOADER_SHARD environment variable. The next stage
+    waits for all of them.
+
+    If a staging manager is given, executors that start flatfiles one at a
+    time hold back new flatfiles while too many bytes are staged for upload.
+
+    :param stages: names of the stages run for each flatfile, in order
+    :type stages: list[str]
+    :param stage_tasks: stage name -> number of parallel tasks, if not 1
+    :type stage_tasks: dict[str, int]
+    :param staging: pauses new processing while too many bytes are staged
+    :type staging: class:`StagingManager`
+    """
+
+    def __init__(self, stages=None, stage_tasks=None, staging=None):
+        """Constructor method"""
+
+        self.stages = stages if stages else STAGES
+        self.stage_tasks = stage_tasks if stage_tasks else {}
+        self.staging = staging
+
+    def get_n_tasks(self, stage):
+        """Get the number of parallel tasks a stage is split into
+
+        :param stage: stage name
+        :type stage: str
+        :return: number of tasks
+        :rtype: int
+        """
+
+        return self.stage_tasks.get(stage, 1)
+
+    @abc.abstractmethod
+    def submit(self, job_id, cmd_dir, log_dir):
+        """Submit a flatfile whose stage command files have been written
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+    def finish(self):
+        """Wait for or submit outstanding work
+
+        :return: job id -> final status and message, for each flatfile whose
+            outcome is known
+        :rtype: dict[str, list[str]]
+        """
+
+        return {}
+
+class LsfJobExecutor(FlatfileExecutor):
+    """Submits three LSF jobs per flatfile, each waiting on the previous
+
+    While too many bytes are staged, submission blocks until earlier
+    flatfiles' uploads have drained them.
+    """
+
+    def submit(self, job_id, cmd_dir, log_dir):
+        """Run the bsub file of each stage
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage bsub files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+        if self.staging:
+            self.staging.wait()
+        for stage in self.stages:
+            os.system(os.path.join(cmd_dir, stage + ".bsub"))
+
+class LsfArrayExecutor(FlatfileExecutor):
+    """Submits one LSF job array per stage for all flatfiles of a date
+
+    :param stages: names of the stages run for each flatfile, in order
+    :type stages: list[str]
+    :param job_array: job arrays that flatfiles are added to
+    :type job_array: class:`LsfJobArray`
+    """
+
+    def __init__(self, name, array_dir, max_size=None, stages=None,
+        stage_tasks=None):
+        """Constructor method"""
+
+        super(LsfArrayExecutor, self).__init__(stages=stages,
+            stage_tasks=stage_tasks)
+        self.job_array = LsfJobArray(name, array_dir, max_size=max_size,
+            stages=self.stages, stage_tasks=self.stage_tasks)
+
+    def submit(self, job_id, cmd_dir, log_dir):
+        """Add the flatfile to the job arrays
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+        self.job_array.add(job_id, cmd_dir, log_dir)
+
+    def finish(self):
+        """Submit the job arrays
+
+        :return: job id -> Failed status and message for every flatfile, if
+            the arrays could not be submitted, otherwise empty
+        :rtype: dict[str, list[str]]
+        """
+
+        try:
+            self.job_array.submit()
+        except Exception as e:
+            logging.error("job array submission failed: " + str(e))
+            return {job[0]: ["Failed", str(e)] for job in self.job_array.jobs}
+        return {}
+
+class LocalExecutor(FlatfileExecutor):
+    """Runs stages as local subprocesses, without a batch scheduler
+
+    A fixed number of worker threads each run one stage subprocess at a time,
+    so at most max_workers stage processes run at once. A flatfile's next
+    stage is queued when its previous stage exits successfully, and queued
+    later stages are run before earlier ones, so flatfiles are carried
+    through to upload as soon as possible while processing of other
+    flatfiles continues. A stage that exits with a non-zero code fails its
+    flatfile, and the flatfile's later stages are not run. The tasks of a
+    stage split into several tasks are queued together, and the flatfile
+    moves on once all have exited.
+
+    While too many bytes are staged, a worker that takes a flatfile's first
+    stage from the queue puts it back and waits a poll interval, leaving
+    workers free to run the later stages that drain the staged bytes (or, in
+    fused mode, the first stages already running). If nothing that drains
+    them is queued or running, the first stage is run anyway.
+
+    :param max_workers: maximum number of concurrent stage processes
+    :type max_workers: int
+    :param stages: names of the stages run for each flatfile, in order
+    :type stages: list[str]
+    :param queue: priority, submission order, and job of each queued stage
+    :type queue: class:`queue.PriorityQueue`
+    :param results: job id -> final status and message
+    :type results: dict[str, list[str]]
+    :param pending: job id -> number of unfinished tasks of its current
+        stage, and error messages of its failed tasks
+    :type pending: dict[str, list]
+    :param n_draining: number of queued or running tasks of later stages,
+        or running tasks of the only stage in fused mode
+    :type n_draining: int
+    """
+
+    def __init__(self, max_workers=None, stages=None, stage_tasks=None,
+        staging=None):
+        """Constructor method"""
+
+        super(LocalExecutor, self).__init__(stages=stages,
+            stage_tasks=stage_tasks, staging=staging)
+        self.max_workers = max_workers if max_workers else os.cpu_count()
+        self.queue = queue.PriorityQueue()
+        self.results = {}
+        self.pending = {}
+        self.n_submitted = 0
+        self.n_draining = 0
+        self.lock = threading.Lock()
+        self.workers = []
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self.__work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, job_id, cmd_dir, log_dir):
+        """Queue the first stage of a flatfile
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+        with self.lock:
+            self.n_submitted += 1
+            order = self.n_submitted
+        self.__put_stage(order, 0, job_id, cmd_dir, log_dir)
+
+    def finish(self):
+        """Wait until every submitted flatfile has completed or failed
+
+        :return: job id -> final status and message, for every flatfile
+        :rtype: dict[str, list[str]]
+        """
+
+        self.queue.join()
+        for worker in self.workers:
+            self.queue.put((1, 0, None))
+        for worker in self.workers:
+            worker.join()
+        return self.results
+
+    def run_stage(self, stage, job_id, cmd_dir, log_dir, shard=None):
+        """Run a single stage, or stage task, of a flatfile, appending to its
+        logs
+
+        :param stage: stage name, one of process, manifest, upload
+        :type stage: str
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        :param shard: shard number of the task, if the stage is split
+        :type shard: int, optional
+        :return: exit code of the stage process
+        :rtype: int
+        """
+
+        job_name = "{}.{}".format(stage, job_id)
+        env = None
+        if shard is not None:
+            job_name += ".{}".format(shard)
+            env = dict(os.environ)
+            env[SHARD_ENV] = str(shard)
+        cmd_file = os.path.join(cmd_dir, stage + ".sh")
+        with open(os.path.join(log_dir, job_name + ".log.out"), "a") as out, \
+            open(os.path.join(log_dir, job_name + ".log.err"), "a") as err:
+            return subprocess.call(["/bin/sh", cmd_file], stdout=out,
+                stderr=err, env=env)
+
+    def __put_stage(self, order, stage_index, job_id, cmd_dir, log_dir):
+        """Queue each task of a flatfile's stage, later stages are given a
+        higher priority
+
+        :param order: submission order of the flatfile
+        :type order: int
+        :param stage_index: index of the stage
+        :type stage_index: int
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+        n_tasks = self.get_n_tasks(self.stages[stage_index])
+        shards = [None] if n_tasks == 1 else range(1, n_tasks + 1)
+        with self.lock:
+            self.pending[job_id] = [n_tasks, []]
+            if stage_index > 0:
+                self.n_draining += n_tasks
+        for shard in shards:
+            self.queue.put((-stage_index, order,
+                [stage_index, job_id, cmd_dir, log_dir, shard]))
+
+    def __finish_task(self, job_id, error):
+        """Record that a task of a flatfile's current stage has exited
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param error: error message if the task failed, otherwise None
+        :type error: str
+        :return: None if other tasks of the stage are unfinished, otherwise
+            the error messages of all failed tasks of the stage
+        :rtype: list[str]
+        """
+
+        with self.lock:
+            pending = self.pending[job_id]
+            pending[0] -= 1
+            if error:
+                pending[1].append(error)
+            if pending[0] > 0:
+                return None
+            del self.pending[job_id]
+            return pending[1]
+
+    def __hold_back(self):
+        """Check whether a flatfile's first stage should wait for staged
+        bytes to drain
+
+        :return: True if too many bytes are staged, and later stages that
+            would drain them are queued or running
+        :rtype: bool
+        """
+
+        if not self.staging:
+            return False
+        with self.lock:
+            n_draining = self.n_draining
+        return n_draining > 0 and self.staging.is_paused()
+
+    def __work(self):
+        """Worker thread, runs queued stages until a stop item is queued"""
+
+        while True:
+            priority, order, job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+
+            stage_index, job_id, cmd_dir, log_dir, shard = job
+            stage = self.stages[stage_index]
+            if stage_index == 0 and self.__hold_back():
+                self.queue.put((priority, order, job))
+                self.queue.task_done()
+                time.sleep(self.staging.poll_interval)
+                continue
+            drains = stage_index > 0 or len(self.stages) == 1
+            if drains and stage_index == 0:
+                with self.lock:
+                    self.n_draining += 1
+            try:
+                error = None
+                try:
+                    exit_code = self.run_stage(stage, job_id, cmd_dir,
+                        log_dir, shard=shard)
+                    if exit_code != 0:
+                        error = "{} stage{} exited with code {}".format(
+                            stage, "" if shard is None
+                            else " shard {}".format(shard), exit_code)
+                except Exception as e:
+                    error = str(e)
+
+                # the flatfile moves on once every task of the stage exits
+                if drains:
+                    with self.lock:
+                        self.n_draining -= 1
+                errors = self.__finish_task(job_id, error)
+                if errors is None:
+                    continue
+                if errors:
+                    raise Exception(errors[0] if len(errors) == 1
+                        else "{} of {} {} tasks failed: {}".format(
+                            len(errors), self.get_n_tasks(stage), stage,
+                            errors[0]))
+                if stage_index + 1 < len(self.stages):
+                    self.__put_stage(order, stage_index + 1, job_id, cmd_dir,
+                        log_dir)
+                else:
+                    self.results[job_id] = ["Completed", "None"]
+                    logging.debug("{} - all stages completed at {}".format(
+                        job_id, timestamp()))
+            except Exception as e:
+                self.results[job_id] = ["Failed", str(e)]
+                logging.error("{} - {}".format(job_id, str(e)))
+            finally:
+                self.queue.task_done()
+
+def get_stages(config_obj):
+    """Get the stages run for each flatfile, according to a source config
+
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :return: stage names, in order
+    :rtype: list[str]
+    """
+
+    if config_obj.get("fused_upload"):
+        return FUSED_STAGES
+    return STAGES
+
+def get_upload_shards(config_obj):
+    """Get the number of shards each flatfile's upload is split into
+
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :return: number of upload shards, 1 if the upload is not split
+    :rtype: int
+    """
+
+    if config_obj.get("fused_upload"):
+        return 1
+    return config_obj.get("upload_shards", 1)
+
+def get_stage_tasks(config_obj):
+    """Get the number of parallel tasks of each split stage
+
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :return: stage name -> number of tasks, for stages split into tasks
+    :rtype: dict[str, int]
+    """
+
+    n_shards = get_upload_shards(config_obj)
+    return {"upload": n_shards} if n_shards > 1 else {}
+
+EXECUTORS = {
+    "job": lambda config_obj, name, processing_dir, staging: LsfJobExecutor(
+        stages=get_stages(config_obj),
+        stage_tasks=get_stage_tasks(config_obj),
+        staging=staging),
+    "array": lambda config_obj, name, processing_dir, staging:
+        LsfArrayExecutor(name, os.path.join(processing_dir, "arrays"),
+        max_size=config_obj.get("array_max_size"),
+        stages=get_stages(config_obj),
+        stage_tasks=get_stage_tasks(config_obj)),
+    "local": lambda config_obj, name, processing_dir, staging: LocalExecutor(
+        max_workers=config_obj.get("local_concurrency"),
+        stages=get_stages(config_obj),
+        stage_tasks=get_stage_tasks(config_obj),
+        staging=staging)
+}
+
+def get_executor(config_obj, name, processing_dir, staging=None):
+    """Create the executor selected by a source config's submission_mode
+
+    :param config_obj: source config, as validated by ena_assembly.json
+    :type config_obj: dict
+    :param name: unique name for this date's submission
+    :type name: str
+    :param processing_dir: processing directory of the date
+    :type processing_dir: str
+    :param staging: pauses new processing while too many bytes are staged
+    :type staging: class:`StagingManager`, optional
+    :return: executor
+    :rtype: class:`FlatfileExecutor`
+    """
+
+    submission_mode = config_obj.get("submission_mode", "job")
+    return EXECUTORS[submission_mode](config_obj, name, processing_dir,
+        staging)
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""Defines FlatfileProcessor class, processes EMBL flatfiles in one pass"""
+
+import base64
+import collections
+import concurrent.futures
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+from ga4gh.refget.loader.sources.ena.assembly.functions.time import timestamp
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_reader import \
+    OverlappedGzipReader
+
+# sequence lines are upper-cased, with whitespace and position counts removed
+SEQ_TABLE = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz",
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+SEQ_DELETE = b"0123456789 \t\r\n"
+
+GA4GH_PREFIX = "SQ."
+TRUNC512_BYTES = 24
+
+LOADER_COLUMNS = ["timestamp", "completed", "trunc512", "md5", "seq_path",
+    "json_path"]
+FULL_COLUMNS = ["ga4gh", "trunc512", "md5", "length", "sha512",
+    "trunc512_base64", "insdc", "ena_type", "species", "biosample", "taxon"]
+
+def open_flatfile(file_path, overlap=False):
+    """Open a flatfile for buffered binary reading, decompressing if .gz
+
+    :param file_path: path to .dat or .dat.gz flatfile
+    :type file_path: str
+    :param overlap: decompress .gz flatfiles in a separate thread
+    :type overlap: bool
+    :return: binary file object
+    :rtype: class:`io.BufferedReader`
+    """
+
+    if file_path.endswith(".gz"):
+        if overlap:
+            return OverlappedGzipReader(file_path)
+        return io.BufferedReader(gzip.open(file_path, "rb"), 1024 * 1024)
+    return open(file_path, "rb", buffering=1024 * 1024)
+
+class SequenceChecksums(object):
+    """Computes all refget checksums of a sequence as it is streamed
+
+    :param sha512: running sha512 hash of the sequence
+    :type sha512: class:`hashlib._Hash`
+    :param md5: running md5 hash of the sequence
+    :type md5: class:`hashlib._Hash`
+    :param length: length of the sequence so far
+    :type length: int
+    """
+
+    def __init__(self):
+        """Constructor method"""
+
+        self.sha512 = hashlib.sha512()
+        self.md5 = hashlib.md5()
+        self.length = 0
+
+    def update(self, seq):
+        """Add a segment of normalized (upper case) sequence
+
+        :param seq: sequence segment
+        :type seq: bytes
+        """
+
+        self.sha512.update(seq)
+        self.md5.update(seq)
+        self.length += len(seq)
+
+    def digests(self):
+        """Get the checksums of the whole sequence
+
+        :return: ga4gh (sha512t24u), trunc512, md5, sha512, trunc512_base64,
+            and length
+        :rtype: dict
+        """
+
+        sha512 = self.sha512.digest()
+        trunc512_base64 = base64.urlsafe_b64encode(
+            sha512[:TRUNC512_BYTES]).decode()
+        return {
+            "ga4gh": GA4GH_PREFIX + trunc512_base64,
+            "trunc512": sha512[:TRUNC512_BYTES].hex(),
+            "md5": self.md5.hexdigest(),
+            "sha512": sha512.hex(),
+            "trunc512_base64": trunc512_base64,
+            "length": self.length
+        }
+
+class FlatfileProcessor(object):
+    """Processes an EMBL flatfile into refget sequence and metadata files
+
+    The flatfile is read in large blocks and split into whole records.
+    Gzipped flatfiles are decompressed ahead of the parser in a separate
+    thread, unless overlap is disabled. The parser (the calling thread)
+    extracts each record's header fields, and normalizes its sequence lines
+    into a single buffer with one translate call. The sequence buffer is
+    then handed, without copying, to a pool of worker threads, which compute
+    its checksums, write the sequence file named after its trunc512
+    checksum, and write its metadata JSON. Hashing and file writes release
+    the GIL, so workers run in parallel with each other and with the parser.
+
+    Results are collected in record order, so the loader and full CSVs are
+    identical whatever the number of workers. Sequences queued for workers
+    are bounded by bytes as well as by count: a record is only queued while
+    the sequences in flight total less than max_in_flight_bytes, and a
+    record larger than that waits until it is the only one in flight. Memory
+    use is therefore bounded by the larger of the budget and the largest
+    record, rather than by flatfile size. Records without a sequence (e.g.
+    CON records) are skipped.
+
+    Records end at a // line. CRLF line endings are normalized to LF as the
+    flatfile is read.
+
+    Output files match those of ena-refget-processor: sequences and metadata
+    beneath the store path (or sequences in a shared content store, where a
+    sequence already stored by any flatfile is not written again), and
+    <process_id>.loader.csv and <process_id>.full.csv in its logs directory,
+    which are read by the manifest subcommand.
+
+    :param store_path: directory to write sequences, metadata and CSVs
+    :type store_path: str
+    :param process_id: unique id of the flatfile, names the CSVs
+    :type process_id: str
+    :param workers: number of checksum/write worker threads
+    :type workers: int
+    :param overlap: decompress gzipped flatfiles in a separate thread
+    :type overlap: bool
+    :param content_store: shared store to write sequences to, instead of the
+        store path
+    :type content_store: class:`ContentStore`
+    :param max_in_flight: maximum number of records queued for workers
+    :type max_in_flight: int
+    :param max_in_flight_bytes: maximum total size of sequences queued for
+        workers, unless a single sequence is larger
+    :type max_in_flight_bytes: int
+    :param n_records: number of records with a sequence processed
+    :type n_records: int
+    :param n_skipped: number of records without a sequence
+    :type n_skipped: int
+    :param n_bases: total length of all sequences processed
+    :type n_bases: int
+    :param n_deduplicated: number of sequences already in the content store
+    :type n_deduplicated: int
+    """
+
+    BLOCK_SIZE = 4 * 1024 * 1024
+    RECORD_END = b"\n//\n"
+
+    def __init__(self, store_path, process_id, workers=None, overlap=True,
+        content_store=None, max_in_flight_bytes=None):
+        """Constructor method"""
+
+        self.store_path = store_path
+        self.process_id = process_id
+        self.workers = workers if workers else min(os.cpu_count(), 8)
+        self.max_in_flight = self.workers * 4
+        self.max_in_flight_bytes = max_in_flight_bytes if max_in_flight_bytes \
+            else self.workers * self.BLOCK_SIZE
+        self.overlap = overlap
+        self.content_store = content_store
+        self.logs_dir = os.path.join(store_path, "logs")
+        self.loader_csv = os.path.join(self.logs_dir,
+            process_id + ".loader.csv")
+        self.full_csv = os.path.join(self.logs_dir, process_id + ".full.csv")
+        self.n_records = 0
+        self.n_skipped = 0
+        self.n_bases = 0
+        self.n_deduplicated = 0
+
+    def process(self, file_path):
+        """Process all records of a flatfile
+
+        :param file_path: path to .dat or .dat.gz flatfile
+        :type file_path: str
+        """
+
+        for row in self.iter_process(file_path):
+            pass
+
+    def iter_process(self, file_path):
+        """Generator function, processes all records of a flatfile
+
+        Each record is yielded as soon as its sequence and metadata files
+        are written, so that it can be uploaded while later records are
+        processed. The CSVs are written to temporary files, and moved into
+        place only if the whole flatfile was processed. Values are quoted
+        where needed (e.g. a species name containing a comma), and are read
+        back with the csv module.
+
+        :param file_path: path to .dat or .dat.gz flatfile
+        :type file_path: str
+
+        Yields:
+            (dict): CSV row values of a processed record, in flatfile order
+        """
+
+        for d in [self.store_path, self.logs_dir]:
+            if not os.path.exists(d):
+                os.makedirs(d, exist_ok=True)
+
+        loader_tmp = self.loader_csv + ".tmp"
+        full_tmp = self.full_csv + ".tmp"
+        with open(loader_tmp, "w", newline="") as loader_file, \
+            open(full_tmp, "w", newline="") as full_file, \
+            open_flatfile(file_path, overlap=self.overlap) as flatfile:
+
+            loader_writer = csv.writer(loader_file, lineterminator="\n")
+            full_writer = csv.writer(full_file, lineterminator="\n")
+            loader_writer.writerow(LOADER_COLUMNS)
+            full_writer.writerow(FULL_COLUMNS)
+            for row in self.iter_records(flatfile):
+                loader_writer.writerow([row[c] for c in LOADER_COLUMNS])
+                full_writer.writerow([row[c] for c in FULL_COLUMNS])
+                yield row
+
+        os.replace(loader_tmp, self.loader_csv)
+        os.replace(full_tmp, self.full_csv)
+
+    def iter_records(self, flatfile):
+        """Generator function, processes each record of an open flatfile
+
+        :param flatfile: flatfile opened for binary reading
+        :type flatfile: file
+
+        Yields:
+            (dict): CSV row values of a processed record, in flatfile order
+        """
+
+        # futures of queued records, with the size of their sequences
+        in_flight = collections.deque()
+        in_flight_bytes = 0
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers) as executor:
+            try:
+                for record in self.iter_raw_records(flatfile):
+                    header, seq = self.parse_record(record)
+                    # only the sequence is kept while the record is queued
+                    del record
+                    if seq is None:
+                        self.n_skipped += 1
+                        continue
+                    while in_flight and (len(in_flight) >= self.max_in_flight
+                        or in_flight_bytes + len(seq)
+                        > self.max_in_flight_bytes):
+                        future, n_bytes = in_flight.popleft()
+                        in_flight_bytes -= n_bytes
+                        yield self.collect(future)
+                    in_flight.append([executor.submit(self.write_record,
+                        header, seq, len(in_flight) + self.n_records),
+                        len(seq)])
+                    in_flight_bytes += len(seq)
+                while in_flight:
+                    yield self.collect(in_flight.popleft()[0])
+            finally:
+                for future, n_bytes in in_flight:
+                    future.cancel()
+
+    def iter_raw_records(self, flatfile):
+        """Generator function, splits a flatfile into whole records
+
+        :param flatfile: flatfile opened for binary reading
+        :type flatfile: file
+
+        Yields:
+            (bytes): a single record, including its // terminator line
+        """
+
+        buffer = bytearray()
+        search_start = 0
+        carry = b""
+        while True:
+            block = flatfile.read(self.BLOCK_SIZE)
+            if not block:
+                buffer += carry
+                break
+            # a CR at the end of a block may be the first half of a CRLF
+            block = carry + block
+            carry = b""
+            if block.endswith(b"\r"):
+                carry = b"\r"
+                block = block[:-1]
+            buffer += block.replace(b"\r\n", b"\n")
+            while True:
+                end = buffer.find(self.RECORD_END, search_start)
+                if end == -1:
+                    # a terminator may span the end of the buffer
+                    search_start = max(0, len(buffer) - len(self.RECORD_END))
+                    break
+                end += len(self.RECORD_END)
+                yield bytes(buffer[:end])
+                del buffer[:end]
+                search_start = 0
+
+        if buffer.strip():
+            if not buffer.endswith(b"\n//"):
+                raise Exception("flatfile ends within a record")
+            yield bytes(buffer) + b"\n"
+
+    def parse_record(self, record):
+        """Parse a record's header fields and normalized sequence
+
+        :param record: a single record
+        :type record: bytes
+        :return: header fields, and sequence (None if the record has none)
+        :rtype: list
+        """
+
+        header = self.new_header()
+        sq_start = 0 if record.startswith(b"SQ") else record.find(b"\nSQ")
+        header_end = len(record) if sq_start == -1 else sq_start
+        for line in record[:header_end].split(b"\n"):
+            self.parse_header_line(line[:2], line, header)
+        if sq_start == -1:
+            return [header, None]
+
+        seq_start = record.index(b"\n", sq_start + 1) + 1
+        seq_end = len(record) - len(self.RECORD_END) + 1
+        return [header,
+            record[seq_start:seq_end].translate(SEQ_TABLE, SEQ_DELETE)]
+
+    def write_record(self, header, seq, record_number):
+        """Checksum a record's sequence, write its sequence and metadata
+
+        Called from worker threads. The sequence is written to a temporary
+        file, then renamed after its trunc512 checksum, so that a sequence
+        file is never seen partially written. With a content store, the
+        sequence is only written if the store does not already hold it.
+
+        :param header: header fields of the record
+        :type header: dict[str, str]
+        :param seq: normalized sequence
+        :type seq: bytes
+        :param record_number: number of the record, names temporary files
+        :type record_number: int
+        :return: CSV row values of the record
+        :rtype: dict
+        """
+
+        checksums = SequenceChecksums()
+        checksums.update(seq)
+        digests = checksums.digests()
+
+        trunc512 = digests["trunc512"]
+        json_path = self.get_output_path("metadata", trunc512 + ".json")
+        deduplicated = False
+        if self.content_store:
+            seq_path, written = self.content_store.put(digests["ga4gh"], seq)
+            deduplicated = not written
+        else:
+            seq_path = self.get_output_path("sequence", trunc512)
+            tmp_path = "{}.{}.{}.tmp".format(seq_path, os.getpid(),
+                record_number)
+            with open(tmp_path, "wb") as seq_file:
+                seq_file.write(seq)
+            os.replace(tmp_path, seq_path)
+
+        metadata = {
+            "metadata": {
+                "id": trunc512,
+                "md5": digests["md5"],
+                "trunc512": trunc512,
+                "ga4gh": digests["ga4gh"],
+                "length": digests["length"],
+                "aliases": [
+                    {"alias": header["insdc"], "naming_authority": "insdc"}
+                ]
+            }
+        }
+        open(json_path, "w").write(json.dumps(metadata) + "\n")
+
+        row = dict(header)
+        row.update(digests)
+        row.update({
+            "timestamp": timestamp(),
+            "completed": 1,
+            "seq_path": seq_path,
+            "json_path": json_path,
+            "deduplicated": deduplicated
+        })
+        return row
+
+    def collect(self, future):
+        """Wait for a record's worker to finish, and count the record
+
+        :param future: result of write_record
+        :type future: class:`concurrent.futures.Future`
+        :return: CSV row values of the record
+        :rtype: dict
+        """
+
+        row = future.result()
+        self.n_records += 1
+        self.n_bases += row["length"]
+        if row["deduplicated"]:
+            self.n_deduplicated += 1
+        return row
+
+    def new_header(self):
+        """Get empty header fields for a new record
+
+        :return: insdc, ena_type, species, biosample, and taxon
+        :rtype: dict[str, str]
+        """
+
+        return {
+            "insdc": "",
+            "ena_type": "",
+            "species": "",
+            "biosample": "",
+            "taxon": ""
+        }
+
+    def parse_header_line(self, code, line, header):
+        """Set header fields from a record's header line
+
+        :param code: two character line code, e.g. ID, OS
+        :type code: bytes
+        :param line: full line
+        :type line: bytes
+        :param header: header fields of the current record
+        :type header: dict[str, str]
+        """
+
+        value = line[5:].decode("utf-8", "replace").strip()
+        if code == b"ID":
+            # ID   <accession>; SV <version>; <topology>; <molecule type>;
+            #      <data class>; <taxonomic division>; <length> BP.
+            fields = [f.strip() for f in value.split(";")]
+            header["insdc"] = fields[0]
+            if len(fields) > 1 and fields[1].startswith("SV "):
+                header["insdc"] += "." + fields[1][3:].strip()
+            if len(fields) > 4:
+                header["ena_type"] = fields[4]
+        elif code == b"OS" and not header["species"]:
+            header["species"] = value
+        elif code == b"DR" and value.startswith("BioSample;"):
+            header["biosample"] = value.split(";")[1].strip().rstrip(".")
+        elif code == b"FT" and not header["taxon"] \
+            and "/db_xref=\"taxon:" in value:
+            header["taxon"] = value.split("taxon:")[1].rstrip("\"")
+
+    def get_output_path(self, subdir, filename):
+        """Get the path of an output file, sharded by checksum prefix
+
+        :param subdir: output subdirectory, sequence or metadata
+        :type subdir: str
+        :param filename: output file name, starting with its checksum
+        :type filename: str
+        :return: path to output file
+        :rtype: str
+        """
+
+        output_dir = os.path.join(self.store_path, subdir, filename[:2])
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        return os.path.join(output_dir, filename)
+
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Defines OverlappedGzipReader class, decompresses flatfiles in a thread"""
+
+import queue
+import threading
+
+# use the fastest available inflate implementation, all share zlib's API
+try:
+    from isal import isal_zlib as zlib
+    INFLATE_IMPLEMENTATION = "isal"
+except ImportError:
+    try:
+        from zlib_ng import zlib_ng as zlib
+        INFLATE_IMPLEMENTATION = "zlib-ng"
+    except ImportError:
+        import zlib
+        INFLATE_IMPLEMENTATION = "zlib"
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+class OverlappedGzipReader(object):
+    """Reads a gzipped flatfile, decompressing ahead of the reader in a thread
+
+    A decompression thread reads the compressed file in chunks and inflates
+    it into buffers of about buffer_size bytes, which are passed to the
+    reader through a ring of at most ring_size buffers. Inflating releases
+    the GIL, so decompression of the next buffers overlaps with parsing of
+    the current one, and the ring bounds how far decompression runs ahead.
+    Multi-member gzip files (e.g. concatenated .gz files) are read through.
+
+    The isal or zlib-ng inflate implementation is used if installed, and
+    zlib otherwise. read(n) returns the next decompressed buffer, or part of
+    it, and an empty bytes at the end of the file, so the reader can replace
+    a file object opened with gzip.open.
+
+    :param file_path: path to gzipped flatfile
+    :type file_path: str
+    :param buffer_size: approximate size of decompressed buffers
+    :type buffer_size: int
+    :param ring_size: maximum number of decompressed buffers held
+    :type ring_size: int
+    :param ring: decompressed buffers, then None at end of file, or the
+        exception raised by the decompression thread
+    :type ring: class:`queue.Queue`
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+    DEFAULT_RING_SIZE = 4
+
+    def __init__(self, file_path, buffer_size=None, ring_size=None):
+        """Constructor method"""
+
+        self.file_path = file_path
+        self.buffer_size = buffer_size if buffer_size \
+            else self.DEFAULT_BUFFER_SIZE
+        self.ring_size = ring_size if ring_size else self.DEFAULT_RING_SIZE
+        self.ring = queue.Queue(maxsize=self.ring_size)
+        self.current = memoryview(b"")
+        self.eof = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.__decompress, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, size=-1):
+        """Read decompressed bytes
+
+        :param size: maximum number of bytes to return, all if negative
+        :type size: int
+        :return: up to size bytes, empty at end of file
+        :rtype: bytes
+        """
+
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(self.buffer_size), b""))
+        while not self.current and not self.eof:
+            item = self.ring.get()
+            if item is None:
+                self.eof = True
+            elif isinstance(item, Exception):
+                self.eof = True
+                raise item
+            else:
+                self.current = memoryview(item)
+        data = bytes(self.current[:size])
+        self.current = self.current[size:]
+        return data
+
+    def close(self):
+        """Stop the decompression thread, discarding unread buffers"""
+
+        self.closed = True
+        while self.thread.is_alive():
+            try:
+                self.ring.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.current = memoryview(b"")
+        self.eof = True
+
+    def __put(self, item):
+        """Add an item to the ring, waiting while it is full
+
+        :param item: decompressed buffer, None, or exception
+        :type item: bytes
+        :return: False if the reader was closed
+        :rtype: bool
+        """
+
+        while not self.closed:
+            try:
+                self.ring.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __decompress(self):
+        """Decompression thread, fills the ring until end of file"""
+
+        try:
+            with open(self.file_path, "rb") as compressed_file:
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+                pending = []
+                n_pending = 0
+                started = False
+                while True:
+                    chunk = compressed_file.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    while chunk:
+                        started = True
+                        data = decompressor.decompress(chunk)
+                        pending.append(data)
+                        n_pending += len(data)
+                        chunk = b""
+                        if decompressor.eof:
+                            # the next gzip member starts in unused_data
+                            chunk = decompressor.unused_data.lstrip(b"\0")
+                            decompressor = zlib.decompressobj(GZIP_WBITS)
+                            started = False
+                        if n_pending >= self.buffer_size:
+                            if not self.__put(b"".join(pending)):
+                                return
+                            pending = []
+                            n_pending = 0
+
+                if started and not decompressor.eof:
+                    raise Exception("compressed file ended before the end "
+                        + "of the stream: " + self.file_path)
+                if pending and not self.__put(b"".join(pending)):
+                    return
+            self.__put(None)
+        except Exception as e:
+            self.__put(e)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Defines LsfJobArray class, submits each stage of many flatfiles at once"""
+
+import logging
+import os
+
+class LsfJobArray(object):
+    """Submits the process, manifest and upload stages of many flatfiles as
+    LSF job arrays, rather than as three jobs per flatfile
+
+    Flatfiles are added once their command files have been written. On
+    submit, a task file is written for each stage, listing each flatfile's
+    command file and log files in the same order, so that array index i
+    refers to the same flatfile in every stage. Each array element runs a
+    small runner script, which looks up its line in the task file by
+    LSB_JOBINDEX and runs that command, writing to the flatfile's own logs.
+
+    The manifest and upload arrays depend on the previous stage's array with
+    an ended(name[*]) condition, which LSF evaluates element by element for
+    arrays of the same size, so a flatfile's manifest starts as soon as its
+    own processing has ended. Arrays larger than max_size (LSF's
+    MAX_JOB_ARRAY_SIZE) are split into several arrays per stage.
+
+    A stage split into several tasks per flatfile (e.g. sharded uploads) has
+    one array element per task, which is given its shard number in the
+    REFGET_LOADER_SHARD environment variable. As its array is larger than
+    the previous stage's, it waits for the whole of the previous array to
+    end.
+
+    :param name: unique name for this submission, e.g. date and timestamp
+    :type name: str
+    :param array_dir: directory to write task files, runners, and array logs
+    :type array_dir: str
+    :param max_size: maximum number of elements in a single job array
+    :type max_size: int
+    :param stages: names of the stages run for each flatfile, in order
+    :type stages: list[str]
+    :param stage_tasks: stage name -> number of tasks per flatfile, if not 1
+    :type stage_tasks: dict[str, int]
+    :param jobs: job id, command dir, and log dir of each added flatfile
+    :type jobs: list[list[str]]
+    """
+
+    STAGES = ["process", "manifest", "upload"]
+    DEFAULT_MAX_SIZE = 1000
+
+    def __init__(self, name, array_dir, max_size=None, stages=None,
+        stage_tasks=None):
+        """Constructor method"""
+
+        self.name = name
+        self.array_dir = array_dir
+        self.max_size = max_size if max_size else self.DEFAULT_MAX_SIZE
+        self.stages = stages if stages else self.STAGES
+        self.stage_tasks = stage_tasks if stage_tasks else {}
+        self.jobs = []
+
+    def __len__(self):
+        """Get the number of flatfiles added
+
+        :return: number of flatfiles
+        :rtype: int
+        """
+
+        return len(self.jobs)
+
+    def add(self, job_id, cmd_dir, log_dir):
+        """Add a flatfile whose stage command files have been written
+
+        :param job_id: unique id of the flatfile's jobs
+        :type job_id: str
+        :param cmd_dir: directory holding the flatfile's stage command files
+        :type cmd_dir: str
+        :param log_dir: directory to write the flatfile's stage logs
+        :type log_dir: str
+        """
+
+        self.jobs.append([job_id, cmd_dir, log_dir])
+
+    def submit(self):
+        """Write task files and runners, submit one array per stage and chunk
+
+        :return: names of the submitted job arrays
+        :rtype: list[str]
+        """
+
+        if not self.jobs:
+            return []
+        if not os.path.exists(self.array_dir):
+            os.makedirs(self.array_dir)
+
+        # chunks are sized so that no stage's array exceeds max_size
+        max_tasks = max([self.stage_tasks.get(s, 1) for s in self.stages])
+        chunk_size = max(1, self.max_size // max_tasks)
+        array_names = []
+        for chunk_start in range(0, len(self.jobs), chunk_size):
+            chunk = self.jobs[chunk_start:chunk_start + chunk_size]
+            chunk_id = "{}.{}".format(self.name, chunk_start // chunk_size)
+            hold_name = None
+            for stage in self.stages:
+                array_name = "{}.{}".format(stage, chunk_id)
+                bsub_file = self.write_array_files(stage, chunk_id, chunk,
+                    hold_name=hold_name)
+                exit_code = os.system(bsub_file)
+                if exit_code != 0:
+                    raise Exception("job array submission failed ({}): {}"
+                        .format(exit_code, bsub_file))
+                logging.info("submitted job array {} ({} flatfiles)".format(
+                    array_name, len(chunk)))
+                array_names.append(array_name)
+                hold_name = array_name
+        return array_names
+
+    def write_array_files(self, stage, chunk_id, chunk, hold_name=None):
+        """Write the task file, runner and bsub files for one stage's array
+
+        :param stage: stage name, one of process, manifest, upload
+        :type stage: str
+        :param chunk_id: unique id of this chunk of flatfiles
+        :type chunk_id: str
+        :param chunk: job id, command dir, and log dir of each flatfile
+        :type chunk: list[list[str]]
+        :param hold_name: the array will wait for this array to end
+        :type hold_name: str, optional
+        :return: path to bsub command file
+        :rtype: str
+        """
+
+        array_name = "{}.{}".format(stage, chunk_id)
+        task_file = os.path.join(self.array_dir, array_name + ".tasks")
+        runner_file = os.path.join(self.array_dir, array_name + ".sh")
+        bsub_file = os.path.join(self.array_dir, array_name + ".bsub")
+
+        # one line per array element: command, stdout log, stderr log, and
+        # shard number
+        n_tasks = self.stage_tasks.get(stage, 1)
+        lines = []
+        for job_id, cmd_dir, log_dir in chunk:
+            for shard in range(1, n_tasks + 1):
+                job_name = "{}.{}".format(stage, job_id)
+                if n_tasks > 1:
+                    job_name += ".{}".format(shard)
+                lines.append("\t".join([
+                    os.path.join(cmd_dir, stage + ".sh"),
+                    os.path.join(log_dir, job_name + ".log.out"),
+                    os.path.join(log_dir, job_name + ".log.err"),
+                    str(shard)
+                ]) + "\n")
+        open(task_file, "w").write("".join(lines))
+
+        runner = "#!/bin/sh\n" \
+            + "IFS=\"$(printf '\\t')\" read -r cmd out err shard <<EOF\n" \
+            + "$(sed -n \"${LSB_JOBINDEX}p\" " + task_file + ")\n" \
+            + "EOF\n" \
+            + "export REFGET_LOADER_SHARD=\"$shard\"\n" \
+            + "exec \"$cmd\" >> \"$out\" 2>> \"$err\"\n"
+        open(runner_file, "w").write(runner)
+
+        logfile_out = os.path.join(self.array_dir, array_name + ".%I.log.out")
+        logfile_err = os.path.join(self.array_dir, array_name + ".%I.log.err")
+        bsub = "bsub -o {} -e {} -J '{}[1-{}]' ".format(logfile_out,
+            logfile_err, array_name, len(lines))
+        if hold_name:
+            bsub += "-w 'ended({}[*])' ".format(hold_name)
+        bsub += '"{}"'.format(runner_file)
+        open(bsub_file, "w").write(bsub + "\n")
+
+        os.chmod(runner_file, 0o744)
+        os.chmod(bsub_file, 0o744)
+        return bsub_file
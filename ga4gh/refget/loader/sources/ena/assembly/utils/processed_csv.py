@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Streams the joined rows of a processed flatfile's loader and full CSVs"""
+
+import csv
+
+LOADER_JOIN_COLUMNS = ["completed", "trunc512", "md5", "seq_path",
+    "json_path"]
+FULL_JOIN_COLUMNS = ["trunc512", "ga4gh"]
+
+def iter_csv_columns(csv_file, columns):
+    """Generator function, reads selected columns of each row of a CSV
+
+    :param csv_file: CSV file opened for reading, with a header row
+    :type csv_file: file
+    :param columns: names of the columns to read
+    :type columns: list[str]
+
+    Yields:
+        (list[str]): values of the selected columns, in the given order
+    """
+
+    reader = csv.reader(csv_file)
+    header = next(reader, None)
+    if header is None:
+        raise Exception("csv is empty, no header row: " + csv_file.name)
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise Exception("csv is missing columns {}: {}".format(
+            ",".join(missing), csv_file.name))
+    indices = [header.index(c) for c in columns]
+    for row in reader:
+        if row:
+            yield [row[i] for i in indices]
+
+def iter_processed_rows(loader_csv_path, full_csv_path):
+    """Generator function, joins a processed flatfile's CSVs on trunc512
+
+    Both CSVs are written one row per sequence, in the same order, so they
+    are joined by reading them in step, holding a single row of each. If
+    rows appear out of step, the unmatched rows of either CSV are held until
+    their match is read, so the join is correct whatever the order, and
+    memory use only grows with the number of rows out of step. Only the
+    columns needed for the manifest are kept, and rows are parsed with the
+    csv module, so quoted values containing commas are read correctly.
+
+    A sequence occurring more than once in the flatfile has a row for each
+    occurrence, but is only joined once, as its objects are only uploaded
+    once. The CSVs are in flatfile order rather than sorted, so repeats are
+    not always adjacent, and the trunc512 of every joined row is kept.
+
+    :param loader_csv_path: path to <process_id>.loader.csv
+    :type loader_csv_path: str
+    :param full_csv_path: path to <process_id>.full.csv
+    :type full_csv_path: str
+
+    Yields:
+        (dict): completed, trunc512, md5, seq_path, json_path, and ga4gh of
+            each distinct sequence, in loader CSV order if the CSVs are in
+            step
+    """
+
+    unmatched_loader = {}
+    unmatched_full = {}
+    joined_keys = set()
+
+    def joined(loader_values, ga4gh):
+        joined_keys.add(loader_values[1])
+        row = dict(zip(LOADER_JOIN_COLUMNS, loader_values))
+        row["ga4gh"] = ga4gh
+        return row
+
+    with open(loader_csv_path, "r", newline="") as loader_file, \
+        open(full_csv_path, "r", newline="") as full_file:
+
+        full_rows = iter_csv_columns(full_file, FULL_JOIN_COLUMNS)
+        for loader_values in iter_csv_columns(loader_file,
+            LOADER_JOIN_COLUMNS):
+            trunc512 = loader_values[1]
+            if trunc512 in joined_keys:
+                continue
+            if trunc512 in unmatched_full:
+                yield joined(loader_values, unmatched_full.pop(trunc512))
+                continue
+
+            # read the full csv until this row's match, holding any rows
+            # out of step until their own match is read
+            unmatched_loader[trunc512] = loader_values
+            while trunc512 in unmatched_loader:
+                full_values = next(full_rows, None)
+                if full_values is None:
+                    break
+                if full_values[0] in joined_keys:
+                    continue
+                if full_values[0] in unmatched_loader:
+                    yield joined(unmatched_loader.pop(full_values[0]),
+                        full_values[1])
+                else:
+                    unmatched_full[full_values[0]] = full_values[1]
+
+    if unmatched_loader:
+        raise Exception("{} sequences in {} not found in {}".format(
+            len(unmatched_loader), loader_csv_path, full_csv_path))
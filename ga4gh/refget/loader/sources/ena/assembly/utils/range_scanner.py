@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Scan many dates concurrently with AssemblyScanner on a shared session"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import requests
+from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_scanner \
+    import AssemblyScanner
+
+ACCESSION_LIST_FILENAME = "accessions_list.txt"
+DEFAULT_SCAN_CONCURRENCY = 4
+
+def create_session(max_concurrency):
+    """Create an HTTP session with a connection pool for concurrent requests
+
+    :param max_concurrency: maximum number of concurrent requests
+    :type max_concurrency: int
+    :return: HTTP session
+    :rtype: class:`requests.Session`
+    """
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+        pool_maxsize=max_concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def scan_date_range(dates_dirs, max_concurrency, url=None, cache=None,
+    split_threshold=None, accession_index=None):
+    """Generate the accession lists for many dates concurrently
+
+    Each date's search request is made from a thread pool, on a single
+    session whose connections are reused between requests. All scanners
+    share the same request slots, so split requests made within each date
+    do not add to the number of requests in flight, which never exceeds
+    max_concurrency (the size of the session's connection pool). Each date's
+    accessions list is written to its processing directory as soon as its
+    response has been parsed. A date whose scan fails is logged and left
+    without an accessions list, so it will be scanned again when processed.
+
+    :param dates_dirs: YYYY-MM-DD date string, and processing dir, per date
+    :type dates_dirs: list[list[str]]
+    :param max_concurrency: maximum number of concurrent search requests
+    :type max_concurrency: int
+    :param url: base url to ENA assembly search API
+    :type url: str, optional
+    :param cache: on-disk cache of search responses
+    :type cache: class:`ResponseCache`, optional
+    :param split_threshold: result count above which a date's search is
+        split into pages
+    :type split_threshold: int, optional
+    :param accession_index: persistent index, updated with scanned records
+    :type accession_index: class:`AccessionIndex`, optional
+    :return: date strings of all dates that could not be scanned
+    :rtype: list[str]
+    """
+
+    session = create_session(max_concurrency)
+    request_slots = threading.BoundedSemaphore(max_concurrency)
+    failed_dates = []
+
+    def scan(date_string, processing_dir):
+        scanner = AssemblyScanner(date_string, url=url, session=session,
+            cache=cache, split_threshold=split_threshold,
+            max_concurrency=max_concurrency, request_slots=request_slots,
+            accession_index=accession_index)
+        scanner.generate_accession_list(
+            os.path.join(processing_dir, ACCESSION_LIST_FILENAME))
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_concurrency) as executor:
+
+        futures = {}
+        for date_string, processing_dir in dates_dirs:
+            future = executor.submit(scan, date_string, processing_dir)
+            futures[future] = date_string
+
+        for future in concurrent.futures.as_completed(futures):
+            date_string = futures[future]
+            try:
+                future.result()
+                logging.info("{} - accessions list generated".format(
+                    date_string))
+            except Exception as e:
+                failed_dates.append(date_string)
+                logging.error("{} - accession search failed: {}".format(
+                    date_string, str(e)))
+
+    session.close()
+    return sorted(failed_dates)
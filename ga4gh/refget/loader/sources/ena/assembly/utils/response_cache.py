@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Defines ResponseCache class, stores ENA search API responses on disk"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+class ResponseCache(object):
+    """On-disk cache of search API response bodies, with HTTP validators
+
+    Each cached response is stored as a body file and a metadata file, named
+    by a hash of the request url and parameters (which include the query's
+    date window). The body is streamed to a temporary file while it is being
+    downloaded and parsed, and is only moved into place, followed by its
+    metadata, once the whole response has been read. An interrupted download
+    therefore never leaves an entry that could be taken for a complete one.
+
+    The metadata records the response's ETag and Last-Modified validators,
+    so that a cached entry can be refreshed with a conditional request: if
+    the server answers 304 Not Modified, the cached body is used and no body
+    is transferred. If max_age is set, entries younger than max_age are used
+    without any request.
+
+    When the total size of cached bodies exceeds max_bytes, least recently
+    used entries are evicted. The total is measured by walking the cache
+    directory on the first store, then kept as a running total of stored
+    bodies, so that the directory is only walked again to evict.
+
+    :param cache_dir: directory holding cached responses
+    :type cache_dir: str
+    :param max_bytes: maximum total size (bytes) of cached bodies
+    :type max_bytes: int
+    :param max_age: age (seconds) below which entries are used unvalidated
+    :type max_age: int
+    """
+
+    DEFAULT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+    def __init__(self, cache_dir, max_bytes=None, max_age=None):
+        """Constructor method"""
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes if max_bytes else self.DEFAULT_MAX_BYTES
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config_obj):
+        """Create the response cache described by a source config
+
+        :param config_obj: source config, as validated by ena_assembly.json
+        :type config_obj: dict
+        :return: response cache, or None if no cache dir is configured
+        :rtype: class:`ResponseCache`
+        """
+
+        if not config_obj.get("search_cache_dir"):
+            return None
+        return cls(config_obj["search_cache_dir"],
+            max_bytes=config_obj.get("search_cache_max_bytes"),
+            max_age=config_obj.get("search_cache_max_age"))
+
+    def get_key(self, url, params):
+        """Get the cache key for a request
+
+        :param url: request url
+        :type url: str
+        :param params: request parameters
+        :type params: dict[str, str]
+        :return: cache key
+        :rtype: str
+        """
+
+        request_string = url + "?" + json.dumps(params, sort_keys=True)
+        return hashlib.sha256(request_string.encode()).hexdigest()
+
+    def get(self, key):
+        """Get the metadata of a complete cached response
+
+        :param key: cache key
+        :type key: str
+        :return: metadata (body_path, etag, last_modified, size, stored), or
+            None if there is no complete entry for the key
+        :rtype: dict
+        """
+
+        body_path, meta_path = self.__get_paths(key)
+        try:
+            meta = json.loads(open(meta_path, "r").read())
+            if os.path.getsize(body_path) != meta["size"]:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        meta["body_path"] = body_path
+        meta["fresh"] = self.max_age is not None \
+            and time.time() - meta["stored"] < self.max_age
+        return meta
+
+    def get_conditional_headers(self, meta):
+        """Get request headers to revalidate a cached response
+
+        :param meta: metadata of the cached response
+        :type meta: dict
+        :return: If-None-Match and/or If-Modified-Since headers
+        :rtype: dict[str, str]
+        """
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def touch(self, key):
+        """Mark a cached response as recently used
+
+        :param key: cache key
+        :type key: str
+        """
+
+        body_path, meta_path = self.__get_paths(key)
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+
+    def read(self, key, chunk_size):
+        """Generator function, yields the cached body of a response in chunks
+
+        :param key: cache key
+        :type key: str
+        :param chunk_size: size (bytes) of each chunk
+        :type chunk_size: int
+
+        Yields:
+            (bytes): chunk of the cached body
+        """
+
+        self.touch(key)
+        body_path, meta_path = self.__get_paths(key)
+        with open(body_path, "rb") as body_file:
+            chunk = body_file.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = body_file.read(chunk_size)
+
+    def store(self, key, chunks, headers):
+        """Generator function, passes chunks through while caching them
+
+        Chunks are written to a temporary file as they are yielded. The entry
+        is only committed once every chunk has been consumed, and the
+        temporary file is removed if the consumer stops early or raises.
+
+        :param key: cache key
+        :type key: str
+        :param chunks: response body, as an iterable of byte chunks
+        :type chunks: iterable[bytes]
+        :param headers: response headers, for ETag and Last-Modified
+        :type headers: dict[str, str]
+
+        Yields:
+            (bytes): the same chunks, in order
+        """
+
+        body_path, meta_path = self.__get_paths(key)
+        tmp_path = "{}.tmp.{}.{}".format(body_path, os.getpid(),
+            threading.get_ident())
+        size = 0
+        committed = False
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                for chunk in chunks:
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+
+            meta = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "size": size,
+                "stored": time.time()
+            }
+            try:
+                replaced_size = os.path.getsize(body_path)
+            except OSError:
+                replaced_size = 0
+            os.replace(tmp_path, body_path)
+            self.__write_atomic(meta_path, json.dumps(meta) + "\n")
+            committed = True
+        finally:
+            if not committed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum([e[1] for e in self.__list_entries()])
+            else:
+                self.total_bytes += size - replaced_size
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes"""
+
+        with self.lock:
+            entries = self.__list_entries()
+            total = sum([e[1] for e in entries])
+            entries.sort()
+            for mtime, size, meta_path, body_path in entries:
+                if total <= self.max_bytes:
+                    break
+                for path in [meta_path, body_path]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                logging.debug("evicted cached response " + body_path)
+            self.total_bytes = total
+
+    def __get_paths(self, key):
+        """Get body and metadata file paths for a key
+
+        :param key: cache key
+        :type key: str
+        :return: body path, metadata path
+        :rtype: list[str]
+        """
+
+        subdir = os.path.join(self.cache_dir, key[:2])
+        if not os.path.exists(subdir):
+            os.makedirs(subdir, exist_ok=True)
+        return [os.path.join(subdir, key + ".xml"),
+            os.path.join(subdir, key + ".json")]
+
+    def __list_entries(self):
+        """List the complete entries in the cache directory
+
+        :return: metadata mtime, body size, metadata path and body path of
+            each entry
+        :rtype: list[list]
+        """
+
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith(".json"):
+                    continue
+                meta_path = os.path.join(root, filename)
+                body_path = meta_path[:-len(".json")] + ".xml"
+                try:
+                    entries.append([os.path.getmtime(meta_path),
+                        os.path.getsize(body_path), meta_path, body_path])
+                except OSError:
+                    continue
+        return entries
+
+    def __write_atomic(self, file_path, content):
+        """Write a file by writing and renaming a temporary file
+
+        :param file_path: path to the output file
+        :type file_path: str
+        :param content: file content
+        :type content: str
+        """
+
+        tmp_path = "{}.tmp.{}.{}".format(file_path, os.getpid(),
+            threading.get_ident())
+        open(tmp_path, "w").write(content)
+        os.replace(tmp_path, file_path)
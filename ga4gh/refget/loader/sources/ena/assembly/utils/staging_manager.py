@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Defines StagingManager class, limits the bytes staged for upload"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from ga4gh.refget.loader.sources.ena.assembly.utils.batch_planner import \
+    format_bytes
+
+# output subdirectories of a flatfile, removed once its upload has completed
+STAGED_SUBDIRS = ["sequence", "metadata"]
+
+class StagingManager(object):
+    """Pauses new processing while too many bytes are staged for upload
+
+    Processing writes a flatfile's sequences and metadata to its processing
+    sub-directory, where they stay until its upload has completed and they
+    are removed (see remove_staged_outputs). When the bytes staged beneath
+    the staging directory reach the high-water mark, new processing is
+    paused until uploads have drained them to the low-water mark.
+
+    The staging directory is the source's root processing directory, so the
+    mark applies to every date of the run together. In job submission mode,
+    a date's jobs are still running when the next date is submitted, and
+    their staged bytes count against the next date's processing.
+
+    Staged bytes are measured by walking the sequence and metadata
+    directories of each flatfile of each date
+    (<YYYY>/<MM>/<DD>/files/<prefix>/<id>/), at most once per poll
+    interval. If staged bytes stop falling while paused (e.g. every
+    remaining flatfile has failed, so nothing is being drained), the pause
+    ends after stall_timeout seconds, so that a run is never stuck.
+
+    Staging is not supported with a shared content store, whose sequences
+    are neither measured nor removed, so the high-water mark would never
+    be drained.
+
+    :param staging_dir: root processing directory, holding the staged
+        outputs of every date
+    :type staging_dir: str
+    :param high_water_bytes: staged bytes at which processing is paused
+    :type high_water_bytes: int
+    :param low_water_bytes: staged bytes at which processing resumes
+    :type low_water_bytes: int
+    :param poll_interval: seconds between measurements of staged bytes
+    :type poll_interval: int
+    :param stall_timeout: seconds to stay paused without staged bytes falling
+    :type stall_timeout: int
+    """
+
+    DEFAULT_LOW_WATER_FRACTION = 0.8
+    DEFAULT_POLL_INTERVAL = 30
+    DEFAULT_STALL_TIMEOUT = 3600
+
+    def __init__(self, staging_dir, high_water_bytes, low_water_bytes=None,
+        poll_interval=None, stall_timeout=None):
+        """Constructor method"""
+
+        self.staging_dir = staging_dir
+        self.high_water_bytes = high_water_bytes
+        self.low_water_bytes = low_water_bytes if low_water_bytes \
+            else int(high_water_bytes * self.DEFAULT_LOW_WATER_FRACTION)
+        if self.low_water_bytes > self.high_water_bytes:
+            raise Exception("staging low-water mark must not exceed the "
+                + "high-water mark")
+        self.poll_interval = poll_interval if poll_interval \
+            else self.DEFAULT_POLL_INTERVAL
+        self.stall_timeout = stall_timeout if stall_timeout \
+            else self.DEFAULT_STALL_TIMEOUT
+        self.paused = False
+        self.staged_bytes = 0
+        self.measured = None
+        self.min_paused_bytes = None
+        self.last_fall = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_obj):
+        """Create the staging manager described by a source config
+
+        :param config_obj: source config, as validated by ena_assembly.json
+        :type config_obj: dict
+        :return: staging manager, or None if staging_high_water_bytes is not
+            set
+        :rtype: class:`StagingManager`
+        """
+
+        if config_obj.get("content_store_dir") and (
+            config_obj.get("staging_high_water_bytes")
+            or config_obj.get("staging_cleanup")):
+            raise Exception("staging_high_water_bytes and staging_cleanup "
+                + "cannot be used with content_store_dir, whose sequences "
+                + "are never measured or removed")
+        if not config_obj.get("staging_high_water_bytes"):
+            return None
+        if not config_obj.get("staging_cleanup"):
+            raise Exception("staging_high_water_bytes requires "
+                + "staging_cleanup, otherwise staged bytes never fall")
+        if config_obj.get("submission_mode") == "array":
+            raise Exception("staging_high_water_bytes cannot be used with "
+                + "the array submission mode, which submits every flatfile "
+                + "of a date at once")
+        return cls(config_obj["processing_dir"],
+            config_obj["staging_high_water_bytes"],
+            low_water_bytes=config_obj.get("staging_low_water_bytes"))
+
+    def get_staged_bytes(self):
+        """Measure the bytes staged beneath the staging directory
+
+        Only each flatfile's sequence and metadata directories are measured,
+        as its manifest, csvs and logs are kept after upload.
+
+        :return: total size of staged files, not following symlinks
+        :rtype: int
+        """
+
+        n_bytes = 0
+        for files_dir in self.get_files_dirs():
+            for prefix_dir in list_dirs(files_dir):
+                for subdir in list_dirs(prefix_dir):
+                    for name in STAGED_SUBDIRS:
+                        n_bytes += get_dir_bytes(os.path.join(subdir, name))
+        return n_bytes
+
+    def get_files_dirs(self):
+        """List the files directory of each date beneath the staging
+        directory
+
+        :return: paths to <YYYY>/<MM>/<DD>/files directories
+        :rtype: list[str]
+        """
+
+        return [os.path.join(day_dir, "files")
+            for year_dir in list_dirs(self.staging_dir)
+            for month_dir in list_dirs(year_dir)
+            for day_dir in list_dirs(month_dir)]
+
+    def is_paused(self):
+        """Check whether new processing should wait, measuring staged bytes
+        if the last measurement is older than the poll interval
+
+        :return: True if staged bytes have reached the high-water mark, and
+            not yet fallen to the low-water mark
+        :rtype: bool
+        """
+
+        with self.lock:
+            now = time.time()
+            if self.measured is not None \
+                and now - self.measured < self.poll_interval:
+                return self.paused
+            self.staged_bytes = self.get_staged_bytes()
+            self.measured = now
+            self.__update(now)
+            return self.paused
+
+    def wait(self):
+        """Block until new processing may start"""
+
+        while self.is_paused():
+            time.sleep(self.poll_interval)
+
+    def __update(self, now):
+        """Pause or resume according to the latest measurement
+
+        :param now: time of the measurement
+        :type now: float
+        """
+
+        if not self.paused:
+            if self.staged_bytes >= self.high_water_bytes:
+                self.paused = True
+                self.min_paused_bytes = self.staged_bytes
+                self.last_fall = now
+                logging.info("pausing processing, {} staged".format(
+                    format_bytes(self.staged_bytes)))
+        elif self.staged_bytes <= self.low_water_bytes:
+            self.paused = False
+            logging.info("resuming processing, {} staged".format(
+                format_bytes(self.staged_bytes)))
+        elif self.staged_bytes < self.min_paused_bytes:
+            self.min_paused_bytes = self.staged_bytes
+            self.last_fall = now
+        elif now - self.last_fall >= self.stall_timeout:
+            self.paused = False
+            logging.warning("resuming processing, {} staged has not fallen "
+                .format(format_bytes(self.staged_bytes))
+                + "in {} seconds".format(self.stall_timeout))
+
+def list_dirs(dir_path):
+    """List the sub-directories of a directory
+
+    :param dir_path: path to directory
+    :type dir_path: str
+    :return: paths to sub-directories, empty if the directory does not exist
+    :rtype: list[str]
+    """
+
+    try:
+        return [e.path for e in os.scandir(dir_path)
+            if e.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+def get_dir_bytes(dir_path):
+    """Get the total size of the files beneath a directory
+
+    :param dir_path: path to directory
+    :type dir_path: str
+    :return: total size (bytes) of files, not following symlinks, 0 if the
+        directory does not exist
+    :rtype: int
+    """
+
+    n_bytes = 0
+    dirs = [dir_path]
+    while dirs:
+        try:
+            entries = list(os.scandir(dirs.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                else:
+                    n_bytes += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                # removed while walking
+                pass
+    return n_bytes
+
+def remove_staged_outputs(manifest_path):
+    """Remove a flatfile's staged sequences and metadata, after its upload
+    has completed
+
+    Only the sequence and metadata directories of the flatfile's processing
+    sub-directory are removed. The manifest, csvs and logs are kept.
+
+    :param manifest_path: path to the flatfile's upload manifest, in the logs
+        directory of its processing sub-directory
+    :type manifest_path: str
+    :return: number of bytes removed
+    :rtype: int
+    """
+
+    subdir = os.path.dirname(os.path.dirname(os.path.abspath(manifest_path)))
+    n_bytes = 0
+    for name in STAGED_SUBDIRS:
+        staged_dir = os.path.join(subdir, name)
+        if os.path.isdir(staged_dir) and not os.path.islink(staged_dir):
+            n_bytes += get_dir_bytes(staged_dir)
+            shutil.rmtree(staged_dir, ignore_errors=True)
+    return n_bytes
+
+def is_cleanup_enabled(source_config):
+    """Check whether a source config removes staged outputs after upload
+
+    :param source_config: path to source JSON config
+    :type source_config: str
+    :return: True if staging_cleanup is set, without content_store_dir
+    :rtype: bool
+    """
+
+    try:
+        config_obj = json.load(open(source_config, "r"))
+    except (OSError, ValueError):
+        return False
+    return bool(config_obj.get("staging_cleanup")) \
+        and not config_obj.get("content_store_dir")
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Defines BloomFilter class, a compact probabilistic set of strings"""
+
+import hashlib
+import math
+import os
+
+class BloomFilter(object):
+    """Probabilistic set membership for strings, with no false negatives
+
+    Each item sets k bits of an m bit array, at positions derived from a
+    single 128-bit hash by double hashing. A membership query returning
+    False is always correct, while True is wrong with a probability of
+    roughly the configured false positive rate, provided no more than
+    capacity items have been added.
+
+    :param capacity: expected number of items
+    :type capacity: int
+    :param error_rate: target false positive rate at capacity
+    :type error_rate: float
+    :param n_bits: size of the bit array (m)
+    :type n_bits: int
+    :param n_hashes: number of bits set per item (k)
+    :type n_hashes: int
+    :param bits: the bit array
+    :type bits: bytearray
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """Constructor method"""
+
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.n_bits = int(math.ceil(
+            -self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(
+            self.n_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    def add(self, item):
+        """Add an item to the filter
+
+        :param item: item to add
+        :type item: str
+        """
+
+        for position in self.__positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        """Check whether an item may have been added to the filter
+
+        :param item: item to check
+        :type item: str
+        :return: False if the item was definitely not added
+        :rtype: bool
+        """
+
+        for position in self.__positions(item):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, file_path, header=""):
+        """Write the filter to a file, replacing any existing file atomically
+
+        :param file_path: path to output file
+        :type file_path: str
+        :param header: single line of caller metadata stored with the filter
+        :type header: str
+        """
+
+        tmp_path = file_path + ".tmp." + str(os.getpid())
+        with open(tmp_path, "wb") as output_file:
+            output_file.write("{}\t{}\t{}\t{}\n".format(self.capacity,
+                self.error_rate, len(self.bits), header).encode())
+            output_file.write(self.bits)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """Read a filter written by save
+
+        :param file_path: path to the saved filter
+        :type file_path: str
+        :return: the filter, and the header line it was saved with
+        :rtype: list
+        """
+
+        with open(file_path, "rb") as input_file:
+            capacity, error_rate, n_bytes, header = \
+                input_file.readline().decode().rstrip("\n").split("\t", 3)
+            bloom = cls(int(capacity), float(error_rate))
+            bits = input_file.read()
+        if len(bits) != int(n_bytes) or len(bits) != len(bloom.bits):
+            raise Exception("truncated bloom filter file: " + file_path)
+        bloom.bits = bytearray(bits)
+        return [bloom, header]
+
+    def __positions(self, item):
+        """Get the bit positions for an item
+
+        :param item: item to hash
+        :type item: str
+        :return: k bit positions
+        :rtype: list[int]
+        """
+
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(0, self.n_hashes)]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Defines ContentStore class, stages sequences once by their digest"""
+
+import os
+import socket
+import uuid
+
+class ContentStore(object):
+    """Content-addressed staging area for sequences, shared by all flatfiles
+
+    Each sequence is stored once, in a file named after its ga4gh digest,
+    beneath two levels of directories named after the first four characters
+    of the digest (e.g. sequence/Ab/Cd/SQ.AbCd...), so that no directory
+    holds too many files. A sequence already in the store, e.g. the same
+    sequence in another assembly or an assembly that is processed again, is
+    not written again, and the manifests of every flatfile containing it
+    refer to the same file.
+
+    A new sequence is written to a temporary file, then hardlinked to its
+    path, so that a sequence file is never seen partially written, and two
+    jobs writing the same sequence at once store it only once. Temporary
+    files are named by host and a random uuid, and created exclusively, so
+    writers on different hosts sharing the store over NFS never write to
+    the same one.
+
+    :param store_dir: root directory of the store
+    :type store_dir: str
+    """
+
+    SUBDIR = "sequence"
+    PREFIX_LENGTH = 3
+
+    def __init__(self, store_dir):
+        """Constructor method"""
+
+        self.store_dir = store_dir
+
+    def get_path(self, digest):
+        """Get the path of a sequence in the store
+
+        :param digest: ga4gh digest of the sequence, e.g. SQ.xxx
+        :type digest: str
+        :return: path to the sequence file
+        :rtype: str
+        """
+
+        key = digest[self.PREFIX_LENGTH:]
+        return os.path.join(self.store_dir, self.SUBDIR, key[:2], key[2:4],
+            digest)
+
+    def put(self, digest, seq):
+        """Add a sequence to the store, unless it is already there
+
+        :param digest: ga4gh digest of the sequence
+        :type digest: str
+        :param seq: normalized sequence
+        :type seq: bytes
+        :return: path to the sequence file, and True if it was written, False
+            if the sequence was already stored
+        :rtype: list
+        """
+
+        path = self.get_path(digest)
+        if os.path.exists(path):
+            return [path, False]
+
+        seq_dir = os.path.dirname(path)
+        if not os.path.exists(seq_dir):
+            os.makedirs(seq_dir, exist_ok=True)
+        tmp_path = "{}.{}.{}.tmp".format(path, socket.gethostname(),
+            uuid.uuid4().hex)
+        with open(tmp_path, "xb") as seq_file:
+            seq_file.write(seq)
+        try:
+            os.link(tmp_path, path)
+            written = True
+        except FileExistsError:
+            # another writer stored the same sequence first
+            written = False
+        finally:
+            os.remove(tmp_path)
+        return [path, written]
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Defines DigestIndex class, records digests already uploaded"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from ga4gh.refget.loader.store.bloom import BloomFilter
+
+class DigestIndex(object):
+    """Persistent set of sequence digests written to each destination
+
+    A digest (ga4gh, trunc512, or md5) is added to the index once the
+    sequence and metadata objects stored under it have all been written to a
+    destination. Because digests are derived from sequence content, an
+    indexed digest never needs to be uploaded to that destination again.
+
+    The exact set is held in a SQLite database, which many upload jobs can
+    share, on hosts that may only see it over NFS, so it uses a rollback
+    journal rather than WAL. Lookups are fronted by an in-memory Bloom
+    filter, so the large majority of new (not yet uploaded) digests are
+    answered without a query.
+    The filter is saved next to the database (one file per destination) along
+    with the last database row it covers, so that opening the index only
+    reads rows added since, rather than the whole table.
+
+    :param index_path: path to the SQLite database
+    :type index_path: str
+    :param destination_id: identifies the destination, e.g. s3://bucket
+    :type destination_id: str
+    :param capacity: expected number of digests, sizes the Bloom filter
+    :type capacity: int
+    :param bloom_path: path to the saved Bloom filter
+    :type bloom_path: str
+    :param bloom: in-memory Bloom filter of all indexed digests
+    :type bloom: class:`BloomFilter`
+    :param last_rowid: last database row added to the Bloom filter
+    :type last_rowid: int
+    :param pending: digests added but not yet written to the database
+    :type pending: set[str]
+    """
+
+    DEFAULT_CAPACITY = 10000000
+    FLUSH_SIZE = 1000
+
+    def __init__(self, index_path, destination_id, capacity=None):
+        """Constructor method"""
+
+        self.index_path = index_path
+        self.destination_id = destination_id
+        self.capacity = capacity or self.DEFAULT_CAPACITY
+        self.bloom_path = "{}.{}.bloom".format(index_path,
+            hashlib.sha1(destination_id.encode()).hexdigest()[:12])
+        self.pending = set()
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(index_path, timeout=60,
+            check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute("PRAGMA busy_timeout=60000")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS uploaded_digest ("
+            + "destination TEXT NOT NULL, "
+            + "digest TEXT NOT NULL, "
+            + "UNIQUE (destination, digest))"
+        )
+        self.connection.commit()
+        self.__initialize_bloom()
+
+    def __contains__(self, digest):
+        """Check whether a digest has been uploaded to the destination
+
+        :param digest: sequence digest
+        :type digest: str
+        :return: True if the digest is in the index
+        :rtype: bool
+        """
+
+        if digest not in self.bloom:
+            return False
+        with self.lock:
+            if digest in self.pending:
+                return True
+            row = self.connection.execute(
+                "SELECT 1 FROM uploaded_digest "
+                + "WHERE destination = ? AND digest = ?",
+                (self.destination_id, digest)
+            ).fetchone()
+        return row is not None
+
+    def contains_all(self, digests):
+        """Check whether all digests have been uploaded to the destination
+
+        :param digests: sequence digests
+        :type digests: list[str]
+        :return: True if every digest is in the index
+        :rtype: bool
+        """
+
+        for digest in digests:
+            if digest not in self:
+                return False
+        return True
+
+    def add(self, digests):
+        """Add digests to the index
+
+        Digests are buffered, and written to the database in batches.
+
+        :param digests: sequence digests
+        :type digests: list[str]
+        """
+
+        with self.lock:
+            for digest in digests:
+                self.bloom.add(digest)
+                self.pending.add(digest)
+            if len(self.pending) >= self.FLUSH_SIZE:
+                self.__flush()
+
+    def close(self):
+        """Write buffered digests, save the Bloom filter, close the database"""
+
+        with self.lock:
+            self.__flush()
+            self.__catch_up()
+            try:
+                self.bloom.save(self.bloom_path, str(self.last_rowid))
+            except OSError as e:
+                logging.warning("could not save bloom filter: " + str(e))
+            self.connection.close()
+
+    def __flush(self):
+        """Write buffered digests to the database, lock must be held"""
+
+        if not self.pending:
+            return
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO uploaded_digest (destination, digest) "
+            + "VALUES (?, ?)",
+            [(self.destination_id, d) for d in self.pending]
+        )
+        self.connection.commit()
+        self.pending = set()
+
+    def __catch_up(self):
+        """Add rows written since the Bloom filter was last updated"""
+
+        cursor = self.connection.execute(
+            "SELECT rowid, destination, digest FROM uploaded_digest "
+            + "WHERE rowid > ?",
+            (self.last_rowid,)
+        )
+        for rowid, destination, digest in cursor:
+            if destination == self.destination_id:
+                self.bloom.add(digest)
+            self.last_rowid = max(self.last_rowid, rowid)
+
+    def __initialize_bloom(self):
+        """Load the saved Bloom filter, or build a new one from the database
+
+        The saved filter is discarded if the database now holds more rows than
+        its capacity allows for, in which case a larger filter is built.
+        """
+
+        n_rows = self.connection.execute(
+            "SELECT COALESCE(MAX(rowid), 0) FROM uploaded_digest").fetchone()[0]
+
+        self.bloom = None
+        self.last_rowid = 0
+        if os.path.exists(self.bloom_path):
+            try:
+                bloom, header = BloomFilter.load(self.bloom_path)
+                if bloom.capacity >= n_rows:
+                    self.bloom = bloom
+                    self.last_rowid = int(header)
+                    self.capacity = bloom.capacity
+            except Exception as e:
+                logging.warning("discarding bloom filter: " + str(e))
+
+        if self.bloom is None:
+            if n_rows > self.capacity:
+                self.capacity = n_rows * 2
+            self.bloom = BloomFilter(self.capacity)
+        self.__catch_up()
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""Defines StatusStore class, records the status of each flatfile's jobs"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from ga4gh.refget.loader.sources.ena.assembly.functions.time import timestamp
+
+class StatusStore(object):
+    """Transactional store of job statuses, shared by all jobs of a run
+
+    Each job (the processing, manifest and upload of a single flatfile) is
+    identified by the absolute path of its upload manifest, which is known to
+    the scheduler before the job runs, and to the manifest and upload
+    commands as they run. A job's row records its date, accession and url,
+    the last stage reached, its status, and an error message if it failed.
+
+    The store is a single SQLite database, which many batch jobs can update,
+    and a whole run can be summarized with one query instead of reading a
+    status file per flatfile. Jobs on different hosts share it through the
+    processing directory, often over NFS, where WAL's shared memory index
+    is unsafe, so it uses a rollback journal. Writes are short, and those
+    that find the database locked wait, then are retried until timeout.
+
+    A job whose upload is split into shards, uploaded by parallel tasks,
+    records each shard's status separately. Once every shard has finished,
+    their statuses are rolled up into the job's single status.
+
+    Stages also record how much work they did and how long it took (input
+    bytes, sequences, uploaded objects, seconds), so that the throughput of
+    earlier runs can be used to plan later ones.
+
+    :param db_path: path to the SQLite database
+    :type db_path: str
+    :param timeout: seconds to wait for a lock held by another job
+    :type timeout: int
+    """
+
+    FILENAME = "status.db"
+    COLUMNS = ["job", "date", "accession", "url", "stage", "status", "message",
+        "last_modified"]
+
+    def __init__(self, db_path, timeout=600):
+        """Constructor method"""
+
+        self.db_path = db_path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=timeout,
+            check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute("PRAGMA busy_timeout={}".format(
+            int(timeout * 1000)))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS job_status ("
+            + "job TEXT PRIMARY KEY, "
+            + "date TEXT, "
+            + "accession TEXT, "
+            + "url TEXT, "
+            + "stage TEXT, "
+            + "status TEXT NOT NULL, "
+            + "message TEXT, "
+            + "last_modified TEXT)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS job_status_date_status "
+            + "ON job_status (date, status)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS job_status_accession "
+            + "ON job_status (accession)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS shard_status ("
+            + "job TEXT NOT NULL, "
+            + "shard INTEGER NOT NULL, "
+            + "status TEXT NOT NULL, "
+            + "message TEXT, "
+            + "last_modified TEXT, "
+            + "PRIMARY KEY (job, shard))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS job_metrics ("
+            + "job TEXT NOT NULL, "
+            + "stage TEXT NOT NULL, "
+            + "shard INTEGER NOT NULL, "
+            + "input_bytes INTEGER, "
+            + "sequences INTEGER, "
+            + "objects INTEGER, "
+            + "seconds REAL, "
+            + "last_modified TEXT, "
+            + "PRIMARY KEY (job, stage, shard))"
+        )
+        self.connection.commit()
+
+    @classmethod
+    def get_path(cls, config_obj):
+        """Get the status database path described by a source config
+
+        :param config_obj: source config, as validated by ena_assembly.json
+        :type config_obj: dict
+        :return: path of the status_db setting, or status.db in the root
+            processing dir
+        :rtype: str
+        """
+
+        if config_obj.get("status_db"):
+            return config_obj["status_db"]
+        return os.path.join(config_obj["processing_dir"], cls.FILENAME)
+
+    @classmethod
+    def from_config(cls, config_obj):
+        """Open the status store described by a source config
+
+        :param config_obj: source config, as validated by ena_assembly.json
+        :type config_obj: dict
+        :return: status store
+        :rtype: class:`StatusStore`
+        """
+
+        return cls(cls.get_path(config_obj))
+
+    @classmethod
+    def from_config_file(cls, config_path):
+        """Open the status store described by a source config file
+
+        :param config_path: path to the source JSON config
+        :type config_path: str
+        :return: status store, or None if the config could not be read
+        :rtype: class:`StatusStore`
+        """
+
+        try:
+            config_obj = json.load(open(config_path, "r"))
+        except (OSError, ValueError):
+            return None
+        if "processing_dir" not in config_obj \
+            and "status_db" not in config_obj:
+            return None
+        return cls.from_config(config_obj)
+
+    @staticmethod
+    def get_job_key(manifest_path):
+        """Get the key identifying a job, from its upload manifest path
+
+        :param manifest_path: path to the job's upload manifest
+        :type manifest_path: str
+        :return: normalized, absolute manifest path
+        :rtype: str
+        """
+
+        return os.path.abspath(os.path.normpath(manifest_path))
+
+    def get(self, job):
+        """Get the status of a job
+
+        :param job: job key
+        :type job: str
+        :return: status (job, date, accession, url, stage, status, message,
+            last_modified), or None if not recorded
+        :rtype: dict
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT " + ", ".join(self.COLUMNS) + " FROM job_status "
+                + "WHERE job = ?", (job,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(self.COLUMNS, row))
+
+    def get_latest_status(self, accession, url):
+        """Get the status of the most recently updated job of a flatfile
+
+        :param accession: versioned accession
+        :type accession: str
+        :param url: WGS set flatfile url
+        :type url: str
+        :return: status of the flatfile's latest job, or None if not recorded
+        :rtype: str
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status FROM job_status WHERE accession = ? "
+                + "AND url = ? ORDER BY last_modified DESC LIMIT 1",
+                (accession, url)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def update(self, job, fields):
+        """Set fields of a job's status, creating it if needed
+
+        :param job: job key
+        :type job: str
+        :param fields: column -> value, must include status for a new job
+        :type fields: dict[str, str]
+        """
+
+        fields = dict(fields)
+        fields["last_modified"] = timestamp()
+        for column in fields.keys():
+            if column not in self.COLUMNS:
+                raise Exception("unknown status field: " + column)
+        columns = ["job"] + sorted(fields.keys())
+        values = [job] + [fields[c] for c in columns[1:]]
+        sql = "INSERT INTO job_status ({}) VALUES ({}) ".format(
+                ", ".join(columns), ", ".join(["?"] * len(columns))) \
+            + "ON CONFLICT (job) DO UPDATE SET " \
+            + ", ".join(["{0} = excluded.{0}".format(c) for c in columns[1:]])
+        self.__execute(sql, values)
+
+    def clear_shards(self, job):
+        """Forget the shard statuses of a job's previous upload
+
+        :param job: job key
+        :type job: str
+        """
+
+        self.__execute("DELETE FROM shard_status WHERE job = ?", (job,))
+
+    def update_shard(self, job, shard, n_shards, status, message):
+        """Record the final status of one shard of a job's upload
+
+        :param job: job key
+        :type job: str
+        :param shard: shard number, from 1
+        :type shard: int
+        :param n_shards: number of shards of the job's upload
+        :type n_shards: int
+        :param status: final status of the shard, Completed or Failed
+        :type status: str
+        :param message: error message, or "None"
+        :type message: str
+        :return: rolled up status and message of the job if every shard has
+            finished, otherwise None
+        :rtype: list[str]
+        """
+
+        self.__execute("INSERT INTO shard_status "
+            + "(job, shard, status, message, last_modified) "
+            + "VALUES (?, ?, ?, ?, ?) ON CONFLICT (job, shard) DO UPDATE SET "
+            + "status = excluded.status, message = excluded.message, "
+            + "last_modified = excluded.last_modified",
+            (job, shard, status, message, timestamp()))
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT shard, status, message FROM shard_status "
+                + "WHERE job = ? ORDER BY shard", (job,)).fetchall()
+        if len(rows) < n_shards:
+            return None
+
+        failed = [r for r in rows if r[1] != "Completed"]
+        if not failed:
+            return ["Completed", "None"]
+        return ["Failed", "{} of {} upload shards failed, shard {}: {}".format(
+            len(failed), n_shards, failed[0][0], failed[0][2])]
+
+    def record_metrics(self, job, stage, shard=None, input_bytes=0,
+        sequences=0, objects=0, seconds=0.0):
+        """Record the work done by a job's stage, replacing any earlier run
+
+        :param job: job key
+        :type job: str
+        :param stage: stage name, e.g. process, manifest, upload
+        :type stage: str
+        :param shard: shard number, if the stage is split
+        :type shard: int, optional
+        :param input_bytes: size of the flatfile read by the stage
+        :type input_bytes: int
+        :param sequences: number of sequences produced
+        :type sequences: int
+        :param objects: number of objects uploaded
+        :type objects: int
+        :param seconds: wall time of the stage
+        :type seconds: float
+        """
+
+        self.__execute("INSERT INTO job_metrics "
+            + "(job, stage, shard, input_bytes, sequences, objects, seconds, "
+            + "last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            + "ON CONFLICT (job, stage, shard) DO UPDATE SET "
+            + "input_bytes = excluded.input_bytes, "
+            + "sequences = excluded.sequences, "
+            + "objects = excluded.objects, "
+            + "seconds = excluded.seconds, "
+            + "last_modified = excluded.last_modified",
+            (job, stage, shard if shard else 0, input_bytes, sequences,
+                objects, seconds, timestamp()))
+
+    def get_throughput(self):
+        """Total the work recorded by each stage, over all jobs
+
+        :return: stage -> number of jobs, input bytes, sequences, objects,
+            and seconds
+        :rtype: dict[str, dict]
+        """
+
+        columns = ["jobs", "input_bytes", "sequences", "objects", "seconds"]
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT stage, COUNT(DISTINCT job), SUM(input_bytes), "
+                + "SUM(sequences), SUM(objects), SUM(seconds) "
+                + "FROM job_metrics GROUP BY stage").fetchall()
+        return {r[0]: dict(zip(columns, r[1:])) for r in rows}
+
+    def summarize(self, date=None):
+        """Count jobs by date, status and stage
+
+        :param date: only count jobs of this YYYY-MM-DD date
+        :type date: str, optional
+        :return: date, status, stage, and number of jobs, per group
+        :rtype: list[list]
+        """
+
+        where, params = self.__where_date(date)
+        with self.lock:
+            return [list(r) for r in self.connection.execute(
+                "SELECT date, status, stage, COUNT(*) FROM job_status " + where
+                + "GROUP BY date, status, stage ORDER BY date, status, stage",
+                params)]
+
+    def failures(self, date=None):
+        """Count failed jobs by error message
+
+        :param date: only count jobs of this YYYY-MM-DD date
+        :type date: str, optional
+        :return: message, stage, and number of failed jobs, most common first
+        :rtype: list[list]
+        """
+
+        where, params = self.__where_date(date)
+        where += ("AND " if where else "WHERE ") + "status = 'Failed' "
+        with self.lock:
+            return [list(r) for r in self.connection.execute(
+                "SELECT message, stage, COUNT(*) AS n FROM job_status " + where
+                + "GROUP BY message, stage ORDER BY n DESC, message", params)]
+
+    def close(self):
+        """Close the database"""
+
+        with self.lock:
+            self.connection.close()
+
+    def __where_date(self, date):
+        """Get a where clause restricting jobs to a date
+
+        :param date: YYYY-MM-DD date, or None for all dates
+        :type date: str
+        :return: where clause, and its parameters
+        :rtype: list
+        """
+
+        if date is None:
+            return ["", ()]
+        return ["WHERE date = ? ", (date,)]
+
+    def __execute(self, sql, params):
+        """Execute and commit a write, retrying while the database is locked
+
+        :param sql: SQL statement
+        :type sql: str
+        :param params: statement parameters
+        :type params: list
+        """
+
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                with self.lock:
+                    self.connection.execute(sql, params)
+                    self.connection.commit()
+                return
+            except sqlite3.OperationalError as e:
+                with self.lock:
+                    self.connection.rollback()
+                if "locked" not in str(e) or time.time() > deadline:
+                    raise
+                time.sleep(0.1)
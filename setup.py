@@ -17,12 +17,17 @@ with open("README.md", "r") as fh:
     long_description = fh.read()
 
 install_requires = [
-    "awscli", 
+    "boto3",
     "click",
     "jsonschema",
     "requests"
 ]
 
+tests_require = [
+    "moto[s3]>=5",
+    "pytest"
+]
+
 setuptools.setup(
     name=NAME,
     version=VERSION,
@@ -41,6 +46,7 @@ setuptools.setup(
     },
     packages=setuptools.find_packages(),
     install_requires=install_requires,
+    extras_require={"test": tests_require},
     entry_points={
         "console_scripts": [
             'refget-loader=ga4gh.refget.loader.cli.entrypoint:main',
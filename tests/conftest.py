@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures for refget-loader tests"""
+
+import boto3
+import pytest
+from moto import mock_aws
+
+BUCKET_NAME = "testbucket"
+
+@pytest.fixture
+def s3_config(monkeypatch):
+    """Destination config of an S3 bucket mocked in-process by moto"""
+
+    for name in ["AWS_PROFILE", "AWS_SHARED_CREDENTIALS_FILE",
+        "AWS_CONFIG_FILE"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET_NAME)
+        yield {
+            "bucket_name": BUCKET_NAME,
+            "max_concurrency": 4,
+            "max_attempts": 2
+        }
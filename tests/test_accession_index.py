@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Tests of the accession index, and its use of the status store"""
+
+import os
+from ga4gh.refget.loader.sources.ena.assembly.utils.accession_index import \
+    AccessionIndex
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+URL = "ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/AB000001.dat.gz"
+OTHER_URL = "ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/AB000002" \
+    + ".dat.gz"
+
+def test_scanned_versions(tmp_path):
+    index = AccessionIndex(str(tmp_path / "index.db"))
+
+    index.record_scanned([["GCA_000000001.2", URL]], "2020-01-01")
+    index.record_state("GCA_000000001.2", URL, "Completed")
+
+    # an older version is ignored, the same version keeps its state
+    index.record_scanned([["GCA_000000001.1", OTHER_URL]], "2020-01-02")
+    index.record_scanned([["GCA_000000001.2", URL]], "2020-01-03")
+    entry = index.get("GCA_000000001")
+    assert [entry["version"], entry["url"], entry["state"]] == \
+        [2, URL, "Completed"]
+    assert entry["last_updated"] == "2020-01-03"
+
+    # a new version resets the state
+    index.record_scanned([["GCA_000000001.3", URL]], "2020-01-04")
+    assert index.get("GCA_000000001.3")["state"] == "NotAttempted"
+    assert index.get("GCA_000000009.1") is None
+    index.close()
+
+def test_needs_processing(tmp_path):
+    index = AccessionIndex(str(tmp_path / "index.db"))
+    flatfile_path = tmp_path / "AB000001.dat.gz"
+    flatfile_path.write_bytes(b"flatfile")
+    accession = "GCA_000000001.1"
+
+    assert index.needs_processing(accession, URL, str(flatfile_path))
+
+    index.record_state(accession, URL, "Completed", str(flatfile_path))
+    assert not index.needs_processing(accession, URL, str(flatfile_path))
+    assert index.needs_processing("GCA_000000001.2", URL,
+        str(flatfile_path))
+    assert index.needs_processing(accession, OTHER_URL, str(flatfile_path))
+
+    flatfile_path.write_bytes(b"changed flatfile")
+    assert index.needs_processing(accession, URL, str(flatfile_path))
+
+    for state in ["InProgress", "Failed", "NotAttempted"]:
+        index.record_state(accession, URL, state, str(flatfile_path))
+        assert index.needs_processing(accession, URL, str(flatfile_path))
+    index.close()
+
+def test_needs_processing_with_status_store(tmp_path):
+    index = AccessionIndex(str(tmp_path / "index.db"))
+    status_store = StatusStore(str(tmp_path / "status.db"))
+    flatfile_path = str(tmp_path / "AB000001.dat.gz")
+    open(flatfile_path, "wb").write(b"flatfile")
+    accession = "GCA_000000001.1"
+    job = StatusStore.get_job_key(os.path.join(str(tmp_path),
+        "AB000001.manifest.csv"))
+
+    # a submitted job is InProgress until the store reports its outcome
+    index.record_state(accession, URL, "InProgress", flatfile_path)
+    assert index.needs_processing(accession, URL, flatfile_path,
+        status_store=status_store)
+    status_store.update(job, {"accession": accession, "url": URL,
+        "stage": "upload", "status": "InProgress"})
+    assert index.needs_processing(accession, URL, flatfile_path,
+        status_store=status_store)
+    status_store.update(job, {"status": "Failed"})
+    assert index.needs_processing(accession, URL, flatfile_path,
+        status_store=status_store)
+
+    status_store.update(job, {"status": "Completed"})
+    assert status_store.get_latest_status(accession, URL) == "Completed"
+    assert status_store.get_latest_status(accession, OTHER_URL) is None
+    assert not index.needs_processing(accession, URL, flatfile_path,
+        status_store=status_store)
+    assert index.get(accession)["state"] == "Completed"
+
+    # once recorded as completed, the flatfile is still checked for changes
+    open(flatfile_path, "wb").write(b"changed flatfile")
+    assert index.needs_processing(accession, URL, flatfile_path,
+        status_store=status_store)
+    status_store.close()
+    index.close()
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""Tests of accession scans against a local stand-in for the search API"""
+
+import datetime
+import hashlib
+import http.server
+import os
+import re
+import threading
+import urllib.parse
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.utils.accession_index import \
+    AccessionIndex
+from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_scanner import \
+    AssemblyScanner
+from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_xml_parser \
+    import iter_assembly_records
+from ga4gh.refget.loader.sources.ena.assembly.utils.range_scanner import \
+    create_session, scan_date_range, ACCESSION_LIST_FILENAME
+from ga4gh.refget.loader.sources.ena.assembly.utils.response_cache import \
+    ResponseCache
+
+ASSEMBLY_XML = '<ASSEMBLY accession="{accession}"><ASSEMBLY_LINKS>' \
+    + '<ASSEMBLY_LINK><URL_LINK><LABEL>{label}</LABEL><URL>{url}</URL>' \
+    + '</URL_LINK></ASSEMBLY_LINK></ASSEMBLY_LINKS></ASSEMBLY>'
+
+def get_url(n):
+    return "ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/" \
+        + "AB{:06d}.dat.gz".format(n)
+
+def get_assembly_xml(records, with_unlinked=False):
+    body = "<ROOT>"
+    for accession, url in records:
+        body += ASSEMBLY_XML.format(accession=accession, url=url,
+            label="WGS_SET_FLATFILE")
+    if with_unlinked:
+        body += ASSEMBLY_XML.format(accession="GCA_999999999.1",
+            url="ftp://example/other", label="OTHER")
+    return (body + "</ROOT>").encode()
+
+class SearchStub(object):
+    """Stand-in for the search API, serving assemblies by last updated date
+
+    Counts, results and pages are answered from a list of assemblies and
+    their update times, filtered by date only, as the search API does.
+    Responses carry an ETag, and conditional requests with a matching ETag
+    are answered 304.
+    """
+
+    def __init__(self, assemblies):
+        self.assemblies = sorted(assemblies)
+        self.requests = []
+        self.failing_dates = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_window(self, query):
+        bounds = re.findall(r"[<>]=?([\dT:\-]+)", query)
+        return [datetime.datetime.strptime(b[:10], "%Y-%m-%d")
+            for b in bounds]
+
+    def respond(self, params, headers):
+        start, end = self.get_window(params["query"])
+        if start.strftime("%Y-%m-%d") in self.failing_dates:
+            return [500, {}, b"error"]
+        records = [[a, u] for t, a, u in self.assemblies if start <= t < end]
+        if "resultcount" in params:
+            return [200, {}, "Number of results: {:,}".format(
+                len(records)).encode()]
+        if "offset" in params:
+            offset = int(params["offset"]) - 1
+            records = records[offset:offset + int(params["length"])]
+        body = get_assembly_xml(records)
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if headers.get("If-None-Match") == etag:
+            return [304, {"ETag": etag}, b""]
+        return [200, {"ETag": etag}, body]
+
+@pytest.fixture
+def search_stub():
+    """Start a search stub on a local port"""
+
+    stub = SearchStub([])
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            params = {k: v[0] for k, v in urllib.parse.parse_qs(
+                self.rfile.read(length).decode(),
+                keep_blank_values=True).items()}
+            with stub.lock:
+                stub.requests.append(params)
+                stub.in_flight += 1
+                stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            try:
+                status, headers, body = stub.respond(params, self.headers)
+            finally:
+                with stub.lock:
+                    stub.in_flight -= 1
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stub.url = "http://127.0.0.1:{}/".format(server.server_port)
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+def add_assemblies(stub, date_string, times):
+    """Add assemblies updated at minute offsets into a date"""
+
+    start = datetime.datetime.strptime(date_string, "%Y-%m-%d")
+    n = len(stub.assemblies)
+    for minutes in times:
+        n += 1
+        stub.assemblies.append([start + datetime.timedelta(minutes=minutes),
+            "GCA_{:09d}.1".format(n), get_url(n)])
+    stub.assemblies.sort()
+
+def read_accession_list(file_path):
+    lines = open(file_path, "r").read().splitlines()
+    assert lines[0] == "Accession\tURL"
+    return [line.split("\t") for line in lines[1:]]
+
+def test_parse_streamed_xml_in_small_chunks():
+    records = [["GCA_{:09d}.1".format(n), get_url(n)] for n in range(1, 6)]
+    body = get_assembly_xml(records, with_unlinked=True)
+    chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+
+    assert list(iter_assembly_records(chunks)) == records
+    assert list(iter_assembly_records([])) == []
+
+def test_parse_truncated_xml_raises():
+    body = get_assembly_xml([["GCA_000000001.1", get_url(1)]])
+
+    with pytest.raises(Exception):
+        list(iter_assembly_records([body[:-10]]))
+
+def test_generate_accession_list(search_stub, tmp_path):
+    add_assemblies(search_stub, "2020-01-01", [5, 60, 600])
+    add_assemblies(search_stub, "2020-01-02", [5])
+    index = AccessionIndex(str(tmp_path / "index.db"))
+    list_path = str(tmp_path / ACCESSION_LIST_FILENAME)
+
+    scanner = AssemblyScanner("2020-01-01", url=search_stub.url,
+        accession_index=index)
+    scanner.generate_accession_list(list_path)
+
+    records = read_accession_list(list_path)
+    assert [r[0] for r in records] == ["GCA_000000001.1", "GCA_000000002.1",
+        "GCA_000000003.1"]
+    assert search_stub.requests[0]["query"] == \
+        "last_updated>=2020-01-01 AND last_updated<2020-01-02"
+    assert index.get("GCA_000000002")["url"] == get_url(2)
+    assert index.get("GCA_000000004") is None
+    index.close()
+
+def test_failed_scan_leaves_no_accession_list(search_stub, tmp_path):
+    search_stub.failing_dates.add("2020-01-01")
+    list_path = str(tmp_path / ACCESSION_LIST_FILENAME)
+
+    with pytest.raises(Exception):
+        AssemblyScanner("2020-01-01", url=search_stub.url) \
+            .generate_accession_list(list_path)
+    assert list(tmp_path.iterdir()) == []
+
+def test_split_into_pages(search_stub, tmp_path):
+    # assemblies updated throughout the day, and the next day
+    add_assemblies(search_stub, "2020-01-01",
+        [m * 41 for m in range(0, 35)])
+    add_assemblies(search_stub, "2020-01-02", [0, 60])
+    list_path = str(tmp_path / ACCESSION_LIST_FILENAME)
+
+    scanner = AssemblyScanner("2020-01-01", url=search_stub.url,
+        session=create_session(3), split_threshold=10, max_concurrency=3)
+    scanner.generate_accession_list(list_path)
+
+    records = read_accession_list(list_path)
+    expected = [[a, u] for t, a, u in search_stub.assemblies][:35]
+    assert records == expected
+    assert all([r["query"] == "last_updated>=2020-01-01 AND "
+        + "last_updated<2020-01-02" for r in search_stub.requests])
+    pages = [r for r in search_stub.requests if "offset" in r]
+    assert sorted([int(r["offset"]) for r in pages]) == [1, 11, 21, 31]
+    assert all([r["length"] == "10" for r in pages])
+    assert len(search_stub.requests) == 5
+    assert search_stub.max_in_flight <= 3
+
+    # a date below the threshold is a single request, after its count
+    search_stub.requests = []
+    AssemblyScanner("2020-01-02", url=search_stub.url, split_threshold=10) \
+        .generate_accession_list(list_path)
+    assert len(read_accession_list(list_path)) == 2
+    assert [sorted(r.keys()) for r in search_stub.requests] == [
+        ["query", "result", "resultcount"],
+        ["display", "fields", "query", "result"]]
+
+def test_cached_responses_are_revalidated(search_stub, tmp_path):
+    add_assemblies(search_stub, "2020-01-01", [5, 60])
+    cache = ResponseCache(str(tmp_path / "cache"))
+    list_path = str(tmp_path / ACCESSION_LIST_FILENAME)
+
+    AssemblyScanner("2020-01-01", url=search_stub.url, cache=cache) \
+        .generate_accession_list(list_path)
+    first = read_accession_list(list_path)
+
+    # unchanged: a conditional request is answered 304, the cached body used
+    AssemblyScanner("2020-01-01", url=search_stub.url, cache=cache) \
+        .generate_accession_list(list_path)
+    assert read_accession_list(list_path) == first
+    assert len(search_stub.requests) == 2
+
+    # changed: the new body replaces the cached one
+    add_assemblies(search_stub, "2020-01-01", [120])
+    AssemblyScanner("2020-01-01", url=search_stub.url, cache=cache) \
+        .generate_accession_list(list_path)
+    assert len(read_accession_list(list_path)) == 3
+
+    # fresh entries are used without a request
+    fresh_cache = ResponseCache(str(tmp_path / "cache"), max_age=3600)
+    AssemblyScanner("2020-01-01", url=search_stub.url, cache=fresh_cache) \
+        .generate_accession_list(list_path)
+    assert len(search_stub.requests) == 3
+    assert len(read_accession_list(list_path)) == 3
+
+def test_not_modified_response_serves_cached_body(search_stub, tmp_path):
+    add_assemblies(search_stub, "2020-01-01", [5, 60])
+    cache = ResponseCache(str(tmp_path / "cache"))
+    list_path = str(tmp_path / ACCESSION_LIST_FILENAME)
+    scanner = AssemblyScanner("2020-01-01", url=search_stub.url, cache=cache)
+    scanner.generate_accession_list(list_path)
+
+    # the cached body is altered, so that it differs from the search API's
+    key = cache.get_key(search_stub.url, scanner.get_params())
+    meta = cache.get(key)
+    body = open(meta["body_path"], "rb").read()
+    open(meta["body_path"], "wb").write(body.replace(b"GCA_000000001.1",
+        b"GCA_000000009.1"))
+    conditional_headers = []
+    respond = search_stub.respond
+
+    def recording_respond(params, headers):
+        conditional_headers.append(headers.get("If-None-Match"))
+        return respond(params, headers)
+
+    search_stub.respond = recording_respond
+    AssemblyScanner("2020-01-01", url=search_stub.url, cache=cache) \
+        .generate_accession_list(list_path)
+
+    assert conditional_headers == [meta["etag"]]
+    assert [r[0] for r in read_accession_list(list_path)] == \
+        ["GCA_000000009.1", "GCA_000000002.1"]
+    assert cache.get(key)["stored"] == meta["stored"]
+
+def test_scan_date_range_shares_request_slots(search_stub, tmp_path):
+    dates_dirs = []
+    for day in range(1, 5):
+        date_string = "2020-01-0{}".format(day)
+        add_assemblies(search_stub, date_string,
+            [h * 60 + m for h in range(0, 24, 3) for m in range(0, 4)])
+        processing_dir = tmp_path / date_string
+        processing_dir.mkdir()
+        dates_dirs.append([date_string, str(processing_dir)])
+    search_stub.failing_dates.add("2020-01-03")
+
+    failed = scan_date_range(dates_dirs, 2, url=search_stub.url,
+        split_threshold=5)
+
+    assert failed == ["2020-01-03"]
+    for date_string, processing_dir in dates_dirs:
+        list_path = tmp_path / date_string / ACCESSION_LIST_FILENAME
+        if date_string in failed:
+            assert not list_path.exists()
+        else:
+            assert len(read_accession_list(str(list_path))) == 32
+    assert search_stub.max_in_flight <= 2
+
+def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=250)
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk",
+        lambda *args: walks.append(args) or walk(*args))
+
+    keys = [cache.get_key("http://x/", {"n": str(n)}) for n in range(4)]
+    for n, key in enumerate(keys[:3]):
+        list(cache.store(key, [b"A" * 100], {"ETag": str(n)}))
+        os.utime(cache.get(key)["body_path"][:-4] + ".json", (n, n))
+
+    # the directory is walked on the first store, and again to evict
+    assert len(walks) == 2
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[1])["etag"] == "1"
+    assert cache.total_bytes == 200
+
+    # replacing an entry does not count its old body
+    list(cache.store(keys[1], [b"A" * 50], {}))
+    assert cache.total_bytes == 150
+    assert len(walks) == 2
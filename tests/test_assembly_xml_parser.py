@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Tests of parsing assembly search responses with the pull parser"""
+
+import re
+import pytest
+from xml.etree import ElementTree
+from ga4gh.refget.loader.sources.ena.assembly.utils.assembly_xml_parser \
+    import iter_assembly_records
+
+ASSEMBLY = """<ASSEMBLY accession="GCA_{n:09d}.{version}" alias="asm{n}">
+  <IDENTIFIERS><PRIMARY_ID>GCA_{n:09d}.{version}</PRIMARY_ID></IDENTIFIERS>
+  <TITLE>Assembly {n} &amp; its &lt;links&gt;</TITLE>
+  <ASSEMBLY_LINKS>
+{links}  </ASSEMBLY_LINKS>
+</ASSEMBLY>
+"""
+LINK = """    <ASSEMBLY_LINK>
+      <URL_LINK>
+        <LABEL>{label}</LABEL>
+        <URL>{url}/AB{n:06d}.{ext}</URL>
+      </URL_LINK>
+    </ASSEMBLY_LINK>
+"""
+URL = "ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab"
+
+def get_response(n_assemblies):
+    assemblies = []
+    for n in range(n_assemblies):
+        labels = [["WGS_SET_FASTA", "fasta.gz"]]
+        # every third assembly has no WGS set flatfile, and is skipped
+        if n % 3 != 2:
+            labels.append(["WGS_SET_FLATFILE", "dat.gz"])
+        if n % 4 == 1:
+            labels.reverse()
+        links = "".join([LINK.format(label=label, url=URL, n=n, ext=ext)
+            for label, ext in labels])
+        assemblies.append(ASSEMBLY.format(n=n, version=n % 2 + 1,
+            links=links))
+    body = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<ROOT>\n" \
+        + "".join(assemblies) + "</ROOT>\n"
+    return body.encode()
+
+def chunked(body, chunk_size):
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+def legacy_records(chunks):
+    # regex over the accumulated response, replaced by the pull parser
+    aggregate_chunk_string = ""
+    for chunk in chunks:
+        aggregate_chunk_string += chunk.decode()
+        assembly_pattern = re.compile("<ASSEMBLY.+?</ASSEMBLY>", re.DOTALL)
+        final_end_position = 0
+        for match in assembly_pattern.finditer(aggregate_chunk_string):
+            final_end_position = match.end()
+            assembly_xml = match.group(0)
+            root = ElementTree.fromstring(assembly_xml)
+            accession = re.compile(
+                'accession=\"(.+?)\"').search(assembly_xml).group(1)
+            url = None
+            for url_link in root.iter("URL_LINK"):
+                if url_link.find("LABEL").text == "WGS_SET_FLATFILE":
+                    url = url_link.find("URL").text
+            if accession and url:
+                yield [accession, url]
+        aggregate_chunk_string = aggregate_chunk_string[final_end_position:]
+
+def test_pull_parser_matches_legacy_parser():
+    body = get_response(30)
+    expected = list(legacy_records([body]))
+    assert len(expected) == 20
+    assert expected[1] == ["GCA_000000001.2", URL + "/AB000001.dat.gz"]
+
+    # chunk boundaries fall inside tags, attributes and entities
+    for chunk_size in [1, 7, 64, 4096, len(body)]:
+        chunks = chunked(body, chunk_size)
+        assert list(iter_assembly_records(chunks)) == expected
+        assert list(legacy_records(chunks)) == expected
+
+def test_empty_and_truncated_responses():
+    assert list(iter_assembly_records([])) == []
+    assert list(iter_assembly_records([get_response(0)])) == []
+
+    body = get_response(3)
+    records = []
+    with pytest.raises(ElementTree.ParseError):
+        for record in iter_assembly_records(chunked(body[:-40], 64)):
+            records.append(record)
+    assert len(records) == 2
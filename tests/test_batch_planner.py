@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Tests of planning flatfile jobs by size, and running packed batches"""
+
+from ga4gh.refget.loader.sources.ena.assembly.utils.batch_planner import \
+    FlatfilePlanner, FlatfileBatch, format_bytes
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    LocalExecutor, STAGES
+
+def write_flatfiles(tmp_path, sizes):
+    flatfiles = []
+    for n, n_bytes in enumerate(sizes):
+        flatfile_path = tmp_path / "AB{:06d}.dat.gz".format(n)
+        if n_bytes is not None:
+            flatfile_path.write_bytes(b"A" * n_bytes)
+        flatfiles.append(["GCA_{:09d}.1".format(n), "ftp://x/{}".format(n),
+            str(flatfile_path)])
+    return flatfiles
+
+def get_plan_sizes(plan):
+    return [[f[3] for f in batch] for batch in plan]
+
+def test_plan_orders_largest_first(tmp_path):
+    flatfiles = write_flatfiles(tmp_path, [10, 300, None, 50])
+
+    plan = FlatfilePlanner().plan(flatfiles)
+
+    assert get_plan_sizes(plan) == [[300], [50], [10], [0]]
+    assert plan[0][0][:3] == flatfiles[1]
+
+def test_plan_packs_small_flatfiles(tmp_path):
+    flatfiles = write_flatfiles(tmp_path, [500, 60, 40, 70, 30, 20, 120])
+
+    planner = FlatfilePlanner(target_bytes=100)
+    plan = planner.plan(flatfiles)
+
+    # first fit in decreasing size, then batches by decreasing total
+    assert get_plan_sizes(plan) == [[500], [120], [70, 30], [60, 40], [20]]
+    summary = planner.summarize(plan)
+    assert summary.splitlines()[0] == "plan: 7 flatfiles (840 B) in 5 jobs"
+    assert "2 jobs pack 4 flatfiles, up to 100 B each" in summary
+    assert "first job: GCA_000000000.1 (500 B), last job: GCA_000000005.1" \
+        in summary
+
+def test_format_bytes():
+    assert format_bytes(999) == "999 B"
+    assert format_bytes(1500) == "1.5 KB"
+    assert format_bytes(2 * 10 ** 12) == "2.0 TB"
+
+def write_member(tmp_path, job_id, failing_stage=None):
+    cmd_dir = tmp_path / job_id / "cmd"
+    log_dir = tmp_path / job_id / "logs"
+    cmd_dir.mkdir(parents=True)
+    log_dir.mkdir(parents=True)
+    for stage in STAGES:
+        (cmd_dir / (stage + ".sh")).write_text(
+            'echo "{} {} $REFGET_LOADER_SHARD"\n'.format(job_id, stage)
+            + ("exit 2\n" if stage == failing_stage else ""))
+    return [job_id, str(cmd_dir), str(log_dir)]
+
+def run_batch(tmp_path, members, stage_tasks=None):
+    batch = FlatfileBatch("batch1", str(tmp_path / "batch1"),
+        stage_tasks=stage_tasks)
+    for member in members:
+        batch.submit(*member)
+    batch.write()
+    executor = LocalExecutor(max_workers=2, stage_tasks=stage_tasks)
+    executor.submit(batch.batch_id, batch.cmd_dir, batch.log_dir)
+    results = executor.finish()
+    return batch.get_results(*results["batch1"])
+
+def test_batch_failure_skips_only_its_flatfile(tmp_path):
+    members = [write_member(tmp_path, "a"),
+        write_member(tmp_path, "b", failing_stage="process"),
+        write_member(tmp_path, "c", failing_stage="upload")]
+
+    results = run_batch(tmp_path, members)
+
+    assert results == {
+        "a": ["Completed", "None"],
+        "b": ["Failed", "process stage failed in batch batch1"],
+        "c": ["Failed", "upload stage failed in batch batch1"]
+    }
+    a_logs = tmp_path / "a" / "logs"
+    assert (a_logs / "manifest.a.log.out").read_text().split() == \
+        ["a", "manifest"]
+    assert not (tmp_path / "b" / "logs" / "manifest.b.log.out").exists()
+
+def test_batch_split_stage_writes_each_task_log(tmp_path):
+    members = [write_member(tmp_path, "a"), write_member(tmp_path, "b")]
+
+    results = run_batch(tmp_path, members, stage_tasks={"upload": 2})
+
+    assert results == {"a": ["Completed", "None"], "b": ["Completed", "None"]}
+    for job_id in ["a", "b"]:
+        for shard in ["1", "2"]:
+            log_path = tmp_path / job_id / "logs" / "upload.{}.{}.log.out" \
+                .format(job_id, shard)
+            assert log_path.read_text() == "{} upload {}\n".format(job_id,
+                shard)
+
+def test_batch_is_rewritten_without_old_failures(tmp_path):
+    members = [write_member(tmp_path, "a", failing_stage="manifest")]
+    assert run_batch(tmp_path, members)["a"][0] == "Failed"
+
+    (tmp_path / "a" / "cmd" / "manifest.sh").write_text("true\n")
+    assert run_batch(tmp_path, members)["a"] == ["Completed", "None"]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Tests of estimating the work of a run from earlier throughput"""
+
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.plan import ena_assembly_plan
+from ga4gh.refget.loader.sources.ena.assembly.utils.batch_planner import \
+    FlatfilePlanner
+from ga4gh.refget.loader.sources.ena.assembly.utils.capacity_planner import \
+    CapacityPlanner, format_seconds
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+URL = "ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/AB{:06d}.dat.gz"
+SIZES = [1000, 2000, 500, None]
+
+def seed_metrics(status_store, seconds_per_byte=0.01):
+    # 0.01 sequences per byte, 0.1 seconds per uploaded object
+    for job, n_bytes in [["a", 1000], ["b", 3000]]:
+        status_store.record_metrics(job, "manifest", input_bytes=n_bytes,
+            sequences=n_bytes // 100)
+        status_store.record_metrics(job, "process", input_bytes=n_bytes,
+            seconds=n_bytes * seconds_per_byte)
+        status_store.record_metrics(job, "upload", objects=50, seconds=5.0)
+
+def write_flatfiles(tmp_path):
+    flatfiles = []
+    for n, n_bytes in enumerate(SIZES):
+        url = URL.format(n)
+        flatfile_path = tmp_path / "ftp" / url[len("ftp://ftp.ebi.ac.uk/"):]
+        if n_bytes is not None:
+            flatfile_path.parent.mkdir(parents=True, exist_ok=True)
+            flatfile_path.write_bytes(b"A" * n_bytes)
+        flatfiles.append(["GCA_{:09d}.1".format(n), url, str(flatfile_path)])
+    return flatfiles
+
+def test_report_with_history(tmp_path):
+    status_store = StatusStore(str(tmp_path / "status.db"))
+    seed_metrics(status_store)
+    planner = CapacityPlanner(status_store.get_throughput())
+    status_store.close()
+    planner.add_date("2020-01-01",
+        FlatfilePlanner().plan(write_flatfiles(tmp_path)), n_unchanged=2)
+
+    lines = planner.report(2)
+    assert lines[:3] == ["dates: 2020-01-01 to 2020-01-01 (1 dates)",
+        "flatfiles: 4 to process in 4 jobs, 2 unchanged since last "
+            + "processed, 1 not found locally",
+        "input: 3.5 KB"]
+    assert lines[3] == "sequences: ~35 (10 per KB, over 2 earlier flatfiles)"
+    assert lines[4] == "S3 PUTs: ~214 (70 sequence and metadata objects, " \
+        + "140 redirects, 4 csvs)"
+    assert lines[5] == "wall time: ~1m at concurrency 2 (processing " \
+        + "100 B/s per job, upload 10 objects/s per task)"
+
+def test_concurrency_arithmetic(tmp_path):
+    status_store = StatusStore(str(tmp_path / "status.db"))
+    seed_metrics(status_store)
+    throughput = status_store.get_throughput()
+    status_store.close()
+    batches = FlatfilePlanner().plan(write_flatfiles(tmp_path))
+
+    # per job: bytes * 0.01 + (sequences * 6 + 1) * 0.1 / upload shards,
+    # i.e. 32.1, 16.1, 8.1 and 0.1 seconds, dispatched largest first
+    planner = CapacityPlanner(throughput)
+    planner.add_date("2020-01-01", batches)
+    assert planner.project(1) == pytest.approx(56.4)
+    assert planner.project(2) == pytest.approx(32.1)
+    assert planner.project(3) == pytest.approx(32.1)
+
+    # dates run one after another
+    planner.add_date("2020-01-02", batches[1:])
+    assert planner.project(2) == pytest.approx(32.1 + 16.1)
+
+    sharded = CapacityPlanner(throughput, upload_shards=2)
+    sharded.add_date("2020-01-01", batches)
+    assert sharded.project(1) == pytest.approx(35 + 21.4 / 2)
+
+def test_report_without_history(tmp_path):
+    planner = CapacityPlanner({})
+    planner.add_date("2020-01-01",
+        FlatfilePlanner().plan(write_flatfiles(tmp_path)))
+
+    lines = planner.report(4)
+    assert planner.project(4) is None
+    assert lines[3] == "sequences: unknown, no earlier run has recorded " \
+        + "sequences per flatfile byte"
+    assert lines[4] == "S3 PUTs: 6 per sequence, 1 per flatfile"
+    assert lines[5] == "wall time: unknown, no earlier run has recorded " \
+        + "sequences per byte, processing, upload throughput"
+
+def test_format_seconds():
+    assert format_seconds(20) == "20s"
+    assert format_seconds(3 * 60) == "3m"
+    assert format_seconds(26 * 3600 + 5 * 60) == "1d 2h 5m"
+
+def test_plan_command(tmp_path, capsys):
+    processing_dir = tmp_path / "proc"
+    date_dir = processing_dir / "2020" / "01" / "01"
+    date_dir.mkdir(parents=True)
+    status_store = StatusStore(str(processing_dir / "status.db"))
+    seed_metrics(status_store, seconds_per_byte=1.0)
+    status_store.close()
+    flatfiles = write_flatfiles(tmp_path)
+    (date_dir / "accessions_list.txt").write_text("Accession\tURL\n"
+        + "".join(["{}\t{}\n".format(f[0], f[1]) for f in flatfiles]))
+    config_obj = {"processing_dir": str(processing_dir),
+        "start_date": "2020-01-01", "number_of_days": 1,
+        "flatfile_dir": str(tmp_path / "ftp"), "local_concurrency": 1}
+
+    ena_assembly_plan(config_obj, "source.json", "destination.json")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1].startswith("flatfiles: 4 to process in 4 jobs")
+    # 3521.4 seconds one job at a time, from local_concurrency
+    assert lines[-1].startswith("wall time: ~59m at concurrency 1")
+
+    ena_assembly_plan(config_obj, "source.json", "destination.json",
+        concurrency=3)
+    lines = capsys.readouterr().out.splitlines()
+    # the largest flatfile's 2012.1 seconds
+    assert lines[-1].startswith("wall time: ~34m at concurrency 3")
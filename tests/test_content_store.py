@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Tests of the content-addressed sequence store"""
+
+import os
+import threading
+from ga4gh.refget.loader.store.content_store import ContentStore
+
+DIGEST = "SQ.AbCdEfGh"
+
+def test_put_stores_once(tmp_path):
+    store = ContentStore(str(tmp_path))
+
+    path, written = store.put(DIGEST, b"ACGT")
+    assert [path, written] == [os.path.join(str(tmp_path), "sequence", "Ab",
+        "Cd", DIGEST), True]
+    assert store.put(DIGEST, b"ACGT") == [path, False]
+    assert os.listdir(os.path.dirname(path)) == [DIGEST]
+
+def test_concurrent_puts_of_the_same_digest(tmp_path):
+    store = ContentStore(str(tmp_path))
+    n_writers = 8
+    barrier = threading.Barrier(n_writers)
+    results = []
+
+    def put():
+        barrier.wait()
+        results.append(store.put(DIGEST, b"ACGT" * 1000))
+
+    threads = [threading.Thread(target=put) for i in range(n_writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # every writer gets the same path, and exactly one stored the sequence
+    path = store.get_path(DIGEST)
+    assert [r[0] for r in results] == [path] * n_writers
+    assert [r[1] for r in results].count(True) == 1
+    assert open(path, "rb").read() == b"ACGT" * 1000
+    assert os.listdir(os.path.dirname(path)) == [DIGEST]
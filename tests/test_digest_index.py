@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Tests of the Bloom filter, and the uploaded digest index it fronts"""
+
+import json
+import sqlite3
+import boto3
+from click.testing import CliRunner
+from ga4gh.refget.loader.cli.entrypoint import main
+from ga4gh.refget.loader.destinations.aws.s3.listing import \
+    get_destination_id
+from ga4gh.refget.loader.store.bloom import BloomFilter
+from ga4gh.refget.loader.store.digest_index import DigestIndex
+
+def test_bloom_save_and_load(tmp_path):
+    bloom = BloomFilter(1000, error_rate=0.001)
+    items = ["SQ.{}".format(n) for n in range(500)]
+    for item in items:
+        bloom.add(item)
+    bloom_path = str(tmp_path / "digests.bloom")
+    bloom.save(bloom_path, "42")
+
+    loaded, header = BloomFilter.load(bloom_path)
+    assert header == "42"
+    assert [loaded.n_bits, loaded.n_hashes] == [bloom.n_bits, bloom.n_hashes]
+    assert all([item in loaded for item in items])
+    false_positives = [n for n in range(10000) if "md5{}".format(n) in loaded]
+    assert len(false_positives) < 50
+
+def test_index_catches_up_on_other_jobs(tmp_path):
+    index_path = str(tmp_path / "digests.db")
+    index = DigestIndex(index_path, "s3://bucket", capacity=100)
+    index.add(["SQ.a", "md5a"])
+    index.close()
+
+    # another job adds digests after the filter was saved
+    first = DigestIndex(index_path, "s3://bucket", capacity=100)
+    other = DigestIndex(index_path, "s3://bucket", capacity=100)
+    other.add(["SQ.b"])
+    other.close()
+    assert "SQ.b" not in first
+    first.close()
+
+    # a job that exits without saving its filter still adds rows, which
+    # opening the index reads on top of the saved filter
+    connection = sqlite3.connect(index_path)
+    connection.execute("INSERT INTO uploaded_digest (destination, digest) "
+        + "VALUES ('s3://bucket', 'SQ.d')")
+    connection.commit()
+    connection.close()
+    assert BloomFilter.load(first.bloom_path)[1] == "3"
+    index = DigestIndex(index_path, "s3://bucket", capacity=100)
+    assert index.last_rowid == 4
+    assert index.contains_all(["SQ.a", "md5a", "SQ.b", "SQ.d"])
+    assert "SQ.c" not in index
+    index.close()
+
+    # digests of another destination are kept apart
+    index = DigestIndex(index_path, "s3://other", capacity=100)
+    assert "SQ.a" not in index
+    index.close()
+
+def test_index_rebuilds_filter_beyond_capacity(tmp_path):
+    index_path = str(tmp_path / "digests.db")
+    index = DigestIndex(index_path, "s3://bucket", capacity=10)
+    index.add(["SQ.{}".format(n) for n in range(25)])
+    index.close()
+    assert BloomFilter.load(index.bloom_path)[0].capacity == 10
+
+    # the saved filter is too small for the rows, a larger one is built
+    index = DigestIndex(index_path, "s3://bucket", capacity=10)
+    assert index.capacity == 50
+    assert index.bloom.capacity == 50
+    assert index.contains_all(["SQ.{}".format(n) for n in range(25)])
+    index.close()
+    assert BloomFilter.load(index.bloom_path)[0].capacity == 50
+
+def test_rebuild_command(s3_config, tmp_path):
+    client = boto3.client("s3")
+    bucket_name = s3_config["bucket_name"]
+    # a digest is indexed only once both its sequence and metadata exist
+    for key in ["sequence/SQ.a", "metadata/json/SQ.a.json", "sequence/md5a",
+        "metadata/json/md5a.json", "sequence/SQ.b",
+        "metadata/json/md5c.json"]:
+        client.put_object(Bucket=bucket_name, Key=key, Body=b"A")
+    index_path = str(tmp_path / "digests.db")
+    destination_obj = dict(s3_config, type="aws_s3", digest_index=index_path)
+    destination_path = tmp_path / "destination.json"
+    destination_path.write_text(json.dumps(destination_obj))
+
+    result = CliRunner().invoke(main, ["index", "rebuild", "-d",
+        str(destination_path)])
+
+    assert result.output == "indexed 2 digests\n"
+    index = DigestIndex(index_path, get_destination_id(destination_obj))
+    assert index.contains_all(["SQ.a", "md5a"])
+    assert "SQ.b" not in index
+    assert "md5c" not in index
+    index.close()
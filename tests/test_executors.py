@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Tests of the local executor, running stub stage scripts"""
+
+import os
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    LocalExecutor, get_executor, FUSED_STAGES, STAGES
+
+STAGE_SCRIPT = 'echo "{job_id} {stage} $REFGET_LOADER_SHARD" >> {events}\n' \
+    + 'echo "{stage} output"\n' \
+    + '[ "$REFGET_LOADER_SHARD" = "{failing_shard}" ] && exit {exit_code}\n' \
+    + 'exit {stage_exit_code}\n'
+
+def write_stage_scripts(tmp_path, job_id, failing_stage=None,
+    failing_shard=None, exit_code=3):
+    cmd_dir = tmp_path / job_id / "cmd"
+    log_dir = tmp_path / job_id / "logs"
+    cmd_dir.mkdir(parents=True)
+    log_dir.mkdir(parents=True)
+    for stage in STAGES:
+        failing = stage == failing_stage
+        (cmd_dir / (stage + ".sh")).write_text(STAGE_SCRIPT.format(
+            job_id=job_id, stage=stage, events=tmp_path / "events",
+            failing_shard=failing_shard if failing else "none",
+            exit_code=exit_code,
+            stage_exit_code=exit_code if failing and not failing_shard
+                else 0))
+    return [str(cmd_dir), str(log_dir)]
+
+def read_events(tmp_path):
+    return [line.split() for line in
+        (tmp_path / "events").read_text().splitlines()]
+
+def test_stages_run_in_order(tmp_path):
+    executor = LocalExecutor(max_workers=2)
+    for job_id in ["a", "b", "c"]:
+        executor.submit(job_id, *write_stage_scripts(tmp_path, job_id))
+    results = executor.finish()
+
+    assert results == {job_id: ["Completed", "None"]
+        for job_id in ["a", "b", "c"]}
+    events = read_events(tmp_path)
+    for job_id in ["a", "b", "c"]:
+        assert [e[1] for e in events if e[0] == job_id] == STAGES
+    log_path = tmp_path / "a" / "logs" / "manifest.a.log.out"
+    assert log_path.read_text() == "manifest output\n"
+
+def test_later_stages_are_run_first(tmp_path):
+    executor = LocalExecutor(max_workers=1)
+    for job_id in ["a", "b"]:
+        executor.submit(job_id, *write_stage_scripts(tmp_path, job_id))
+    executor.finish()
+
+    # a flatfile is carried through to upload before the next is processed
+    assert read_events(tmp_path) == [["a", "process"], ["a", "manifest"],
+        ["a", "upload"], ["b", "process"], ["b", "manifest"], ["b", "upload"]]
+
+def test_failed_stage_stops_flatfile(tmp_path):
+    executor = LocalExecutor(max_workers=2)
+    executor.submit("a", *write_stage_scripts(tmp_path, "a",
+        failing_stage="manifest"))
+    executor.submit("b", *write_stage_scripts(tmp_path, "b"))
+    results = executor.finish()
+
+    assert results["a"] == ["Failed", "manifest stage exited with code 3"]
+    assert results["b"] == ["Completed", "None"]
+    events = read_events(tmp_path)
+    assert [e[1] for e in events if e[0] == "a"] == ["process", "manifest"]
+
+def test_missing_stage_script_fails_flatfile(tmp_path):
+    cmd_dir, log_dir = write_stage_scripts(tmp_path, "a")
+    os.remove(os.path.join(cmd_dir, "upload.sh"))
+
+    executor = LocalExecutor(max_workers=1)
+    executor.submit("a", cmd_dir, log_dir)
+    results = executor.finish()
+
+    assert results["a"][0] == "Failed"
+    assert results["a"][1].startswith("upload stage exited with code")
+
+def test_sharded_stage_waits_for_all_tasks(tmp_path):
+    executor = LocalExecutor(max_workers=2, stage_tasks={"upload": 3})
+    executor.submit("a", *write_stage_scripts(tmp_path, "a"))
+    executor.submit("b", *write_stage_scripts(tmp_path, "b",
+        failing_stage="upload", failing_shard="2"))
+    results = executor.finish()
+
+    assert results["a"] == ["Completed", "None"]
+    assert results["b"] == ["Failed",
+        "upload stage shard 2 exited with code 3"]
+    events = read_events(tmp_path)
+    for job_id in ["a", "b"]:
+        job_events = [e[1:] for e in events if e[0] == job_id]
+        assert job_events[:2] == [["process"], ["manifest"]]
+        assert sorted(job_events[2:]) == [["upload", "1"], ["upload", "2"],
+            ["upload", "3"]]
+    for shard in ["1", "2", "3"]:
+        log_name = "upload.a.{}.log.out".format(shard)
+        assert (tmp_path / "a" / "logs" / log_name).exists()
+
+def test_failed_shards_are_counted(tmp_path):
+    executor = LocalExecutor(max_workers=2, stage_tasks={"upload": 2})
+    executor.submit("a", *write_stage_scripts(tmp_path, "a",
+        failing_stage="upload"))
+    results = executor.finish()
+
+    assert results["a"][0] == "Failed"
+    assert results["a"][1].startswith("2 of 2 upload tasks failed: "
+        + "upload stage shard ")
+
+def test_get_executor_from_config(tmp_path):
+    executor = get_executor({"submission_mode": "local",
+        "local_concurrency": 2, "upload_shards": 4}, "name", str(tmp_path))
+    assert isinstance(executor, LocalExecutor)
+    assert executor.max_workers == 2
+    assert executor.stages == STAGES
+    assert executor.get_n_tasks("upload") == 4
+    assert executor.get_n_tasks("process") == 1
+    executor.finish()
+
+    executor = get_executor({"submission_mode": "local",
+        "fused_upload": True, "upload_shards": 4}, "name", str(tmp_path))
+    assert executor.stages == FUSED_STAGES
+    assert executor.stage_tasks == {}
+    executor.finish()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Tests of the native EMBL flatfile processor"""
+
+import csv
+import gzip
+import hashlib
+import os
+import threading
+import time
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_processor \
+    import FlatfileProcessor
+from ga4gh.refget.loader.sources.ena.assembly.utils.processed_csv import \
+    iter_processed_rows
+from ga4gh.refget.loader.store.content_store import ContentStore
+
+RECORD_HEADER = "ID   ABCD01{n:06d}; SV 1; linear; genomic DNA; WGS; MAM; " \
+    + "{length} BP.\nXX\nAC   ABCD01{n:06d};\nXX\nOS   {species}\nXX\n" \
+    + "DR   BioSample; SAMEA{n:07d}.\nXX\nFH   Key             " \
+    + "Location/Qualifiers\nFT   source          1..{length}\n" \
+    + "FT                   /db_xref=\"taxon:9606\"\nXX\n"
+CON_RECORD = "ID   ABCD01{n:06d}; SV 1; linear; genomic DNA; CON; MAM; " \
+    + "{length} BP.\nXX\nCO   join(ABCD01000001.1:1..{length})\n//\n"
+
+class TracingProcessor(FlatfileProcessor):
+    """Flatfile processor recording the most records written at once"""
+
+    def __init__(self, *args, **kwargs):
+        """Constructor method"""
+
+        super(TracingProcessor, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.n_writing = 0
+        self.max_writing = 0
+
+    def write_record(self, header, seq, record_number):
+        with self.lock:
+            self.n_writing += 1
+            self.max_writing = max(self.max_writing, self.n_writing)
+        try:
+            time.sleep(0.01)
+            return super(TracingProcessor, self).write_record(header, seq,
+                record_number)
+        finally:
+            with self.lock:
+                self.n_writing -= 1
+
+def get_seq(n, length):
+    return "".join(["acgt"[(n * 7 + i * i) % 4] for i in range(length)])
+
+def write_flatfile(file_path, records, newline="\n"):
+    text = ""
+    for n, species, length in records:
+        if species is None:
+            text += CON_RECORD.format(n=n, length=length)
+            continue
+        text += RECORD_HEADER.format(n=n, length=length, species=species)
+        text += "SQ   Sequence {} BP;\n".format(length)
+        seq = get_seq(n, length)
+        for start in range(0, length, 60):
+            line = seq[start:start + 60]
+            blocks = [line[i:i + 10] for i in range(0, len(line), 10)]
+            text += "     {:<66}{:>9}\n".format(" ".join(blocks),
+                start + len(line))
+        text += "//\n"
+    data = text.replace("\n", newline).encode()
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, "wb") as flatfile:
+        flatfile.write(data)
+    return file_path
+
+def read_full_csv(processor):
+    with open(processor.full_csv, "r", newline="") as full_file:
+        return list(csv.DictReader(full_file))
+
+def test_process_records(tmp_path):
+    records = [[1, "Homo sapiens", 130], [2, None, 100],
+        [3, 'Mus musculus, strain "C57BL/6"', 61]]
+    flatfile_path = write_flatfile(str(tmp_path / "AB.dat"), records)
+
+    processor = FlatfileProcessor(str(tmp_path / "out"), "AB", workers=2)
+    processor.process(flatfile_path)
+
+    assert [processor.n_records, processor.n_skipped, processor.n_bases] \
+        == [2, 1, 191]
+    rows = read_full_csv(processor)
+    assert [row["insdc"] for row in rows] == ["ABCD01000001.1",
+        "ABCD01000003.1"]
+    assert rows[1]["species"] == 'Mus musculus, strain "C57BL/6"'
+    assert [rows[1]["ena_type"], rows[1]["biosample"], rows[1]["taxon"]] \
+        == ["WGS", "SAMEA0000003", "9606"]
+
+    # sequences are upper case, without whitespace or position counts
+    seq = get_seq(3, 61).upper().encode()
+    assert rows[1]["md5"] == hashlib.md5(seq).hexdigest()
+    assert rows[1]["trunc512"] == hashlib.sha512(seq).digest()[:24].hex()
+    joined = list(iter_processed_rows(processor.loader_csv,
+        processor.full_csv))
+    assert open(joined[1]["seq_path"], "rb").read() == seq
+    assert joined[1]["ga4gh"] == rows[1]["ga4gh"]
+
+def test_gzipped_flatfile_matches_plain(tmp_path):
+    records = [[n, "Homo sapiens", 50 + n * 37] for n in range(1, 20)]
+    outputs = []
+    for name, overlap in [["AB.dat", True], ["AB.dat.gz", True],
+        ["AB.dat.gz", False]]:
+        flatfile_path = write_flatfile(str(tmp_path / name), records)
+        processor = FlatfileProcessor(str(tmp_path / "out"), "AB",
+            workers=3, overlap=overlap)
+        processor.process(flatfile_path)
+        outputs.append([[row["trunc512"], row["insdc"]]
+            for row in read_full_csv(processor)])
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert len(outputs[0]) == 19
+
+def test_truncated_flatfile_raises(tmp_path):
+    flatfile_path = write_flatfile(str(tmp_path / "AB.dat"),
+        [[1, "Homo sapiens", 100]])
+    data = open(flatfile_path, "rb").read()
+    open(flatfile_path, "wb").write(data[:-20])
+
+    processor = FlatfileProcessor(str(tmp_path / "out"), "AB", workers=1)
+    with pytest.raises(Exception):
+        processor.process(flatfile_path)
+    assert not os.path.exists(processor.loader_csv)
+
+def test_crlf_flatfile_matches_lf(tmp_path):
+    records = [[n, "Homo sapiens", 40 + n * 13] for n in range(1, 12)]
+    outputs = []
+    for newline in ["\n", "\r\n"]:
+        flatfile_path = write_flatfile(str(tmp_path / "AB.dat"), records,
+            newline=newline)
+        processor = FlatfileProcessor(str(tmp_path / "out"), "AB",
+            workers=2)
+        # small, odd blocks split CRLFs and record terminators across blocks
+        processor.BLOCK_SIZE = 37
+        processor.process(flatfile_path)
+        outputs.append([[row["trunc512"], row["insdc"], row["species"]]
+            for row in read_full_csv(processor)])
+
+    assert outputs[0] == outputs[1]
+    assert len(outputs[0]) == 11
+    assert outputs[1][0][2] == "Homo sapiens"
+
+def test_in_flight_records_are_bounded_by_bytes(tmp_path):
+    records = [[n, "Homo sapiens", 600] for n in range(1, 9)]
+    flatfile_path = write_flatfile(str(tmp_path / "AB.dat"), records)
+
+    # records larger than half the budget are written one at a time
+    processor = TracingProcessor(str(tmp_path / "out"), "AB", workers=4,
+        max_in_flight_bytes=1000)
+    processor.process(flatfile_path)
+    assert processor.max_writing == 1
+    assert processor.n_records == 8
+
+    # a record larger than the whole budget is still processed
+    processor = TracingProcessor(str(tmp_path / "out"), "AB", workers=4,
+        max_in_flight_bytes=100)
+    processor.process(flatfile_path)
+    assert processor.max_writing == 1
+    assert processor.n_records == 8
+
+    processor = TracingProcessor(str(tmp_path / "out"), "AB", workers=4,
+        max_in_flight_bytes=10000)
+    processor.process(flatfile_path)
+    assert processor.max_writing > 1
+    assert [row["insdc"] for row in read_full_csv(processor)] == \
+        ["ABCD01{:06d}.1".format(n) for n in range(1, 9)]
+
+def test_content_store_deduplicates_across_flatfiles(tmp_path):
+    store = ContentStore(str(tmp_path / "store"))
+    first_path = write_flatfile(str(tmp_path / "AB.dat"),
+        [[1, "Homo sapiens", 120], [2, "Homo sapiens", 80]])
+    # the same sequence as record 2, and a new one
+    second_path = write_flatfile(str(tmp_path / "CD.dat"),
+        [[2, "Mus musculus", 80], [3, "Mus musculus", 70]])
+
+    first = FlatfileProcessor(str(tmp_path / "AB"), "AB", workers=2,
+        content_store=store)
+    first.process(first_path)
+    second = FlatfileProcessor(str(tmp_path / "CD"), "CD", workers=2,
+        content_store=store)
+    second.process(second_path)
+
+    assert [first.n_deduplicated, second.n_deduplicated] == [0, 1]
+    first_rows = list(iter_processed_rows(first.loader_csv, first.full_csv))
+    second_rows = list(iter_processed_rows(second.loader_csv,
+        second.full_csv))
+    assert first_rows[1]["seq_path"] == second_rows[0]["seq_path"]
+    assert first_rows[1]["seq_path"].startswith(str(tmp_path / "store"))
+    seq_files = [f for r, d, files in os.walk(str(tmp_path / "store"))
+        for f in files]
+    assert sorted(seq_files) == sorted([row["ga4gh"]
+        for row in first_rows + second_rows[1:]])
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Tests of decompressing gzipped flatfiles ahead of the reader"""
+
+import gzip
+import os
+import random
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.utils.flatfile_reader import \
+    OverlappedGzipReader
+
+class SmallChunkReader(OverlappedGzipReader):
+    """Reader taking compressed chunks smaller than a gzip member"""
+
+    CHUNK_SIZE = 1000
+
+def write_multi_member_gzip(file_path):
+    generator = random.Random(1)
+    members = []
+    for n in range(6):
+        text = "".join([generator.choice("ACGT\n") for i in range(
+            generator.randint(1, 20000))])
+        members.append(gzip.compress(text.encode(), compresslevel=n % 9 + 1))
+    # an empty member, and zero padding after a member, are read through
+    members.insert(2, gzip.compress(b""))
+    members[4] += b"\0" * 10
+    open(file_path, "wb").write(b"".join(members))
+    return file_path
+
+def read_all(reader, size):
+    blocks = []
+    block = reader.read(size)
+    while block:
+        blocks.append(block)
+        block = reader.read(size)
+    return b"".join(blocks)
+
+def test_multi_member_gzip_matches_gzip_open(tmp_path):
+    file_path = write_multi_member_gzip(str(tmp_path / "AB.dat.gz"))
+    expected = gzip.open(file_path, "rb").read()
+    assert len(expected) > 20000
+
+    for reader_class in [OverlappedGzipReader, SmallChunkReader]:
+        for buffer_size, ring_size, size in [[None, None, -1],
+            [4096, 1, 37], [100, 2, 4096]]:
+            with reader_class(file_path, buffer_size=buffer_size,
+                ring_size=ring_size) as reader:
+                assert read_all(reader, size) == expected
+                assert reader.read(10) == b""
+
+def test_truncated_gzip_raises(tmp_path):
+    file_path = write_multi_member_gzip(str(tmp_path / "AB.dat.gz"))
+    data = open(file_path, "rb").read()
+    open(file_path, "wb").write(data[:-100])
+
+    with pytest.raises(Exception):
+        with SmallChunkReader(file_path, buffer_size=100) as reader:
+            read_all(reader, 4096)
+
+def test_close_stops_decompression(tmp_path):
+    file_path = str(tmp_path / "AB.dat.gz")
+    open(file_path, "wb").write(gzip.compress(os.urandom(1024 * 1024)))
+
+    reader = SmallChunkReader(file_path, buffer_size=100, ring_size=1)
+    assert len(reader.read(10)) == 10
+    reader.close()
+    assert not reader.thread.is_alive()
+    assert reader.read(10) == b""
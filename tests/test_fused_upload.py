@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Tests of processing a flatfile while uploading its sequences"""
+
+import itertools
+import json
+import os
+import boto3
+from click.testing import CliRunner
+from ga4gh.refget.loader.cli.entrypoint import main
+from ga4gh.refget.loader.config.methods import METHODS
+from ga4gh.refget.loader.destinations.aws.s3.upload import aws_s3_upload
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+RECORD = "ID   ABCD01{n:06d}; SV 1; linear; genomic DNA; WGS; MAM; " \
+    + "{length} BP.\nXX\nAC   ABCD01{n:06d};\nXX\nOS   Homo sapiens\nXX\n" \
+    + "SQ   Sequence {length} BP;\n     {seq}{length:>10}\n//\n"
+N_RECORDS = 4
+
+def write_flatfile(file_path):
+    text = ""
+    for n in range(1, N_RECORDS + 1):
+        seq = "acgt"[n % 4] * 10 + "acgt"[(n + 1) % 4] * (n + 1)
+        text += RECORD.format(n=n, length=len(seq), seq=seq)
+    open(file_path, "w").write(text)
+    return file_path
+
+def run_fused(tmp_path, s3_config):
+    source_path = tmp_path / "source.json"
+    source_path.write_text(json.dumps({
+        "processing_dir": str(tmp_path / "proc")}))
+    destination_path = tmp_path / "destination.json"
+    destination_path.write_text(json.dumps(dict(s3_config, type="aws_s3")))
+    return CliRunner().invoke(main, ["subcommands", "ena", "assembly",
+        "process", "--store-path", str(tmp_path / "files"), "--file-path",
+        write_flatfile(str(tmp_path / "AB.dat")), "--process-id", "AB",
+        "--upload", "--source-config", str(source_path),
+        "--destination-config", str(destination_path)])
+
+def get_paths(tmp_path):
+    manifest_path = str(tmp_path / "files" / "logs" / "AB.manifest.csv")
+    (tmp_path / "proc").mkdir()
+    status_store = StatusStore(str(tmp_path / "proc" / "status.db"))
+    return [manifest_path, status_store,
+        StatusStore.get_job_key(manifest_path)]
+
+def read_lines(file_path):
+    return open(file_path, "r").read().splitlines()
+
+def test_journals_are_written_as_records_stream(s3_config, tmp_path,
+    monkeypatch):
+    manifest_path, status_store, job = get_paths(tmp_path)
+    observed = []
+
+    def upload(config_obj, seq_table, additional_table, journal=None):
+        def observed_seq_table():
+            for line in seq_table:
+                # each entry is in the manifest before it is uploaded
+                observed.append([line in open(manifest_path).readlines(),
+                    status_store.get(job)["stage"]])
+                yield line
+
+        def observed_additional_table():
+            for line in additional_table:
+                observed.append([None, status_store.get(job)["stage"]])
+                yield line
+
+        return aws_s3_upload(config_obj, observed_seq_table(),
+            observed_additional_table(), journal=journal)
+
+    monkeypatch.setitem(METHODS["upload"], "aws_s3", upload)
+    result = run_fused(tmp_path, s3_config)
+
+    assert result.exit_code == 0, result.output
+    assert observed[:N_RECORDS + 1] == [[True, "process"]] * (N_RECORDS + 1)
+    assert observed[N_RECORDS + 1:] == [[None, "upload"]] * 2
+    assert "uploaded {} of {} objects".format(N_RECORDS * 6 + 1,
+        N_RECORDS * 6 + 1) in result.output
+    assert len(read_lines(manifest_path + ".journal")) == N_RECORDS * 6 + 1
+    row = status_store.get(job)
+    assert [row["stage"], row["status"]] == ["upload", "Completed"]
+    status_store.close()
+
+def test_rerun_resumes_from_journal(s3_config, tmp_path, monkeypatch):
+    manifest_path, status_store, job = get_paths(tmp_path)
+
+    # the first run is interrupted after uploading two sequences
+    def interrupted(config_obj, seq_table, additional_table, journal=None):
+        aws_s3_upload(config_obj, itertools.islice(seq_table, 3),
+            ["source\tdestination"], journal=journal)
+        raise Exception("interrupted")
+
+    monkeypatch.setitem(METHODS["upload"], "aws_s3", interrupted)
+    result = run_fused(tmp_path, s3_config)
+    assert result.exit_code == 1
+    assert [status_store.get(job)["status"],
+        status_store.get(job)["message"]] == ["Failed", "interrupted"]
+    assert len(read_lines(manifest_path + ".journal")) == 2 * 6
+
+    monkeypatch.setitem(METHODS["upload"], "aws_s3", aws_s3_upload)
+    result = run_fused(tmp_path, s3_config)
+    assert result.exit_code == 0, result.output
+    n_remaining = (N_RECORDS - 2) * 6 + 1
+    assert ("uploaded {0} of {0} objects, skipped 12 completed by a "
+        + "previous run").format(n_remaining) in result.output
+    assert status_store.get(job)["status"] == "Completed"
+    response = boto3.client("s3").list_objects_v2(
+        Bucket=s3_config["bucket_name"])
+    assert response["KeyCount"] == N_RECORDS * 6 + 1
+    status_store.close()
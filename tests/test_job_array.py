@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Tests of submitting flatfile stages as LSF job arrays, with a fake bsub"""
+
+import os
+import subprocess
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.utils.job_array import \
+    LsfJobArray
+
+@pytest.fixture
+def bsub_calls(tmp_path, monkeypatch):
+    """Put a fake bsub on the PATH, recording the arguments of each call"""
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls_path = tmp_path / "bsub_calls"
+    bsub_path = bin_dir / "bsub"
+    bsub_path.write_text("#!/bin/sh\n"
+        + "printf '%s\\t' \"$@\" >> {}\n".format(calls_path)
+        + "echo >> {}\n".format(calls_path)
+        + "exit ${FAKE_BSUB_EXIT:-0}\n")
+    os.chmod(str(bsub_path), 0o755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep
+        + os.environ["PATH"])
+
+    def read_calls():
+        lines = calls_path.read_text().splitlines()
+        return [line.rstrip("\t").split("\t") for line in lines]
+    return read_calls
+
+def add_flatfiles(tmp_path, job_array, n_flatfiles):
+    for n in range(n_flatfiles):
+        job_id = "AB{:06d}".format(n)
+        cmd_dir = tmp_path / job_id / "cmd"
+        log_dir = tmp_path / job_id / "logs"
+        cmd_dir.mkdir(parents=True)
+        log_dir.mkdir(parents=True)
+        for stage in LsfJobArray.STAGES:
+            cmd_path = cmd_dir / (stage + ".sh")
+            cmd_path.write_text("#!/bin/sh\n"
+                + 'echo "{} {} $REFGET_LOADER_SHARD"\n'.format(job_id, stage))
+            os.chmod(str(cmd_path), 0o755)
+        job_array.add(job_id, str(cmd_dir), str(log_dir))
+
+def get_option(call, option):
+    return call[call.index(option) + 1] if option in call else None
+
+def test_task_file_and_runner(tmp_path, bsub_calls):
+    array_dir = tmp_path / "arrays"
+    job_array = LsfJobArray("d1", str(array_dir),
+        stage_tasks={"upload": 2})
+    add_flatfiles(tmp_path, job_array, 2)
+
+    assert job_array.submit() == ["process.d1.0", "manifest.d1.0",
+        "upload.d1.0"]
+
+    # one task line per flatfile, or per flatfile and shard
+    lines = (array_dir / "upload.d1.0.tasks").read_text().splitlines()
+    log_dir = tmp_path / "AB000001" / "logs"
+    assert lines[3].split("\t") == [
+        str(tmp_path / "AB000001" / "cmd" / "upload.sh"),
+        str(log_dir / "upload.AB000001.2.log.out"),
+        str(log_dir / "upload.AB000001.2.log.err"), "2"]
+    assert len((array_dir / "process.d1.0.tasks").read_text()
+        .splitlines()) == 2
+
+    # each array element runs its own line, writing to the flatfile's logs
+    for stage, index in [["process", 2], ["upload", 1], ["upload", 4]]:
+        runner = str(array_dir / "{}.d1.0.sh".format(stage))
+        subprocess.run([runner], check=True,
+            env=dict(os.environ, LSB_JOBINDEX=str(index)))
+    assert (log_dir / "process.AB000001.log.out").read_text() == \
+        "AB000001 process 1\n"
+    assert (log_dir / "upload.AB000001.2.log.out").read_text() == \
+        "AB000001 upload 2\n"
+    assert (tmp_path / "AB000000" / "logs" / "upload.AB000000.1.log.out") \
+        .read_text() == "AB000000 upload 1\n"
+
+def test_bsub_arguments(tmp_path, bsub_calls):
+    array_dir = tmp_path / "arrays"
+    job_array = LsfJobArray("d1", str(array_dir))
+    add_flatfiles(tmp_path, job_array, 3)
+    job_array.submit()
+
+    calls = bsub_calls()
+    assert [get_option(c, "-J") for c in calls] == ["process.d1.0[1-3]",
+        "manifest.d1.0[1-3]", "upload.d1.0[1-3]"]
+    assert [get_option(c, "-w") for c in calls] == [None,
+        "ended(process.d1.0[*])", "ended(manifest.d1.0[*])"]
+    assert calls[0][-1] == str(array_dir / "process.d1.0.sh")
+    assert get_option(calls[0], "-o") == str(array_dir
+        / "process.d1.0.%I.log.out")
+
+def test_chunks_are_sized_by_max_size(tmp_path, bsub_calls):
+    job_array = LsfJobArray("d1", str(tmp_path / "arrays"), max_size=4,
+        stage_tasks={"upload": 2})
+    add_flatfiles(tmp_path, job_array, 5)
+    job_array.submit()
+
+    # two flatfiles per chunk, so that their upload arrays have 4 elements
+    calls = bsub_calls()
+    assert [get_option(c, "-J") for c in calls] == [
+        "process.d1.0[1-2]", "manifest.d1.0[1-2]", "upload.d1.0[1-4]",
+        "process.d1.1[1-2]", "manifest.d1.1[1-2]", "upload.d1.1[1-4]",
+        "process.d1.2[1-1]", "manifest.d1.2[1-1]", "upload.d1.2[1-2]"]
+    # each chunk waits only on its own previous stage
+    assert get_option(calls[4], "-w") == "ended(process.d1.1[*])"
+    assert get_option(calls[6], "-w") is None
+
+def test_failed_submission_raises(tmp_path, bsub_calls, monkeypatch):
+    monkeypatch.setenv("FAKE_BSUB_EXIT", "1")
+    job_array = LsfJobArray("d1", str(tmp_path / "arrays"))
+    add_flatfiles(tmp_path, job_array, 1)
+
+    with pytest.raises(Exception, match="job array submission failed"):
+        job_array.submit()
+    assert len(bsub_calls()) == 1
+    assert LsfJobArray("d2", str(tmp_path / "arrays")).submit() == []
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Tests of splitting an upload manifest into byte-balanced shards"""
+
+from ga4gh.refget.loader.manifest.reader import ManifestReader
+from ga4gh.refget.loader.manifest.shards import ShardedManifestWriter, \
+    get_shard_path
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+def write_row(tmp_path, n, n_bytes):
+    seq_path = tmp_path / "seq{}".format(n)
+    json_path = tmp_path / "seq{}.json".format(n)
+    seq_path.write_bytes(b"A" * n_bytes)
+    json_path.write_bytes(b"{}")
+    return {"completed": 1, "seq_path": str(seq_path),
+        "json_path": str(json_path), "ga4gh": "SQ.g{}".format(n),
+        "trunc512": "t{}".format(n), "md5": "m{}".format(n)}
+
+def read_manifest(manifest_path):
+    reader = ManifestReader(manifest_path)
+    seq_table = list(reader.seq_table())
+    additional_table = list(reader.additional_table())
+    reader.close()
+    assert reader.source_config == "source.json"
+    assert reader.destination_config == "destination.json"
+    return [[line.split("\t")[3] for line in seq_table[1:]],
+        [line.split("\t")[1].strip() for line in additional_table[1:]]]
+
+def test_get_shard_path():
+    assert get_shard_path("/logs/AB0001.manifest.csv", 2) == \
+        "/logs/AB0001.manifest.2.csv"
+
+def test_shards_are_balanced_by_bytes(tmp_path):
+    manifest_path = str(tmp_path / "p.manifest.csv")
+    writer = ShardedManifestWriter(manifest_path, "source.json",
+        "destination.json", 3, tmp_suffix=".tmp")
+
+    # one large sequence, then many small ones
+    writer.write_seq_header()
+    sizes = [3000] + [100] * 30
+    for n, n_bytes in enumerate(sizes):
+        writer.write_seq_entry(write_row(tmp_path, n, n_bytes))
+    writer.write_additional_header()
+    for name in ["loader", "full"]:
+        csv_path = tmp_path / (name + ".csv")
+        csv_path.write_text("a\n")
+        writer.write_additional_entry(str(csv_path),
+            "metadata/csv/{}.csv".format(name))
+    writer.close()
+
+    paths = writer.get_paths()
+    assert paths[0] == manifest_path
+    assert paths[1:] == [get_shard_path(manifest_path, i) for i in [1, 2, 3]]
+    manifests = [read_manifest(path + ".tmp") for path in paths]
+
+    # every entry is in the whole manifest, and in exactly one shard
+    whole_ids, whole_keys = manifests[0]
+    assert whole_ids == ["SQ.g{}".format(n) for n in range(len(sizes))]
+    assert sorted(sum([m[0] for m in manifests[1:]], [])) == sorted(whole_ids)
+    assert sorted(sum([m[1] for m in manifests[1:]], [])) == sorted(whole_keys)
+
+    # the small sequences are shared by the shards without the large one
+    shard_ids = [m[0] for m in manifests[1:]]
+    assert sorted([len(ids) for ids in shard_ids]) == [1, 15, 15]
+    assert ["SQ.g0"] in shard_ids
+
+def test_shard_statuses_roll_up(tmp_path):
+    status_store = StatusStore(str(tmp_path / "status.db"))
+
+    assert status_store.update_shard("job", 1, 3, "Completed", "None") \
+        is None
+    assert status_store.update_shard("job", 3, 3, "Failed", "denied") is None
+    assert status_store.update_shard("job", 2, 3, "Completed", "None") == \
+        ["Failed", "1 of 3 upload shards failed, shard 3: denied"]
+
+    # a retried shard replaces its earlier status
+    assert status_store.update_shard("job", 3, 3, "Completed", "None") == \
+        ["Completed", "None"]
+    status_store.clear_shards("job")
+    assert status_store.update_shard("job", 1, 3, "Completed", "None") \
+        is None
+    status_store.close()
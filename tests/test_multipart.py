@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Tests of multipart uploads to S3, against a bucket mocked by moto"""
+
+import os
+import threading
+import time
+import boto3
+from botocore.exceptions import ClientError
+from ga4gh.refget.loader.config.constants import Status
+from ga4gh.refget.loader.destinations.aws.s3.engine import S3UploadEngine
+
+CHUNKSIZE = 5 * 1024 * 1024
+
+def get_engine(s3_config, multipart_concurrency):
+    return S3UploadEngine(dict(s3_config,
+        multipart_threshold=CHUNKSIZE,
+        multipart_chunksize=CHUNKSIZE,
+        multipart_concurrency=multipart_concurrency))
+
+def get_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}},
+        "UploadPart")
+
+def test_failed_part_is_retried_alone(s3_config, tmp_path):
+    file_path = tmp_path / "large"
+    file_path.write_bytes(os.urandom(3 * CHUNKSIZE + 1024))
+    engine = get_engine(s3_config, 2)
+
+    # the second part fails once with a server error
+    sent = []
+    lock = threading.Lock()
+    upload_part = engine.client.upload_part
+
+    def flaky_upload_part(**kwargs):
+        with lock:
+            sent.append(kwargs["PartNumber"])
+            failing = sent.count(2) == 1 and kwargs["PartNumber"] == 2
+        if failing:
+            raise get_error("InternalError")
+        return upload_part(**kwargs)
+
+    engine.client.upload_part = flaky_upload_part
+    result = engine.put_object({"key": "sequence/large",
+        "file_path": str(file_path)})
+    engine.close()
+
+    assert result["status"] == Status.SUCCESS
+    assert result["etag"].endswith("-4")
+    assert sorted(sent) == [1, 2, 2, 3, 4]
+    body = boto3.client("s3").get_object(Bucket=s3_config["bucket_name"],
+        Key="sequence/large")["Body"].read()
+    assert body == file_path.read_bytes()
+
+def test_pending_parts_are_cancelled_before_abort(s3_config, tmp_path):
+    file_path = tmp_path / "large"
+    file_path.write_bytes(os.urandom(3 * CHUNKSIZE + 1024))
+    engine = get_engine(s3_config, 1)
+
+    # parts are sent one at a time, the second is denied while the third,
+    # already started, is slow to finish
+    events = []
+    upload_part = engine.client.upload_part
+    abort_multipart_upload = engine.client.abort_multipart_upload
+
+    def failing_upload_part(**kwargs):
+        part_number = kwargs["PartNumber"]
+        if part_number == 2:
+            raise get_error("AccessDenied")
+        if part_number == 3:
+            time.sleep(0.5)
+        response = upload_part(**kwargs)
+        events.append(part_number)
+        return response
+
+    def recording_abort(**kwargs):
+        events.append("abort")
+        return abort_multipart_upload(**kwargs)
+
+    engine.client.upload_part = failing_upload_part
+    engine.client.abort_multipart_upload = recording_abort
+    result = engine.put_object({"key": "sequence/large",
+        "file_path": str(file_path)})
+    engine.close()
+
+    assert result["status"] == Status.FAILURE
+    assert events == [1, 3, "abort"]
+    uploads = boto3.client("s3").list_multipart_uploads(
+        Bucket=s3_config["bucket_name"])
+    assert not uploads.get("Uploads")
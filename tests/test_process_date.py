@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Tests of selecting and submitting a date's flatfiles"""
+
+import os
+from ga4gh.refget.loader.sources.ena.assembly import process_date as \
+    process_date_module
+from ga4gh.refget.loader.sources.ena.assembly.process_date import \
+    process_date
+from ga4gh.refget.loader.sources.ena.assembly.utils.accession_index import \
+    AccessionIndex
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    FlatfileExecutor, STAGES
+
+URL = "ftp://ftp.ebi.ac.uk/pub/databases/ena/wgs/public/ab/AB000001.dat.gz"
+
+class RecordingExecutor(FlatfileExecutor):
+    """Executor recording submitted flatfiles, reporting a single status
+    for all of them"""
+
+    def __init__(self, status):
+        """Constructor method"""
+
+        super(RecordingExecutor, self).__init__(stages=STAGES)
+        self.status = status
+        self.submitted = []
+
+    def submit(self, job_id, cmd_dir, log_dir):
+        self.submitted.append(job_id)
+
+    def finish(self):
+        return {job_id: [self.status, "None"] for job_id in self.submitted}
+
+def run_date(monkeypatch, date_dir, config_obj, index, status="Completed"):
+    executor = RecordingExecutor(status)
+    monkeypatch.setattr(process_date_module, "get_executor",
+        lambda *args, **kwargs: executor)
+    process_date("2020-01-01", str(date_dir), config_obj,
+        "source.json", "destination.json", accession_index=index)
+    return executor.submitted
+
+def test_changed_flatfile_is_resubmitted(tmp_path, monkeypatch):
+    flatfile_dir = tmp_path / "ftp"
+    flatfile_path = flatfile_dir / "pub/databases/ena/wgs/public/ab" \
+        / "AB000001.dat.gz"
+    flatfile_path.parent.mkdir(parents=True)
+    flatfile_path.write_bytes(b"flatfile")
+    date_dir = tmp_path / "proc" / "2020" / "01" / "01"
+    date_dir.mkdir(parents=True)
+    (date_dir / "accessions_list.txt").write_text(
+        "Accession\tURL\nGCA_000000001.1\t{}\n".format(URL))
+    config_obj = {"processing_dir": str(tmp_path / "proc"),
+        "flatfile_dir": str(flatfile_dir),
+        "ena_refget_processor_script": "ena-refget-processor"}
+    index = AccessionIndex(str(tmp_path / "index.db"))
+
+    assert run_date(monkeypatch, date_dir, config_obj, index) == ["AB000001"]
+    assert index.get("GCA_000000001")["state"] == "Completed"
+    assert run_date(monkeypatch, date_dir, config_obj, index) == []
+
+    # the date's status store records the earlier run as completed, but the
+    # changed flatfile is submitted again
+    flatfile_path.write_bytes(b"changed flatfile")
+    assert run_date(monkeypatch, date_dir, config_obj, index,
+        status="Failed") == ["AB000001"]
+    assert index.get("GCA_000000001")["state"] == "Failed"
+    assert run_date(monkeypatch, date_dir, config_obj, index) == ["AB000001"]
+    entry = index.get("GCA_000000001")
+    assert entry["state"] == "Completed"
+    assert entry["flatfile_size"] == os.path.getsize(str(flatfile_path))
+    assert run_date(monkeypatch, date_dir, config_obj, index) == []
+    index.close()
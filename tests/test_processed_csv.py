@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Tests of the streaming join of a processed flatfile's CSVs"""
+
+import csv
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.utils.processed_csv import \
+    iter_processed_rows
+
+LOADER_HEADER = ["completed", "trunc512", "md5", "seq_path", "json_path",
+    "species"]
+FULL_HEADER = ["ga4gh", "md5", "trunc512", "length", "id", "species"]
+
+def write_csvs(tmp_path, loader_ids, full_ids):
+    loader_path = str(tmp_path / "p.loader.csv")
+    full_path = str(tmp_path / "p.full.csv")
+    with open(loader_path, "w", newline="") as loader_file:
+        writer = csv.writer(loader_file, lineterminator="\n")
+        writer.writerow(LOADER_HEADER)
+        for n in loader_ids:
+            writer.writerow(["1", "t{}".format(n), "m{}".format(n),
+                "/seq/{}".format(n), "/json/{}.json".format(n),
+                "Homo sapiens, strain {}".format(n)])
+    with open(full_path, "w", newline="") as full_file:
+        writer = csv.writer(full_file, lineterminator="\n")
+        writer.writerow(FULL_HEADER)
+        for n in full_ids:
+            writer.writerow(["SQ.g{}".format(n), "m{}".format(n),
+                "t{}".format(n), "10", "id{}".format(n),
+                'Homo sapiens, "strain" {}'.format(n)])
+    return [loader_path, full_path]
+
+def test_join_in_step(tmp_path):
+    rows = list(iter_processed_rows(*write_csvs(tmp_path, range(5),
+        range(5))))
+
+    assert [row["trunc512"] for row in rows] == ["t0", "t1", "t2", "t3",
+        "t4"]
+    assert rows[2] == {"completed": "1", "trunc512": "t2", "md5": "m2",
+        "seq_path": "/seq/2", "json_path": "/json/2.json", "ga4gh": "SQ.g2"}
+
+def test_join_out_of_step(tmp_path):
+    rows = list(iter_processed_rows(*write_csvs(tmp_path, [0, 1, 2, 3, 4],
+        [3, 1, 4, 0, 2])))
+
+    assert sorted([[row["trunc512"], row["ga4gh"]] for row in rows]) == \
+        [["t{}".format(n), "SQ.g{}".format(n)] for n in range(5)]
+
+def test_unmatched_loader_rows_raise(tmp_path):
+    with pytest.raises(Exception, match="1 sequences"):
+        list(iter_processed_rows(*write_csvs(tmp_path, range(3), [0, 2])))
+
+def test_missing_columns_raise(tmp_path):
+    loader_path, full_path = write_csvs(tmp_path, range(2), range(2))
+    with open(full_path, "w") as full_file:
+        full_file.write("ga4gh,md5\n")
+
+    with pytest.raises(Exception, match="trunc512"):
+        list(iter_processed_rows(loader_path, full_path))
+
+    with open(full_path, "w") as full_file:
+        full_file.write("")
+    with pytest.raises(Exception, match="no header row"):
+        list(iter_processed_rows(loader_path, full_path))
+
+def test_repeated_sequences_are_joined_once(tmp_path):
+    # repeats adjacent and apart, in either csv
+    rows = list(iter_processed_rows(*write_csvs(tmp_path,
+        [0, 1, 1, 2, 0, 3], [0, 1, 1, 2, 0, 3])))
+    assert [row["trunc512"] for row in rows] == ["t0", "t1", "t2", "t3"]
+
+    rows = list(iter_processed_rows(*write_csvs(tmp_path, [0, 1, 0, 2],
+        [1, 0, 2, 1, 0])))
+    assert sorted([row["trunc512"] for row in rows]) == ["t0", "t1", "t2"]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Tests of reconciling manifests with an S3 bucket mocked by moto"""
+
+import boto3
+import pytest
+from ga4gh.refget.loader.destinations.aws.s3 import reconcile as \
+    reconcile_module
+from ga4gh.refget.loader.destinations.aws.s3.reconcile import \
+    aws_s3_reconcile, get_list_prefix
+from ga4gh.refget.loader.destinations.aws.s3.upload import aws_s3_upload
+from ga4gh.refget.loader.manifest.reader import ManifestReader
+from ga4gh.refget.loader.manifest.writer import ManifestWriter
+
+def write_manifest(tmp_path, n_entries):
+    manifest_path = str(tmp_path / "AB000001.manifest.csv")
+    writer = ManifestWriter(manifest_path, "source.json", "destination.json")
+    writer.write_seq_header()
+    for n in range(n_entries):
+        seq_path = tmp_path / "seq{}".format(n)
+        json_path = tmp_path / "seq{}.json".format(n)
+        seq_path.write_bytes(b"ACGT" * (n + 1))
+        json_path.write_text('{"metadata": {}}\n')
+        writer.write_seq_entry({"completed": 1, "seq_path": str(seq_path),
+            "json_path": str(json_path), "ga4gh": "SQ.{:02x}g".format(n),
+            "trunc512": "{:02x}t".format(n), "md5": "{:02x}m".format(n)})
+    writer.write_additional_header()
+    csv_path = tmp_path / "full.csv"
+    csv_path.write_text("ga4gh\n")
+    writer.write_additional_entry(str(csv_path), "metadata/csv/full.csv")
+    writer.close()
+    return manifest_path
+
+def upload_manifest(s3_config, manifest_path):
+    reader = ManifestReader(manifest_path)
+    summary = aws_s3_upload(s3_config, reader.seq_table(),
+        reader.additional_table())
+    reader.close()
+    return summary
+
+def reconcile(s3_config, manifest_path, upload=False):
+    lines = []
+    summary = aws_s3_reconcile(s3_config, [manifest_path], upload=upload,
+        out=lines.append)
+    return [summary, lines]
+
+def test_get_list_prefix():
+    assert get_list_prefix("sequence/SQ.abcdef") == "sequence/SQ.ab"
+    assert get_list_prefix("sequence/0123abcd") == "sequence/01"
+    assert get_list_prefix("metadata/json/0123.json") == "metadata/json/01"
+
+@pytest.mark.parametrize("head_threshold", [1, 100])
+def test_reconcile_and_upload(s3_config, tmp_path, monkeypatch,
+    head_threshold):
+    # every expected object listed in bulk, or checked one by one
+    monkeypatch.setattr(reconcile_module, "HEAD_THRESHOLD", head_threshold)
+    manifest_path = write_manifest(tmp_path, 3)
+    assert upload_manifest(s3_config, manifest_path)["n_failed"] == 0
+
+    client = boto3.client("s3")
+    bucket_name = s3_config["bucket_name"]
+    # unrelated objects, sharing list prefixes with expected ones
+    for key in ["sequence/SQ.00x", "sequence/00x", "sequence/ffff"]:
+        client.put_object(Bucket=bucket_name, Key=key, Body=b"A")
+    summary, lines = reconcile(s3_config, manifest_path)
+    assert summary == {"n_expected": 3 * 6 + 1, "n_missing": 0,
+        "n_mismatched": 0}
+    assert lines == []
+
+    client.delete_object(Bucket=bucket_name, Key="sequence/SQ.01g")
+    client.delete_object(Bucket=bucket_name, Key="metadata/json/02m.json")
+    client.put_object(Bucket=bucket_name, Key="sequence/SQ.02g",
+        Body=b"ACG")
+    summary, lines = reconcile(s3_config, manifest_path)
+    assert [summary["n_missing"], summary["n_mismatched"]] == [2, 1]
+    assert lines == ["missing\tmetadata/json/02m.json",
+        "missing\tsequence/SQ.01g", "size_mismatch\tsequence/SQ.02g\t12\t3"]
+
+    summary, lines = reconcile(s3_config, manifest_path, upload=True)
+    assert [summary["upload"]["n_uploaded"], summary["upload"]["n_failed"]] \
+        == [3, 0]
+    body = client.get_object(Bucket=bucket_name,
+        Key="sequence/SQ.02g")["Body"].read()
+    assert body == b"ACGT" * 3
+    summary, lines = reconcile(s3_config, manifest_path)
+    assert [summary["n_missing"], summary["n_mismatched"], lines] == \
+        [0, 0, []]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Tests of classifying, pacing and retrying S3 requests"""
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from ga4gh.refget.loader.destinations.aws.s3.scheduler import UploadScheduler
+
+def client_error(code, http_status):
+    return ClientError({"Error": {"Code": code, "Message": code},
+        "ResponseMetadata": {"HTTPStatusCode": http_status}}, "PutObject")
+
+def test_classify():
+    scheduler = UploadScheduler(4)
+
+    for error in [client_error("SlowDown", 503),
+        client_error("Unknown", 503), client_error("Throttling", 400)]:
+        assert scheduler.classify(error) == UploadScheduler.THROTTLED
+    for error in [client_error("InternalError", 500),
+        client_error("Unknown", 502),
+        EndpointConnectionError(endpoint_url="http://bucket")]:
+        assert scheduler.classify(error) == UploadScheduler.RETRYABLE
+    for error in [client_error("AccessDenied", 403),
+        FileNotFoundError("seq")]:
+        assert scheduler.classify(error) == UploadScheduler.FATAL
+
+def test_one_decrease_per_congestion_epoch():
+    scheduler = UploadScheduler(8)
+    epochs = [scheduler.acquire() for i in range(6)]
+
+    # requests sent under the old limit are throttled together, but the
+    # limit is only halved once
+    for epoch in epochs[:3]:
+        scheduler.release(epoch, UploadScheduler.THROTTLED)
+    assert [scheduler.limit, scheduler.epoch] == [4.0, 1]
+
+    # requests acquired after the decrease can decrease it again
+    epoch = scheduler.acquire()
+    scheduler.release(epoch, UploadScheduler.THROTTLED)
+    assert [scheduler.limit, scheduler.epoch] == [2.0, 2]
+
+    # additive increase, by 1/limit per success
+    expected = 2.0
+    for epoch in epochs[3:]:
+        scheduler.release(epoch, UploadScheduler.SUCCESS)
+        expected += 1 / expected
+        assert scheduler.limit == pytest.approx(expected)
+    assert scheduler.in_flight == 0
+
+def test_limit_stays_within_bounds():
+    scheduler = UploadScheduler(4, min_concurrency=2)
+    for i in range(3):
+        scheduler.release(scheduler.acquire(), UploadScheduler.THROTTLED)
+    assert scheduler.limit == 2.0
+    for i in range(20):
+        scheduler.release(scheduler.acquire(), UploadScheduler.SUCCESS)
+    assert scheduler.limit == 4.0
+
+def test_retries_until_attempts_are_exhausted():
+    scheduler = UploadScheduler(2, max_attempts=3, base_delay=0.001)
+    attempts = []
+
+    def failing(error):
+        attempts.append(error)
+        raise error
+
+    with pytest.raises(ClientError):
+        scheduler.call(failing, client_error("SlowDown", 503))
+    assert len(attempts) == 3
+
+    # fatal errors are not retried
+    attempts = []
+    with pytest.raises(ClientError):
+        scheduler.call(failing, client_error("AccessDenied", 403))
+    assert len(attempts) == 1
+
+    # a request succeeding on a later attempt returns its response
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise client_error("InternalError", 500)
+        return "response"
+
+    assert scheduler.call(flaky) == "response"
+    assert len(attempts) == 3
+    assert scheduler.in_flight == 0
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Tests of pausing processing while too many bytes are staged for upload"""
+
+import json
+import os
+import time
+import pytest
+from ga4gh.refget.loader.sources.ena.assembly.utils.executors import \
+    LocalExecutor
+from ga4gh.refget.loader.sources.ena.assembly.utils.staging_manager import \
+    StagingManager, is_cleanup_enabled, remove_staged_outputs
+
+def stage_flatfile(processing_dir, flatfile_id, n_bytes, date="2020/01/01"):
+    subdir = processing_dir / date / "files" / flatfile_id[:2] / flatfile_id
+    for name in ["sequence", "logs"]:
+        (subdir / name).mkdir(parents=True, exist_ok=True)
+    (subdir / "sequence" / "seq").write_bytes(b"A" * n_bytes)
+    (subdir / "logs" / "manifest.tsv").write_text("manifest\n")
+    return subdir
+
+def is_paused(staging):
+    # wait out the poll interval, so that staged bytes are measured again
+    time.sleep(staging.poll_interval)
+    return staging.is_paused()
+
+def test_staged_bytes_exclude_kept_outputs(tmp_path):
+    stage_flatfile(tmp_path, "AB000001", 100)
+    stage_flatfile(tmp_path, "CD000001", 50)
+
+    staging = StagingManager(str(tmp_path), 1000)
+    assert staging.get_staged_bytes() == 150
+    assert StagingManager(str(tmp_path / "none"), 1000) \
+        .get_staged_bytes() == 0
+
+def test_staged_bytes_of_every_date(tmp_path):
+    stage_flatfile(tmp_path, "AB000001", 60, date="2020/01/01")
+    stage_flatfile(tmp_path, "AB000002", 60, date="2020/01/02")
+    (tmp_path / "2020" / "01" / "02" / "accessions_list.txt").write_text("")
+
+    # one date alone is below the mark, but both dates are above it
+    staging = StagingManager(str(tmp_path), 100, poll_interval=0.01)
+    assert staging.get_staged_bytes() == 120
+    assert is_paused(staging)
+
+def test_pause_and_resume_with_hysteresis(tmp_path):
+    first = stage_flatfile(tmp_path, "AB000001", 60)
+    staging = StagingManager(str(tmp_path), 100, low_water_bytes=50,
+        poll_interval=0.01)
+    assert not is_paused(staging)
+
+    second = stage_flatfile(tmp_path, "AB000002", 60)
+    assert is_paused(staging)
+
+    # 60 staged is below the high-water mark, but above the low-water mark
+    remove_staged_outputs(str(second / "logs" / "manifest.tsv"))
+    assert is_paused(staging)
+
+    assert remove_staged_outputs(str(first / "logs" / "manifest.tsv")) == 60
+    assert not is_paused(staging)
+    assert (first / "logs" / "manifest.tsv").exists()
+    assert not (first / "sequence").exists()
+
+def test_stalled_pause_ends(tmp_path):
+    stage_flatfile(tmp_path, "AB000001", 200)
+    staging = StagingManager(str(tmp_path), 100, poll_interval=0.001,
+        stall_timeout=0.05)
+
+    assert staging.is_paused()
+    staging.wait()
+    assert not staging.is_paused()
+
+def test_from_config(tmp_path):
+    config_obj = {"processing_dir": str(tmp_path)}
+
+    assert StagingManager.from_config(config_obj) is None
+    staging = StagingManager.from_config(dict(config_obj,
+        staging_high_water_bytes=1000, staging_cleanup=True))
+    assert staging.staging_dir == str(tmp_path)
+    assert staging.low_water_bytes == 800
+
+    for invalid in [{"staging_high_water_bytes": 1000},
+        {"staging_high_water_bytes": 1000, "staging_cleanup": True,
+            "staging_low_water_bytes": 2000},
+        {"staging_high_water_bytes": 1000, "staging_cleanup": True,
+            "submission_mode": "array"},
+        {"staging_cleanup": True,
+            "content_store_dir": str(tmp_path / "store")}]:
+        with pytest.raises(Exception):
+            StagingManager.from_config(dict(config_obj, **invalid))
+
+def test_is_cleanup_enabled(tmp_path):
+    config_path = tmp_path / "source.json"
+
+    config_path.write_text(json.dumps({"staging_cleanup": True}))
+    assert is_cleanup_enabled(str(config_path))
+    config_path.write_text(json.dumps({"staging_cleanup": True,
+        "content_store_dir": str(tmp_path / "store")}))
+    assert not is_cleanup_enabled(str(config_path))
+    assert not is_cleanup_enabled(str(tmp_path / "missing.json"))
+
+def test_local_executor_holds_back_processing(tmp_path):
+    staged = stage_flatfile(tmp_path, "AB000001", 200)
+    staging = StagingManager(str(tmp_path), 100, poll_interval=0.01)
+    executor = LocalExecutor(max_workers=2, staging=staging)
+    events_path = tmp_path / "events"
+
+    # a flatfile whose upload drains the staged bytes, and another submitted
+    # while the first is in its manifest stage
+    scripts = {
+        "draining": {
+            "process": "",
+            "manifest": "sleep 0.3\n",
+            "upload": "echo drained >> {} && rm -r {}/sequence\n".format(
+                events_path, staged)
+        },
+        "held": {
+            "process": "echo processed >> {}\n".format(events_path),
+            "manifest": "",
+            "upload": ""
+        }
+    }
+    for job_id in ["draining", "held"]:
+        cmd_dir = tmp_path / job_id
+        cmd_dir.mkdir()
+        for stage, script in scripts[job_id].items():
+            (cmd_dir / (stage + ".sh")).write_text(script)
+        executor.submit(job_id, str(cmd_dir), str(cmd_dir))
+        time.sleep(0.1)
+    results = executor.finish()
+
+    assert results == {"draining": ["Completed", "None"],
+        "held": ["Completed", "None"]}
+    assert events_path.read_text().splitlines() == ["drained", "processed"]
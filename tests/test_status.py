@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Tests of summarizing job statuses, and the status command"""
+
+from click.testing import CliRunner
+from ga4gh.refget.loader.cli.entrypoint import main
+from ga4gh.refget.loader.store.status_store import StatusStore
+
+JOBS = [
+    ["2020-01-01", "upload", "Completed", "None"],
+    ["2020-01-01", "upload", "Completed", "None"],
+    ["2020-01-01", "process", "Failed", "processing failed: truncated"],
+    ["2020-01-01", "upload", "Failed", "3 objects failed to upload"],
+    ["2020-01-02", "process", "Failed", "processing failed: truncated"],
+    ["2020-01-02", "process", "Failed", "processing failed: truncated"],
+    ["2020-01-02", "manifest", "InProgress", "None"]
+]
+
+def seed_status_store(tmp_path):
+    db_path = str(tmp_path / "status.db")
+    status_store = StatusStore(db_path)
+    for n, [date, stage, state, message] in enumerate(JOBS):
+        status_store.update("job{}".format(n), {"date": date, "stage": stage,
+            "status": state, "message": message})
+    return [db_path, status_store]
+
+def test_summarize(tmp_path):
+    db_path, status_store = seed_status_store(tmp_path)
+
+    assert status_store.summarize() == [
+        ["2020-01-01", "Completed", "upload", 2],
+        ["2020-01-01", "Failed", "process", 1],
+        ["2020-01-01", "Failed", "upload", 1],
+        ["2020-01-02", "Failed", "process", 2],
+        ["2020-01-02", "InProgress", "manifest", 1]]
+    assert status_store.summarize("2020-01-02") == [
+        ["2020-01-02", "Failed", "process", 2],
+        ["2020-01-02", "InProgress", "manifest", 1]]
+    assert status_store.summarize("2020-01-03") == []
+    status_store.close()
+
+def test_failures(tmp_path):
+    db_path, status_store = seed_status_store(tmp_path)
+
+    # grouped by message, most common first
+    assert status_store.failures() == [
+        ["processing failed: truncated", "process", 3],
+        ["3 objects failed to upload", "upload", 1]]
+    assert status_store.failures("2020-01-01") == [
+        ["3 objects failed to upload", "upload", 1],
+        ["processing failed: truncated", "process", 1]]
+    status_store.close()
+
+def test_status_command(tmp_path):
+    db_path, status_store = seed_status_store(tmp_path)
+    status_store.close()
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["status", "--db", db_path, "--date",
+        "2020-01-02"])
+    assert result.output.splitlines() == ["date\tstatus\tstage\tcount",
+        "2020-01-02\tFailed\tprocess\t2",
+        "2020-01-02\tInProgress\tmanifest\t1"]
+
+    result = runner.invoke(main, ["status", "--db", db_path, "--failures"])
+    assert result.output.splitlines() == ["count\tstage\tmessage",
+        "3\tprocess\tprocessing failed: truncated",
+        "1\tupload\t3 objects failed to upload"]
+
+    result = runner.invoke(main, ["status", "--db",
+        str(tmp_path / "missing.db")])
+    assert result.output.startswith("status database not found")
+    result = runner.invoke(main, ["status"])
+    assert "required" in result.output
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Tests of in-process uploads to S3, against a bucket mocked by moto"""
+
+import os
+import threading
+import time
+import boto3
+from botocore.exceptions import ClientError
+from ga4gh.refget.loader.config.constants import Status
+from ga4gh.refget.loader.destinations.aws.s3.engine import S3UploadEngine
+from ga4gh.refget.loader.destinations.aws.s3.upload import aws_s3_upload
+from ga4gh.refget.loader.manifest.journal import UploadJournal
+
+SEQ_HEADER = "completed\tseq_path\tjson_path\tga4gh\ttrunc512\tmd5"
+ADDITIONAL_HEADER = "source\tdestination"
+
+def write_manifest_tables(tmp_path, n_entries):
+    seq_table = [SEQ_HEADER]
+    for n in range(n_entries):
+        seq_path = tmp_path / "seq{}".format(n)
+        json_path = tmp_path / "seq{}.json".format(n)
+        seq_path.write_bytes(b"ACGT" * (n + 1))
+        json_path.write_text('{"metadata": {}}\n')
+        seq_table.append("\t".join(["1", str(seq_path), str(json_path),
+            "SQ.ga4gh{}".format(n), "trunc{}".format(n), "md5{}".format(n)]))
+    csv_path = tmp_path / "full.csv"
+    csv_path.write_text("ga4gh\n")
+    additional_table = [ADDITIONAL_HEADER,
+        "\t".join([str(csv_path), "metadata/csv/full.csv"])]
+    return [seq_table, additional_table]
+
+def list_keys(bucket_name):
+    client = boto3.client("s3")
+    response = client.list_objects_v2(Bucket=bucket_name)
+    return sorted([o["Key"] for o in response.get("Contents", [])])
+
+def test_upload_sequences_and_redirects(s3_config, tmp_path):
+    seq_table, additional_table = write_manifest_tables(tmp_path, 3)
+
+    summary = aws_s3_upload(s3_config, seq_table, additional_table)
+
+    # sequence and metadata by primary id, two redirects each by secondary
+    assert summary["n_uploaded"] == 3 * 6 + 1
+    assert summary["n_failed"] == 0
+    keys = list_keys(s3_config["bucket_name"])
+    assert "sequence/SQ.ga4gh0" in keys
+    assert "metadata/json/md51.json" in keys
+    assert "metadata/csv/full.csv" in keys
+
+    client = boto3.client("s3")
+    body = client.get_object(Bucket=s3_config["bucket_name"],
+        Key="sequence/SQ.ga4gh2")["Body"].read()
+    assert body == b"ACGT" * 3
+    redirect = client.head_object(Bucket=s3_config["bucket_name"],
+        Key="sequence/trunc2")
+    assert redirect["WebsiteRedirectLocation"] == "/sequence/SQ.ga4gh2"
+
+def test_resume_skips_journaled_objects(s3_config, tmp_path):
+    seq_table, additional_table = write_manifest_tables(tmp_path, 2)
+    manifest_path = str(tmp_path / "manifest.tsv")
+
+    journal = UploadJournal.for_manifest(manifest_path)
+    first = aws_s3_upload(s3_config, seq_table, additional_table,
+        journal=journal)
+    journal.close()
+    assert first["n_uploaded"] == 2 * 6 + 1
+
+    # a changed file is uploaded again, everything else is skipped
+    (tmp_path / "seq1").write_bytes(b"ACGTACGTAC")
+    journal = UploadJournal.for_manifest(manifest_path)
+    second = aws_s3_upload(s3_config, seq_table, additional_table,
+        journal=journal)
+    journal.close()
+    assert second["n_uploaded"] == 1
+    assert journal.n_skipped == 2 * 6
+
+    # without resume, the journal is truncated and all objects uploaded
+    journal = UploadJournal.for_manifest(manifest_path, resume=False)
+    third = aws_s3_upload(s3_config, seq_table, additional_table,
+        journal=journal)
+    journal.close()
+    assert third["n_uploaded"] == 2 * 6 + 1
+
+def test_resume_after_partial_upload(s3_config, tmp_path):
+    seq_table, additional_table = write_manifest_tables(tmp_path, 3)
+    manifest_path = str(tmp_path / "manifest.tsv")
+
+    # the first run is interrupted after the first sequence, while writing
+    # the journal line of the second
+    journal = UploadJournal.for_manifest(manifest_path)
+    first = aws_s3_upload(s3_config, seq_table[:2], additional_table,
+        journal=journal)
+    journal.close()
+    assert first["n_uploaded"] == 6 + 1
+    with open(journal.journal_path, "a") as journal_file:
+        journal_file.write("sequence/SQ.ga4gh1\t8")
+
+    journal = UploadJournal.for_manifest(manifest_path)
+    assert len(journal.completed) == 6 + 1
+    second = aws_s3_upload(s3_config, seq_table, additional_table,
+        journal=journal)
+    journal.close()
+    assert second["n_uploaded"] == 2 * 6
+    assert second["n_failed"] == 0
+    assert journal.n_skipped == 6 + 1
+    assert len(list_keys(s3_config["bucket_name"])) == 3 * 6 + 1
+
+    # the partial line was dropped, new entries start on their own lines
+    lines = open(journal.journal_path).read().splitlines()
+    assert len(lines) == 3 * 6 + 1
+    assert all([len(line.split("\t")) == 3 for line in lines])
+
+def test_failed_objects_are_reported_and_not_journaled(s3_config, tmp_path):
+    seq_table, additional_table = write_manifest_tables(tmp_path, 2)
+    os.remove(str(tmp_path / "seq0"))
+    manifest_path = str(tmp_path / "manifest.tsv")
+
+    journal = UploadJournal.for_manifest(manifest_path)
+    summary = aws_s3_upload(s3_config, seq_table, additional_table,
+        journal=journal)
+    journal.close()
+
+    assert summary["n_failed"] == 1
+    assert summary["n_uploaded"] == 2 * 6
+    assert summary["failures"][0]["key"] == "sequence/SQ.ga4gh0"
+    assert summary["failures"][0]["status"] == Status.FAILURE
+    assert "sequence/SQ.ga4gh0" not in list_keys(s3_config["bucket_name"])
+    assert "sequence/SQ.ga4gh0" not in \
+        UploadJournal.for_manifest(manifest_path).completed
+
+def test_failed_callbacks_do_not_stop_workers(s3_config):
+    # more tasks than the queue holds, so that the producer would block if
+    # workers exited early
+    engine = S3UploadEngine(dict(s3_config, max_concurrency=2))
+    tasks = [{"key": "sequence/k{}".format(n), "redirect": "/sequence/x"}
+        for n in range(engine.queue_size * 3)]
+    tasks.append({"key": "sequence/neither-file-nor-redirect"})
+
+    def callback(task, result):
+        raise RuntimeError("journal write failed")
+
+    summaries = []
+    thread = threading.Thread(target=lambda: summaries.append(
+        engine.upload_all(iter(tasks), callback=callback)), daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    engine.close()
+
+    assert not thread.is_alive()
+    assert summaries[0]["n_uploaded"] == 0
+    assert summaries[0]["n_failed"] == len(tasks)
+
+def test_multipart_upload(s3_config, tmp_path):
+    file_path = tmp_path / "large"
+    file_path.write_bytes(os.urandom(11 * 1024 * 1024))
+    engine = S3UploadEngine(dict(s3_config,
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024))
+
+    result = engine.put_object({"key": "sequence/large",
+        "file_path": str(file_path)})
+    engine.close()
+
+    assert result["status"] == Status.SUCCESS
+    assert result["etag"].endswith("-3")
+    body = boto3.client("s3").get_object(Bucket=s3_config["bucket_name"],
+        Key="sequence/large")["Body"].read()
+    assert body == file_path.read_bytes()
+
+def test_failed_multipart_upload_is_aborted_after_parts(s3_config, tmp_path):
+    file_path = tmp_path / "large"
+    file_path.write_bytes(os.urandom(16 * 1024 * 1024))
+    engine = S3UploadEngine(dict(s3_config,
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024,
+        multipart_concurrency=2))
+
+    # the first part fails at once, while the others are still uploading
+    events = []
+    upload_part = engine.client.upload_part
+    abort_multipart_upload = engine.client.abort_multipart_upload
+
+    def failing_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 1:
+            raise ClientError({"Error": {"Code": "AccessDenied",
+                "Message": "denied"}}, "UploadPart")
+        time.sleep(0.2)
+        try:
+            return upload_part(**kwargs)
+        finally:
+            events.append("part")
+
+    def recording_abort(**kwargs):
+        events.append("abort")
+        return abort_multipart_upload(**kwargs)
+
+    engine.client.upload_part = failing_upload_part
+    engine.client.abort_multipart_upload = recording_abort
+    result = engine.put_object({"key": "sequence/large",
+        "file_path": str(file_path)})
+    engine.close()
+
+    assert result["status"] == Status.FAILURE
+    assert events[-1] == "abort"
+    assert "sequence/large" not in list_keys(s3_config["bucket_name"])
+    uploads = boto3.client("s3").list_multipart_uploads(
+        Bucket=s3_config["bucket_name"])
+    assert not uploads.get("Uploads")